@@ -0,0 +1,263 @@
+import asyncio
+import json
+import math
+import os
+import random
+import re
+from collections import Counter, deque
+from typing import Dict, List, Optional, Tuple
+from app.config import DATA_DIR, FAST_PATH_ENABLED, FAST_PATH_THRESHOLD, FAST_PATH_MAX_EXAMPLES
+from app.services.metrics import FAST_PATH_CLASSIFICATIONS
+import logging
+
+logger = logging.getLogger(__name__)
+
+NOTE_ID = r"\d{8}_\d{6}(?:_\d{6}_[0-9a-f]{6})?"
+NOT_RELEVANT = "none"
+MIN_TRAINING_EXAMPLES = 50
+RETRAIN_EVERY = 100
+
+# (intent, confidence, pattern); the first matching rule wins
+RULES = [
+    ("delete", 0.98, re.compile(rf"^(?:please\s+)?(?:delete|remove)\s+(?:the\s+)?note\s+(?:id\s+)?(?P<note_id>{NOTE_ID})\s*[.!]?$", re.I)),
+    ("update", 0.9, re.compile(rf"^(?:please\s+)?tag\s+note\s+(?P<note_id>{NOTE_ID})\s+(?:with|as)\s+(?P<add_tags>.+)$", re.I)),
+    ("update", 0.9, re.compile(rf"^(?:please\s+)?(?:update|edit|change)\s+note\s+(?P<note_id>{NOTE_ID})\s*(?:to|with|:)\s*(?P<content>.+)$", re.I | re.S)),
+    ("merge", 0.98, re.compile(rf"^(?:please\s+)?merge\s+note\s+(?P<note_id>{NOTE_ID})\s+(?:into|with)\s+(?:note\s+)?(?P<target_note_id>{NOTE_ID})\s*[.!]?$", re.I)),
+    ("merge", 0.98, re.compile(rf"^(?:please\s+)?(?P<replace>replace)\s+note\s+(?P<target_note_id>{NOTE_ID})\s+with\s+(?:note\s+)?(?P<note_id>{NOTE_ID})\s*[.!]?$", re.I)),
+    ("save", 0.95, re.compile(r"^(?:please\s+)?(?:save|store|remember)(?:\s+this)?(?:\s+as\s+a)?(?:\s+note)?\s*:\s*(?P<content>.+)$", re.I | re.S)),
+    ("query", 0.9, re.compile(r"^(?:please\s+)?(?:find|search|search for|look up|show me)\s+(?:my\s+)?notes?\s+(?:about|on|for|mentioning)\s+(?P<search_query>.+?)[?.!]?$", re.I)),
+    ("query", 0.9, re.compile(r"^(?:please\s+)?(?:list|show)(?:\s+me)?\s+(?:all\s+)?(?:of\s+)?my\s+notes[?.!]?$", re.I)),
+]
+HASHTAG = re.compile(r"#(\w+)")
+TOKEN = re.compile(r"\w+")
+
+
+def _features(text: str) -> Dict[str, int]:
+    tokens = TOKEN.findall(text.lower())
+    features = Counter(tokens)
+    features.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    return features
+
+
+def _title_from_content(content: str) -> str:
+    first_line = content.strip().split("\n", 1)[0]
+    return first_line if len(first_line) <= 60 else first_line[:57].rstrip() + "..."
+
+
+class IntentModel:
+    """TF-IDF features with a multinomial logistic regression, trained on logged examples"""
+
+    def __init__(self, labels: List[str], idf: Dict[str, float],
+                 weights: Dict[str, Dict[str, float]], bias: Dict[str, float]):
+        self.labels = labels
+        self.idf = idf
+        self.weights = weights
+        self.bias = bias
+
+    @staticmethod
+    def _vectorize(text: str, idf: Dict[str, float]) -> Dict[str, float]:
+        vector = {f: (1 + math.log(tf)) * idf[f] for f, tf in _features(text).items() if f in idf}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {f: v / norm for f, v in vector.items()}
+
+    @classmethod
+    def train(cls, examples: List[Tuple[str, str]], epochs: int = 20, learning_rate: float = 0.5,
+              l2: float = 1e-4) -> "IntentModel":
+        document_frequency = Counter()
+        for text, _ in examples:
+            document_frequency.update(set(_features(text)))
+        idf = {f: math.log((1 + len(examples)) / (1 + df)) + 1 for f, df in document_frequency.items()}
+
+        labels = sorted({label for _, label in examples})
+        weights = {label: {} for label in labels}
+        bias = {label: 0.0 for label in labels}
+        model = cls(labels, idf, weights, bias)
+
+        data = [(cls._vectorize(text, idf), label) for text, label in examples]
+        rng = random.Random(0)
+        for _ in range(epochs):
+            rng.shuffle(data)
+            for vector, target in data:
+                probabilities = model._probabilities(vector)
+                for label in labels:
+                    gradient = probabilities[label] - (1.0 if label == target else 0.0)
+                    label_weights = weights[label]
+                    for feature, value in vector.items():
+                        w = label_weights.get(feature, 0.0)
+                        label_weights[feature] = w - learning_rate * (gradient * value + l2 * w)
+                    bias[label] -= learning_rate * gradient
+        return model
+
+    def _probabilities(self, vector: Dict[str, float]) -> Dict[str, float]:
+        scores = {
+            label: self.bias[label] + sum(self.weights[label].get(f, 0.0) * v for f, v in vector.items())
+            for label in self.labels
+        }
+        top = max(scores.values())
+        exp_scores = {label: math.exp(score - top) for label, score in scores.items()}
+        total = sum(exp_scores.values())
+        return {label: value / total for label, value in exp_scores.items()}
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        probabilities = self._probabilities(self._vectorize(text, self.idf))
+        label = max(probabilities, key=probabilities.get)
+        return label, probabilities[label]
+
+
+class FastPathClassifier:
+    """Classify unambiguous messages locally so they can skip the LLM.
+
+    Pattern rules recognise explicit commands and produce the same intent
+    dict as ``NLPAgent.classify_message``. A small model trained on messages
+    the LLM has already classified recognises small talk. Results below
+    ``threshold`` confidence return None and the caller falls back to the LLM.
+    """
+
+    def __init__(self, examples_path: str, threshold: float = FAST_PATH_THRESHOLD,
+                 enabled: bool = FAST_PATH_ENABLED, max_examples: int = FAST_PATH_MAX_EXAMPLES):
+        self.examples_path = examples_path
+        self.threshold = threshold
+        self.enabled = enabled
+        self.max_examples = max_examples
+        self._logged: Optional[int] = None  # Lines in the examples log, counted on the first append
+        self.model: Optional[IntentModel] = None
+        self.total = 0
+        self.hits = Counter()
+        self._new_examples = 0
+        self._train_task: Optional[asyncio.Task] = None
+        self._loaded = False
+
+    def _result(self, intent: Optional[str], confidence: float, **fields) -> dict:
+        # "tags" is only present when the message names tags, so an update leaves the note's tags alone
+        return {
+            "relevant": intent is not None,
+            "reason": "Matched locally",
+            "intent": intent,
+            "title": None,
+            "content": None,
+            "search_query": None,
+            "note_id": None,
+            "confirmation_needed": False,
+            "confidence": confidence,
+            **fields,
+        }
+
+    def _match_rules(self, message: str) -> Optional[dict]:
+        for intent, confidence, pattern in RULES:
+            match = pattern.match(message.strip())
+            if not match:
+                continue
+            fields = {k: v.strip() for k, v in match.groupdict().items() if v}
+            if "replace" in fields:
+                fields["replace"] = True
+            if "add_tags" in fields:
+                fields["add_tags"] = [t.strip(" #") for t in re.split(r",|\band\b", fields["add_tags"]) if t.strip(" #")]
+            if intent == "save":
+                fields["title"] = _title_from_content(fields["content"])
+                fields["tags"] = HASHTAG.findall(fields["content"])
+            return self._result(intent, confidence, **fields)
+        return None
+
+    def classify(self, message: str) -> Optional[dict]:
+        """Return an intent dict for confidently recognised messages, otherwise None"""
+        if not self.enabled:
+            return None
+        self.total += 1
+
+        result = self._match_rules(message)
+        if result is not None and result["confidence"] >= self.threshold:
+            self._count("rules")
+            return result
+
+        if self.model is not None:
+            label, confidence = self.model.predict(message)
+            # The model only decides relevance; task intents still need the LLM to extract fields
+            if label == NOT_RELEVANT and confidence >= self.threshold:
+                self._count("model")
+                return self._result(None, confidence)
+        FAST_PATH_CLASSIFICATIONS.labels("llm").inc()
+        return None
+
+    def _count(self, outcome: str):
+        self.hits[outcome] += 1
+        FAST_PATH_CLASSIFICATIONS.labels(outcome).inc()
+
+    def stats(self) -> dict:
+        hits = sum(self.hits.values())
+        return {
+            "messages": self.total,
+            "rule_hits": self.hits["rules"],
+            "model_hits": self.hits["model"],
+            "hit_rate": hits / self.total if self.total else 0.0,
+            "model_trained": self.model is not None,
+        }
+
+    def _read_examples(self) -> List[Tuple[str, str]]:
+        """The most recent ``max_examples`` logged examples, which bounds the cost of each retrain"""
+        if not os.path.exists(self.examples_path):
+            return []
+        examples = deque(maxlen=self.max_examples)
+        with open(self.examples_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    examples.append((entry["text"], entry["label"]))
+                except (ValueError, KeyError):
+                    continue
+        return list(examples)
+
+    def _train(self):
+        examples = self._read_examples()
+        if len(examples) < MIN_TRAINING_EXAMPLES or len({label for _, label in examples}) < 2:
+            return
+        self.model = IntentModel.train(examples)
+        logger.info(f"Trained fast-path model on {len(examples)} examples")
+
+    def _append_example(self, text: str, label: str):
+        os.makedirs(os.path.dirname(self.examples_path), exist_ok=True)
+        if self._logged is None:
+            self._logged = 0
+            if os.path.exists(self.examples_path):
+                with open(self.examples_path, 'rb') as f:
+                    self._logged = sum(1 for _ in f)
+        with open(self.examples_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({"text": text, "label": label}) + "\n")
+        self._logged += 1
+        # Trimmed back to the newest max_examples once it doubles, so user messages are not kept forever
+        if self._logged > 2 * self.max_examples:
+            self._trim_examples()
+
+    def _trim_examples(self):
+        with open(self.examples_path, 'r', encoding='utf-8') as f:
+            recent = deque(f, maxlen=self.max_examples)
+        tmp_path = f"{self.examples_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(recent)
+        os.replace(tmp_path, self.examples_path)
+        self._logged = len(recent)
+
+    async def _retrain(self):
+        try:
+            await asyncio.to_thread(self._train)
+        except Exception as e:
+            logger.error(f"Error training fast-path model: {e}")
+
+    async def load(self):
+        """Train the model from previously logged examples"""
+        if self.enabled and not self._loaded:
+            self._loaded = True
+            await self._retrain()
+
+    async def record_example(self, message: str, intent: Optional[str]):
+        """Log a message the LLM classified, retraining after enough new examples"""
+        if not self.enabled:
+            return
+        await asyncio.to_thread(self._append_example, message, intent or NOT_RELEVANT)
+        self._new_examples += 1
+        if self._new_examples >= RETRAIN_EVERY and (self._train_task is None or self._train_task.done()):
+            self._new_examples = 0
+            # Train in the background so the current reply is not delayed
+            self._train_task = asyncio.create_task(self._retrain())
+
+
+fast_path_classifier = FastPathClassifier(os.path.join(DATA_DIR, "fast_path", "examples.jsonl"))
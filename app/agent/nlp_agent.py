@@ -1,9 +1,13 @@
 from datetime import datetime
-from litellm import acompletion
+from typing import List, Optional
+from pydantic import ValidationError
 from app.utils.helpers import format_conversation_history
-from app.config import OPENAI_API_KEY, OPENAI_MODEL
+from app.config import HISTORY_TOKEN_BUDGETS
+from app.api.models import MessageClassification
+from app.services.llm import chat_completion, is_json
 import json
 import logging
+import re
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,10 +22,15 @@ class NLPAgent:
             - intent: The user's intent (save, update, delete, query)
             - title: The title/name of the note or document (if applicable)
             - content: The content to save or update (if applicable)
-            - tags: List of relevant tags for categorizing the content
+            - tags: List of relevant tags for categorizing the content. Prefer these existing tags when they fit: {existing_tags}
             - search_query: The search terms when querying (if applicable)
+            - search_mode: How to match the search terms: "keyword" for exact words, names or ids, "semantic" for topics described in other words, "hybrid" for both, or null for the default
+            - since: Earliest date (YYYY-MM-DD) of the notes asked about, when the query names a time period (e.g. "last week"), otherwise null
+            - until: Latest date (YYYY-MM-DD) of the notes asked about, when the query names a time period, otherwise null
             - confirmation_needed: Whether user confirmation is needed (true/false)
 
+            Today is {current_date}.
+
             Here is the conversation history:
             {conversation_history}
 
@@ -29,6 +38,37 @@ class NLPAgent:
 
             JSON:
         """
+
+        self.classify_prompt = """
+            You are an intelligent assistant helping users manage their Second Brain - a personal knowledge management system.
+            Decide whether the user's most recent message is a Second Brain task and, if it is, what should be done.
+
+            Second Brain tasks include saving, updating, deleting, merging, querying and organizing (tagging) notes.
+            Greetings, small talk and unrelated requests are not relevant.
+
+            Return a single JSON object with the following fields:
+            - relevant: true if the message is a Second Brain task, otherwise false
+            - reason: A short explanation of why it's relevant or not
+            - intent: The user's intent (save, update, delete, merge, query), or null if not relevant
+            - title: The title/name of the note or document (if applicable)
+            - content: The content to save or update (if applicable)
+            - tags: List of relevant tags for categorizing the content. Prefer these existing tags when they fit: {existing_tags}
+            - search_query: The search terms when querying (if applicable)
+            - search_mode: How to match the search terms: "keyword" for exact words, names or ids, "semantic" for topics described in other words, "hybrid" for both, or null for the default
+            - since: Earliest date (YYYY-MM-DD) of the notes asked about, when the query names a time period (e.g. "last week"), otherwise null
+            - until: Latest date (YYYY-MM-DD) of the notes asked about, when the query names a time period, otherwise null
+            - note_id: The id of the note to update or delete, or to merge into another note (if applicable)
+            - target_note_id: The id of the note to merge into (for merge)
+            - replace: true if the merged note's content should replace the target's rather than be added to it (for merge)
+            - confirmation_needed: Whether user confirmation is needed (true/false)
+
+            Today is {current_date}.
+
+            Here is the conversation history:
+            {conversation_history}
+
+            JSON:
+        """
         
     async def check_relevancy(self, user_message: str, history: list) -> dict:
         """Check if the user message is relevant to Second Brain tasks."""
@@ -51,47 +91,51 @@ class NLPAgent:
         JSON Response:
         '''
 
-        formatted_history = format_conversation_history(history)
+        formatted_history = format_conversation_history(history, max_tokens=HISTORY_TOKEN_BUDGETS.get("relevancy"))
         
         try:
-            response = await acompletion(
-                model=OPENAI_MODEL,
-                api_key=OPENAI_API_KEY,
+            relevancy_result = await chat_completion(
+                "relevancy",
                 messages=[
                     {"role": "system", "content": system_prompt.format(conversation_history=formatted_history)},
                     {"role": "user", "content": f"User message: {user_message}"}
-                ]
+                ],
+                cache_if=is_json
             )
-
-            relevancy_result = response["choices"][0]["message"]["content"]
             return json.loads(relevancy_result)
         except Exception as e:
             logger.error(f"Error checking relevancy: {e}")
-            return {"relevant": False, "reason": "Failed to process response"}
+            return {"relevant": False, "reason": "Failed to process response", "error": str(e)}
+
+    @staticmethod
+    def _format_tags(existing_tags: Optional[List[str]]) -> str:
+        return ", ".join(existing_tags) if existing_tags else "(none yet)"
 
-    async def extract_intent(self, user_message, conversation_history):
+    async def extract_intent(self, user_message, conversation_history, existing_tags: Optional[List[str]] = None):
         """Process user message and extract Second Brain intent and details"""
         try:
-            formatted_history = format_conversation_history(conversation_history)
-            current_datetime = datetime.now().strftime("%Y-%m-%d %H:%M")
+            formatted_history = format_conversation_history(
+                conversation_history, max_tokens=HISTORY_TOKEN_BUDGETS.get("intent")
+            )
+            # Day resolution, so cached answers stay valid for the day
+            current_datetime = datetime.now().strftime("%Y-%m-%d (%A)")
 
             system_message = self.system_prompt.format(
                 conversation_history=formatted_history,
-                current_date=current_datetime
+                current_date=current_datetime,
+                existing_tags=self._format_tags(existing_tags)
             )
 
-            response = await acompletion(
-                model=OPENAI_MODEL,
-                api_key=OPENAI_API_KEY,
+            result = await chat_completion(
+                "intent",
                 messages=[
                     {"role": "system", "content": system_message},
                     {"role": "user", "content": user_message}
                 ],
+                cache_if=is_json,
                 max_tokens=500,
                 response_format={"type": "json_object"}
             )
-
-            result = response['choices'][0]['message']['content']
             parsed_result = json.loads(result)
             return parsed_result
         except Exception as e:
@@ -100,4 +144,61 @@ class NLPAgent:
                 "intent": "unknown",
                 "error": str(e),
                 "confirmation_needed": True
-            }
\ No newline at end of file
+            }
+
+    @staticmethod
+    def _parse_classification(raw: str) -> MessageClassification:
+        """Validate a classification response, tolerating code fences and surrounding text"""
+        try:
+            return MessageClassification.model_validate_json(raw)
+        except ValidationError:
+            match = re.search(r"\{.*\}", raw, re.DOTALL)
+            if not match:
+                raise
+            return MessageClassification.model_validate_json(match.group(0))
+
+    @classmethod
+    def _is_valid_classification(cls, raw: str) -> bool:
+        try:
+            cls._parse_classification(raw)
+            return True
+        except ValidationError:
+            return False
+
+    async def classify_message(self, user_message: str, history: list,
+                               existing_tags: Optional[List[str]] = None) -> dict:
+        """Check relevancy and extract intent in a single LLM call"""
+        formatted_history = format_conversation_history(history, max_tokens=HISTORY_TOKEN_BUDGETS.get("classify"))
+        system_message = self.classify_prompt.format(
+            conversation_history=formatted_history,
+            current_date=datetime.now().strftime("%Y-%m-%d (%A)"),
+            existing_tags=self._format_tags(existing_tags)
+        )
+        messages = [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": user_message}
+        ]
+
+        try:
+            # One retry, telling the model what was wrong with its first answer
+            for attempt in range(2):
+                result = await chat_completion(
+                    "classify",
+                    messages=messages,
+                    cache_if=self._is_valid_classification,
+                    max_tokens=500,
+                    response_format={"type": "json_object"}
+                )
+                try:
+                    return self._parse_classification(result).model_dump()
+                except ValidationError as e:
+                    if attempt == 1:
+                        raise
+                    logger.warning(f"Malformed classification, retrying: {e}")
+                    messages = messages + [
+                        {"role": "assistant", "content": result},
+                        {"role": "user", "content": f"That response was invalid ({e.errors()[0]['msg']}). Reply with only the JSON object."}
+                    ]
+        except Exception as e:
+            logger.error(f"Error classifying message: {e}")
+            return {"relevant": False, "reason": "Failed to process response", "error": str(e)}
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from typing import Dict, List, Optional, Any
 from datetime import datetime
 
@@ -6,10 +6,19 @@ class Chat(BaseModel):
     id: int
     type: str
     
+class Document(BaseModel):
+    file_id: str
+    file_unique_id: str
+    file_name: Optional[str] = None
+    mime_type: Optional[str] = None
+    file_size: Optional[int] = None
+
 class Message(BaseModel):
     message_id: int
     chat: Chat
     text: Optional[str] = None
+    document: Optional[Document] = None
+    caption: Optional[str] = None
 
 class TelegramUpdate(BaseModel):
     update_id: int
@@ -29,6 +38,33 @@ class Note(BaseModel):
     updated_at: datetime = Field(default_factory=datetime.now)
     metadata: Dict[str, Any] = {}
 
+class MessageClassification(BaseModel):
+    relevant: bool
+    reason: str = ""
+    intent: Optional[str] = None
+    title: Optional[str] = None
+    content: Optional[str] = None
+    tags: Optional[List[str]] = None  # None unless the message names tags, so updates keep a note's tags
+    search_query: Optional[str] = None
+    search_mode: Optional[str] = None
+    since: Optional[str] = None
+    until: Optional[str] = None
+    note_id: Optional[str] = None
+    target_note_id: Optional[str] = None
+    replace: bool = False
+    confirmation_needed: bool = False
+
+    @field_validator('tags', mode='before')
+    @classmethod
+    def default_tags(cls, value):
+        return value or None
+
+    @field_validator('search_mode', mode='before')
+    @classmethod
+    def known_search_mode(cls, value):
+        # Anything else the model returns falls back to the configured SEARCH_MODE
+        return value if value in ("keyword", "semantic", "hybrid") else None
+
 class DataResponse(BaseModel):
     success: bool
     message: str
@@ -1,11 +1,33 @@
-from fastapi import APIRouter, Request, HTTPException, BackgroundTasks
-from app.services.telegram import TelegramBotService, send_telegram_message
-from app.services.ai_service import get_ai_response, get_small_talk_response
-from app.api.models import TelegramUpdate, Message
+from fastapi import APIRouter, Request, HTTPException, BackgroundTasks, Query
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from typing import Optional, Set
+from app.services.telegram import TelegramBotService, ProgressiveReply, send_telegram_message, telegram_client
+from app.services.ai_service import get_ai_response, get_small_talk_response, summarize_conversation
+from app.api.models import TelegramUpdate, Message, Note
 from app.services.conversation import conversation_state
 from app.agent.nlp_agent import NLPAgent
-from app.services.brain_service import brain_service
+from app.agent.fast_path import fast_path_classifier
+from app.services.llm import llm_cache
+from app.services.llm_scheduler import llm_scheduler, current_chat
+from app.services.brain_service import SEARCH_MODES, brain_service
+from app.services.storage import recency_key
+from app.services.time_index import time_bound
+from app.services.update_queue import UpdateDispatcher
+from app.services.shared_state import chat_locks
+from app.services.documents import DocumentError, ingest_document, read_text
+from app.services.blob_store import blob_store
+from app.services.bulk_io import (
+    IMPORT_BATCH_SIZE, export_jsonl_gz, export_watermark, import_notes, iter_export, iter_request_lines
+)
+from app.services.metrics import registry, UPDATE_LATENCY, UPDATES, QUEUE_DEPTH
+from app.utils.helpers import encode_cursor, decode_cursor
+from app.config import (
+    NLP_SINGLE_CALL, MAX_PAGE_SIZE, PROMPT_TOP_TAGS, CONVERSATION_SUMMARY, STREAM_REPLIES, SHARED_STATE,
+    DOCUMENTS_ENABLED
+)
 
+import asyncio
+import json
 import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -14,6 +36,8 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 telegram_service = TelegramBotService()
 nlp_agent = NLPAgent()
+if CONVERSATION_SUMMARY:
+    conversation_state.summarizer = summarize_conversation
 
 access_token = None
 
@@ -25,95 +49,260 @@ async def test_webhook(request: Request):
     return {"status": "ok"}
 
 
-@router.post("/webhook")
-async def telegram_webhook(update: TelegramUpdate):
-    """Handle incoming Telegram messages"""
-    logger.info("========================")
-    logger.info("Webhook endpoint hit!")
-    logger.info(f"Received update: {update}")
-    
-    if not update.message:
-        logger.info("No message in update")
-        return {"status": "ok"}
-    
+async def process_update(update: TelegramUpdate):
+    """Process a queued Telegram update and reply to the user"""
+    with UPDATE_LATENCY.time():
+        if SHARED_STATE:
+            # Other workers may have received updates for the same chat
+            async with chat_locks.hold(update.message.chat.id):
+                await _handle_update(update)
+        else:
+            await _handle_update(update)
+
+async def _handle_update(update: TelegramUpdate):
     chat_id = update.message.chat.id
+    current_chat.set(chat_id)  # LLM calls are queued fairly per chat
     user_message = update.message.text
     message_type = "text"
+
+    if update.message.document is not None and DOCUMENTS_ENABLED:
+        await _handle_document(chat_id, update.message)
+        return
     
     if not user_message:
-        logger.info("No text in message")
+        logger.debug("No text in message")
         await send_telegram_message(
             chat_id,
             "I can help you manage your notes and information. Please send me a text message!"
         )
-        return {"status": "ok"}
+        return
     
     # Add user message to conversation history
-    conversation_state.add_message(chat_id, "user", user_message, message_type)
-    history = conversation_state.get_conversation_history(chat_id)
-    logger.info(f"Conversation history: {history}")
+    await conversation_state.add_message_async(chat_id, "user", user_message, message_type)
+    history = await conversation_state.get_conversation_history_async(chat_id)
+    logger.debug("Conversation history: %s", history)
     
+    reply = None
     try:
-        # First try sending a simple response to test message delivery
-        logger.info("Attempting to send test response...")
-        await send_telegram_message(
+        # Acknowledge right away; the answer replaces this placeholder when streaming replies are on
+        logger.debug("Sending placeholder response...")
+        placeholder = await send_telegram_message(
             chat_id,
             "I received your message! Let me process it...",
             parse_mode=None
         )
+        message_id = (placeholder.get("result") or {}).get("message_id") if STREAM_REPLIES else None
+        reply = ProgressiveReply(telegram_client, chat_id, message_id)
         
-        # Check relevancy before extracting intent
-        logger.info("Checking message relevancy...")
-        relevancy_result = await nlp_agent.check_relevancy(user_message, history)
-        logger.info(f"Relevancy result: {relevancy_result}")
+        fast_result = fast_path_classifier.classify(user_message)
+        existing_tags = await brain_service.top_tags(PROMPT_TOP_TAGS) if fast_result is None and PROMPT_TOP_TAGS else None
+        if fast_result is not None:
+            logger.debug("Message classified locally, skipping the LLM")
+            relevancy_result = intent = fast_result
+        elif NLP_SINGLE_CALL:
+            logger.debug("Classifying message...")
+            relevancy_result = intent = await nlp_agent.classify_message(user_message, history, existing_tags)
+        else:
+            # Check relevancy before extracting intent
+            logger.debug("Checking message relevancy...")
+            relevancy_result = await nlp_agent.check_relevancy(user_message, history)
+        logger.debug("Relevancy result: %s", relevancy_result)
         
         if not relevancy_result["relevant"]:
-            logger.info("Message not relevant, getting small talk response...")
-            ai_response = await get_small_talk_response(user_message, history)
-            await send_telegram_message(chat_id, ai_response, parse_mode=None)
-            conversation_state.add_message(chat_id, "assistant", ai_response)
-            return {"status": "ok"}
+            if fast_result is None and "error" not in relevancy_result:
+                await fast_path_classifier.record_example(user_message, None)
+            logger.debug("Message not relevant, getting small talk response...")
+            ai_response = await get_small_talk_response(
+                user_message, history, on_progress=reply.update if message_id else None
+            )
+            await reply.finish(ai_response)
+            await conversation_state.add_message_async(chat_id, "assistant", ai_response)
+            return
         
-        logger.info("Message relevant, extracting intent...")
-        intent = await nlp_agent.extract_intent(user_message, history)
-        logger.info(f"Extracted intent: {intent}")
+        if fast_result is None:
+            if not NLP_SINGLE_CALL:
+                logger.debug("Message relevant, extracting intent...")
+                intent = await nlp_agent.extract_intent(user_message, history, existing_tags)
+            if "error" not in intent:
+                await fast_path_classifier.record_example(user_message, intent.get("intent"))
+        logger.debug("Extracted intent: %s", intent)
 
         if intent["confirmation_needed"] is False:
-            logger.info("No confirmation needed, getting AI response...")
+            logger.debug("No confirmation needed, getting AI response...")
             ai_response = await get_ai_response(intent, history)
-            await send_telegram_message(chat_id, ai_response, parse_mode=None)
-            conversation_state.add_message(chat_id, "assistant", ai_response)
-            return {"status": "success"}
+            await reply.finish(ai_response)
+            await conversation_state.add_message_async(chat_id, "assistant", ai_response)
         else:
-            logger.info("Confirmation needed, sending confirmation request...")
+            logger.debug("Confirmation needed, sending confirmation request...")
             confirmation_message = f"Would you like me to {intent['intent']}? Please confirm."
-            await send_telegram_message(chat_id, confirmation_message, parse_mode=None)
-            conversation_state.add_message(chat_id, "assistant", confirmation_message)
-            return {"status": "confirmation_needed"}
+            await reply.finish(confirmation_message)
+            await conversation_state.add_message_async(chat_id, "assistant", confirmation_message)
 
     except Exception as e:
         logger.error(f"Error processing message: {str(e)}", exc_info=True)
+        error_message = "I apologize, but I'm having trouble processing your message right now. Please try again later."
         try:
-            await send_telegram_message(
-                chat_id,
-                "I apologize, but I'm having trouble processing your message right now. Please try again later.",
-                parse_mode=None
-            )
+            if reply is not None and not reply.finished:
+                await reply.finish(error_message)
+            else:
+                await send_telegram_message(chat_id, error_message, parse_mode=None)
         except Exception as send_error:
             logger.error(f"Error sending error message: {str(send_error)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
+
+async def _handle_document(chat_id: int, message: Message):
+    """Save a file sent to the bot as a note"""
+    document = message.document
+    name = document.file_name or "your file"
+    await conversation_state.add_message_async(chat_id, "user", f"[Sent a file: {name}] {message.caption or ''}".strip(), "document")
+
+    placeholder = await send_telegram_message(chat_id, f"Reading {name}...", parse_mode=None)
+    message_id = (placeholder.get("result") or {}).get("message_id") if STREAM_REPLIES else None
+    reply = ProgressiveReply(telegram_client, chat_id, message_id)
+    try:
+        note, created = await ingest_document(document, message.caption)
+        if created:
+            response = f"✅ Saved {name} as a note with ID: {note.id}"
+        else:
+            response = f"I already have this file, saved as \"{note.title}\" (ID: {note.id})."
+    except DocumentError as e:
+        response = str(e)
+    except Exception as e:
+        logger.error(f"Error ingesting document: {e}", exc_info=True)
+        response = "I apologize, but I couldn't save that file right now. Please try again later."
+    await reply.finish(response)
+    await conversation_state.add_message_async(chat_id, "assistant", response)
+
+async def reply_busy(update: TelegramUpdate):
+    """Tell the user their message was dropped because the bot is overloaded"""
+    await send_telegram_message(
+        update.message.chat.id,
+        "I'm handling a lot of messages right now. Please send that again in a minute.",
+        parse_mode=None
+    )
+
+update_dispatcher = UpdateDispatcher(process_update, busy_handler=reply_busy)
+QUEUE_DEPTH.set_function(lambda: update_dispatcher.pending, "updates")
+
+@router.post("/webhook")
+async def telegram_webhook(update: TelegramUpdate):
+    """Acknowledge an incoming Telegram update and queue it for processing"""
+    logger.debug("========================")
+    logger.debug("Webhook endpoint hit!")
+    logger.debug("Received update: %s", update)  # Formatted lazily, only when debug logging is on
+    
+    return {"status": await submit_update(update)}
+
+async def submit_update(update: TelegramUpdate, wait: bool = False) -> str:
+    """Hand an update to the dispatcher, from the webhook or the polling loop"""
+    if not update.message:
+        logger.debug("No message in update")
+        UPDATES.labels("ignored").inc()
+        return "ok"
+
+    status = await update_dispatcher.submit(update, update.message.chat.id, wait=wait)
+    UPDATES.labels(status).inc()
+    return status
+
+def _project(note: Note, fields: Optional[Set[str]]) -> dict:
+    return note.model_dump(mode="json", include=fields)
 
 @router.get("/notes")
-async def list_notes(query: str = None, tags: str = None):
-    """List all notes, optionally filtered by search query or tags"""
+async def list_notes(query: str = None, tags: str = None, mode: str = None, cursor: str = None,
+                     limit: int = Query(None, ge=1, le=MAX_PAGE_SIZE), fields: str = None, stream: bool = False,
+                     since: str = None, until: str = None,
+                     date_field: str = Query("updated_at", pattern="^(created_at|updated_at)$")):
+    """List notes newest first, optionally filtered by search query, tags or date range.
+
+    Results for a query come in rank order instead, with ``mode`` picking
+    keyword, semantic or hybrid ranking.
+    ``since`` and ``until`` (ISO dates or datetimes, inclusive) restrict
+    ``date_field``, ``created_at`` or ``updated_at`` (the default).
+    ``limit`` and ``cursor`` page through the results (pass back the
+    returned ``next_cursor``), ``fields`` is a comma-separated projection
+    such as ``id,title,tags``, and ``stream=true`` returns NDJSON with one
+    note per line and a final ``{"next_cursor": ...}`` line.
+    """
     try:
+        if mode is not None and mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode} (expected one of {', '.join(SEARCH_MODES)})")
         tag_list = tags.split(',') if tags else None
-        notes = await brain_service.search_notes(query=query, tags=tag_list)
-        return {"status": "success", "notes": notes}
+        position = decode_cursor(cursor) if cursor else None
+        # Query listings page by offset into the ranking, others by (updated_at, id)
+        if position is not None and isinstance(position, int) != bool(query):
+            raise ValueError(f"Invalid cursor: {cursor}")
+        offset = position if query and position else 0
+        before = None if query else position
+        field_set = set(fields.split(',')) if fields else None
+        if field_set and not field_set <= set(Note.model_fields):
+            raise ValueError(f"Unknown fields: {', '.join(sorted(field_set - set(Note.model_fields)))}")
+        # Validated here so a bad date is a 400; the brain normalizes them again
+        time_bound(since)
+        time_bound(until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    notes = brain_service.iter_notes(
+        query=query, tags=tag_list, mode=mode, before=before, limit=limit,
+        since=since, until=until, date_field=date_field, offset=offset
+    )
+
+    def next_cursor(last: Note, count: int) -> Optional[str]:
+        if not limit or count < limit:
+            return None
+        return encode_cursor(offset + count if query else recency_key(last))
+
+    if stream:
+        async def generate():
+            last, count = None, 0
+            async for note in notes:
+                last, count = note, count + 1
+                yield json.dumps(_project(note, field_set)) + "\n"
+            yield json.dumps({"next_cursor": next_cursor(last, count)}) + "\n"
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+    try:
+        page = [note async for note in notes]
+        return {
+            "status": "success",
+            "notes": [_project(note, field_set) for note in page],
+            "next_cursor": next_cursor(page[-1] if page else None, len(page)),
+        }
     except Exception as e:
         logger.error(f"Error listing notes: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/notes/import")
+async def import_notes_endpoint(request: Request, batch_size: int = Query(IMPORT_BATCH_SIZE, ge=1, le=10000)):
+    """Bulk-import notes from a JSONL request body (optionally gzipped), streamed in batches"""
+    try:
+        result = await import_notes(brain_service, iter_request_lines(request.stream()), batch_size)
+        return {"status": "success", **result}
+    except Exception as e:
+        logger.error(f"Error importing notes: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/notes/export")
+async def export_notes(since: str = None):
+    """Stream notes as gzipped JSONL, oldest change first.
+
+    ``since`` limits the export to notes changed after a previous export's
+    watermark, returned in the ``X-Export-Watermark`` header, and adds
+    tombstones for notes deleted since.
+    """
+    until = export_watermark(brain_service)
+    try:
+        records = iter_export(brain_service, since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        export_jsonl_gz(records),
+        media_type="application/gzip",
+        headers={
+            "X-Export-Watermark": until,
+            "Content-Disposition": 'attachment; filename="notes.jsonl.gz"',
+        },
+    )
+
 @router.get("/notes/{note_id}")
 async def get_note(note_id: str):
     """Get a specific note by ID"""
@@ -124,4 +313,71 @@ async def get_note(note_id: str):
         return {"status": "success", "note": note}
     except Exception as e:
         logger.error(f"Error getting note: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def _document_note(note_id: str) -> Note:
+    note = await brain_service.get_note(note_id)
+    if note is None or "document" not in note.metadata:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return note
+
+@router.get("/notes/{note_id}/file")
+async def get_note_file(note_id: str):
+    """Download the file a document note was created from"""
+    document = (await _document_note(note_id)).metadata["document"]
+    if not await asyncio.to_thread(blob_store.exists, document["blob"]):
+        raise HTTPException(status_code=404, detail="File not found")
+    return FileResponse(
+        blob_store.path(document["blob"]), filename=document["file_name"],
+        media_type=document.get("mime_type") or "application/octet-stream"
+    )
+
+@router.get("/notes/{note_id}/text")
+async def get_note_text(note_id: str, chunk: int = Query(None, ge=0)):
+    """A document note's full extracted text, streamed chunk by chunk, or just chunk number ``chunk``"""
+    note = await _document_note(note_id)
+    text = note.metadata["document"].get("text")
+    if chunk is not None:
+        if not text or chunk >= len(text["chunks"]):
+            raise HTTPException(status_code=404, detail="Chunk not found")
+        return PlainTextResponse(await asyncio.to_thread(read_text, note, chunk))
+
+    async def generate():
+        if not text:
+            yield note.content  # No text was extracted; the note body is all there is
+            return
+        for i in range(len(text["chunks"])):
+            yield await asyncio.to_thread(read_text, note, i)
+    return StreamingResponse(generate(), media_type="text/plain; charset=utf-8")
+
+@router.get("/tags")
+async def list_tags(prefix: str = None, tags: str = None, limit: int = Query(None, ge=1, le=MAX_PAGE_SIZE)):
+    """Tag facet counts, most used first.
+
+    ``prefix`` autocompletes tags (case-insensitive); ``tags`` counts only
+    the tags that co-occur on notes carrying all of the given tags.
+    """
+    try:
+        facets = await brain_service.list_tags(prefix=prefix, tags=tags.split(',') if tags else None, limit=limit)
+        return {"status": "success", "tags": [{"tag": tag, "count": count} for tag, count in facets]}
+    except Exception as e:
+        logger.error(f"Error listing tags: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/stats")
+async def get_stats():
+    """Runtime counters for tuning the bot"""
+    return {
+        "status": "success",
+        "fast_path": fast_path_classifier.stats(),
+        "llm_cache": llm_cache.stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+        "conversations": await asyncio.to_thread(conversation_state.stats),  # May wait on the shared store
+        "brain": brain_service.stats(),
+    }
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Latency histograms, counters and queue depths in the Prometheus text format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
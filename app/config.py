@@ -5,13 +5,139 @@ from dotenv import load_dotenv
 load_dotenv()
 
 TELEGRAM_API_TOKEN = os.getenv('TELEGRAM_API_TOKEN')
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')  # Point at a local Bot API server for testing
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')  # Changed to a valid model name
 OAUTH_REDIRECT_PATH = "/oauth2callback"
 
+# LLM client: "litellm" (imported on first use, as it is slow to import) or "openai", a lightweight
+# client for any OpenAI-compatible chat completions endpoint. OPENAI_API_BASE overrides the endpoint for both
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'litellm').lower()
+OPENAI_API_BASE = os.getenv('OPENAI_API_BASE')
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '60'))
+
+# LLM call scheduling: calls in flight across all chats (queued round-robin per chat), deadline in seconds
+# per call type (queueing and retries included), and retries after rate-limit errors
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '16'))
+LLM_DEADLINES = {
+    call_type: float(deadline)
+    for call_type, deadline in (
+        item.split('=') for item in os.getenv(
+            'LLM_DEADLINES', 'relevancy=20,intent=30,classify=30,small_talk=45,summary=60'
+        ).split(',') if item
+    )
+}
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '3'))
+# Calls outlasting the model's p95 latency are hedged: "off", "duplicate" (the same model again) or
+# "fallback" (LLM_FALLBACK_MODEL). The fallback model also takes over calls that fail
+LLM_HEDGE = os.getenv('LLM_HEDGE', 'off').lower()
+LLM_FALLBACK_MODEL = os.getenv('LLM_FALLBACK_MODEL')
+
 API_HOST = os.getenv('API_HOST', 'localhost')
 API_PORT = int(os.getenv('API_PORT', '8060'))  # Changed back to 8060 to match ngrok
 
 # Get webhook URL from environment variable or use ngrok to generate one
 WEBHOOK_BASE_URL = os.getenv('WEBHOOK_BASE_URL', None)  # Set this when in production
-USE_NGROK = os.getenv('USE_NGROK', 'true').lower() == 'true'  # Use ngrok by default in development
\ No newline at end of file
+USE_NGROK = os.getenv('USE_NGROK', 'true').lower() == 'true'  # Use ngrok by default in development
+# How updates arrive: "webhook", "polling" (getUpdates, no public URL needed) or "auto" (webhook if one can be set)
+TELEGRAM_MODE = os.getenv('TELEGRAM_MODE', 'auto').lower()
+TELEGRAM_POLL_TIMEOUT = int(os.getenv('TELEGRAM_POLL_TIMEOUT', '30'))  # Long-poll seconds per getUpdates call
+TELEGRAM_POLL_LIMIT = int(os.getenv('TELEGRAM_POLL_LIMIT', '100'))  # Updates per batch
+
+# Multi-process deployment: uvicorn workers started by `python -m app.main serve`. With more than one,
+# conversations, update deduplication and per-chat ordering are shared through SQLite and file locks
+WEB_WORKERS = int(os.getenv('WEB_WORKERS', '1'))
+SHARED_STATE = os.getenv('SHARED_STATE', str(WEB_WORKERS > 1)).lower() == 'true'
+
+# Note storage
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'sqlite')  # "sqlite" or "json" (one file per note)
+
+# Blocking note I/O is offloaded to a thread pool; a scan yields to the event loop every chunk
+BRAIN_IO_THREADS = int(os.getenv('BRAIN_IO_THREADS', '4'))
+BRAIN_IO_CONCURRENCY = int(os.getenv('BRAIN_IO_CONCURRENCY', '8'))
+BRAIN_SCAN_CHUNK_SIZE = int(os.getenv('BRAIN_SCAN_CHUNK_SIZE', '200'))
+
+# Outbound Telegram rate limits (messages per second) and retry budget
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', '1'))
+TELEGRAM_CHAT_BURST = float(os.getenv('TELEGRAM_CHAT_BURST', '3'))
+TELEGRAM_MAX_RETRIES = int(os.getenv('TELEGRAM_MAX_RETRIES', '3'))
+
+# Replies edit the "processing" placeholder in place; streamed text is pushed at most once per interval
+STREAM_REPLIES = os.getenv('STREAM_REPLIES', 'true').lower() == 'true'
+TELEGRAM_EDIT_INTERVAL = float(os.getenv('TELEGRAM_EDIT_INTERVAL', '1.0'))
+
+# Webhook updates are acknowledged immediately and processed by a worker pool
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '8'))
+WEBHOOK_MAX_PENDING = int(os.getenv('WEBHOOK_MAX_PENDING', '100'))
+WEBHOOK_DEDUP_WINDOW = int(os.getenv('WEBHOOK_DEDUP_WINDOW', '1000'))
+
+# Classify relevance and intent in one LLM call instead of two sequential ones
+NLP_SINGLE_CALL = os.getenv('NLP_SINGLE_CALL', 'true').lower() == 'true'
+
+# Local fast-path classifier that answers obvious commands without the LLM
+FAST_PATH_ENABLED = os.getenv('FAST_PATH_ENABLED', 'true').lower() == 'true'
+FAST_PATH_THRESHOLD = float(os.getenv('FAST_PATH_THRESHOLD', '0.85'))
+# Logged messages it trains on: only the most recent ones are kept on disk and used per retrain
+FAST_PATH_MAX_EXAMPLES = int(os.getenv('FAST_PATH_MAX_EXAMPLES', '2000'))
+
+# LLM response cache: LRU size, TTL in seconds per call type (0 disables caching for that type)
+LLM_CACHE_SIZE = int(os.getenv('LLM_CACHE_SIZE', '1024'))
+LLM_CACHE_TTLS = {
+    call_type: float(ttl)
+    for call_type, ttl in (
+        item.split('=') for item in os.getenv(
+            'LLM_CACHE_TTLS', 'relevancy=3600,intent=600,classify=600,small_talk=300,summary=0'
+        ).split(',') if item
+    )
+}
+LLM_CACHE_DISK = os.getenv('LLM_CACHE_DISK', 'false').lower() == 'true'  # Persist cached responses across restarts
+
+# Conversation history in prompts: token budget per call type, cap per message,
+# and rolling summaries of messages that have left the history window
+HISTORY_TOKEN_BUDGETS = {
+    call_type: int(budget)
+    for call_type, budget in (
+        item.split('=') for item in os.getenv(
+            'HISTORY_TOKEN_BUDGETS', 'relevancy=300,intent=600,classify=600,small_talk=400'
+        ).split(',') if item
+    )
+}
+HISTORY_MESSAGE_TOKENS = int(os.getenv('HISTORY_MESSAGE_TOKENS', '150'))
+CONVERSATION_SUMMARY = os.getenv('CONVERSATION_SUMMARY', 'true').lower() == 'true'
+CONVERSATION_SUMMARY_BATCH = int(os.getenv('CONVERSATION_SUMMARY_BATCH', '4'))  # Dropped messages per refresh
+
+# Note search ranking: "keyword", "semantic" (offline embeddings) or "hybrid"
+SEARCH_MODE = os.getenv('SEARCH_MODE', 'hybrid')
+SEMANTIC_MIN_SCORE = float(os.getenv('SEMANTIC_MIN_SCORE', '0.2'))
+SEMANTIC_TOP_K = int(os.getenv('SEMANTIC_TOP_K', '50'))
+
+# Near-duplicate detection: MinHash signatures of word shingles, bucketed by LSH bands, flag saved notes
+# whose estimated Jaccard similarity to an existing one reaches the threshold. DEDUP_NUM_PERM must be a
+# multiple of DEDUP_BANDS; more bands catch less similar pairs
+DEDUP_ENABLED = os.getenv('DEDUP_ENABLED', 'true').lower() == 'true'
+DEDUP_THRESHOLD = float(os.getenv('DEDUP_THRESHOLD', '0.8'))
+DEDUP_NUM_PERM = int(os.getenv('DEDUP_NUM_PERM', '128'))
+DEDUP_BANDS = int(os.getenv('DEDUP_BANDS', '16'))
+DEDUP_SHINGLE_WORDS = int(os.getenv('DEDUP_SHINGLE_WORDS', '3'))
+
+# Conversation memory: messages kept per chat, and limits before whole chats are evicted
+CONVERSATION_HISTORY_SIZE = int(os.getenv('CONVERSATION_HISTORY_SIZE', '10'))
+CONVERSATION_MAX_CHATS = int(os.getenv('CONVERSATION_MAX_CHATS', '10000'))
+CONVERSATION_MAX_BYTES = int(os.getenv('CONVERSATION_MAX_BYTES', str(64 * 1024 * 1024)))
+CONVERSATION_IDLE_SECONDS = float(os.getenv('CONVERSATION_IDLE_SECONDS', str(24 * 3600)))
+CONVERSATION_SPILL = os.getenv('CONVERSATION_SPILL', 'true').lower() == 'true'  # Keep evicted chats on disk
+
+# Files sent to the bot are streamed into a content-addressed blob store (data/blobs) and their text is
+# extracted in chunks; the note keeps a preview of the text and points at the rest
+DOCUMENTS_ENABLED = os.getenv('DOCUMENTS_ENABLED', 'true').lower() == 'true'
+DOCUMENT_MAX_BYTES = int(os.getenv('DOCUMENT_MAX_BYTES', str(20 * 1024 * 1024)))  # getFile's limit on the public Bot API
+DOCUMENT_PREVIEW_CHARS = int(os.getenv('DOCUMENT_PREVIEW_CHARS', '2000'))
+DOCUMENT_CHUNK_BYTES = int(os.getenv('DOCUMENT_CHUNK_BYTES', str(64 * 1024)))
+
+# Largest page GET /notes will return
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '500'))
+
+# Most used tags offered to the LLM so it reuses existing ones (0 disables)
+PROMPT_TOP_TAGS = int(os.getenv('PROMPT_TOP_TAGS', '20'))
@@ -1,14 +1,33 @@
-import uvicorn
+import asyncio
 import httpx
+import logging
 import os
+import sys
+from typing import Awaitable, Callable
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
-from app.api.routes import router
+from app.api.routes import router, update_dispatcher, submit_update
 from app.services.telegram import TelegramBotService
-from app.config import API_HOST, API_PORT, TELEGRAM_API_TOKEN, WEBHOOK_BASE_URL, USE_NGROK
+from app.services.brain_service import brain_service
+from app.agent.fast_path import fast_path_classifier
+from app.services.shared_state import is_primary_process
+from app.services.llm import openai_client, warm_up
+from app.config import (
+    API_HOST, API_PORT, WEBHOOK_BASE_URL, USE_NGROK, DATA_DIR, TELEGRAM_MODE, WEB_WORKERS, STORAGE_BACKEND
+)
+
+logger = logging.getLogger(__name__)
 
 # Global Telegram service instance
 telegram_service = None
+webhook_active = False
+
+# setWebhook retries: with TELEGRAM_MODE=webhook until it succeeds, otherwise before falling back to polling
+WEBHOOK_RETRY_SECONDS = 2
+WEBHOOK_MAX_RETRY_SECONDS = 300
+WEBHOOK_AUTO_ATTEMPTS = 3
+# How often a non-primary worker checks whether the primary has exited, to take over from it
+PRIMARY_CHECK_SECONDS = 5
 
 async def get_webhook_url():
     """Get the webhook URL, using ngrok in development if enabled"""
@@ -26,48 +45,108 @@ async def get_webhook_url():
                         if tunnel["proto"] == "https":
                             return f"{tunnel['public_url']}/webhook"
         except Exception as e:
-            print(f"Error getting ngrok URL: {e}")
-            print("Please make sure ngrok is running with: ngrok http 8060")
+            logger.error(f"Error getting ngrok URL: {e}")
+            logger.error("Please make sure ngrok is running with: ngrok http 8060")
             return None
     
     return None
 
+async def set_webhook(service: TelegramBotService) -> bool:
+    """Register the webhook, retrying with backoff; False if updates should be polled instead"""
+    delay = WEBHOOK_RETRY_SECONDS
+    attempt = 0
+    while True:
+        attempt += 1
+        webhook_url = await get_webhook_url()
+        if webhook_url:
+            logger.info(f"Setting webhook URL to: {webhook_url}")
+            try:
+                response = await service.client.call("setWebhook", {"url": webhook_url})
+                if response.get("ok"):
+                    return True
+                logger.error(f"Error setting webhook: {response}")
+            except (httpx.HTTPError, ValueError) as e:
+                logger.error(f"Error setting webhook: {e}")
+        else:
+            logger.warning("No webhook URL available. Please start ngrok or set WEBHOOK_BASE_URL")
+        # Without a URL there is nothing to retry unless the webhook is required
+        if TELEGRAM_MODE != "webhook" and (not webhook_url or attempt >= WEBHOOK_AUTO_ATTEMPTS):
+            return False
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, WEBHOOK_MAX_RETRY_SECONDS)
+
+async def receive_updates(service: TelegramBotService):
+    """Set up Telegram webhook, or fall back to long polling"""
+    global webhook_active
+    if TELEGRAM_MODE != "polling":
+        webhook_active = await set_webhook(service)
+    if not webhook_active:
+        # getUpdates is refused while a webhook is set; the poller retries until it is gone
+        try:
+            await service.client.call("deleteWebhook")
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"Error deleting webhook: {e}")
+        logger.info("Receiving updates by long polling")
+        await service.start_polling(lambda update: submit_update(update, wait=True))
+
+async def act_as_primary(service: TelegramBotService):
+    """Receive updates once this is the primary worker, taking over the index files and updates when it exits"""
+    if not is_primary_process():
+        while not is_primary_process():
+            await asyncio.sleep(PRIMARY_CHECK_SECONDS)
+        logger.warning(f"The primary worker exited; process {os.getpid()} takes over")
+        if await brain_service.reclaim_indexes():
+            logger.info("Now writing the index files")
+    await receive_updates(service)
+
+async def shutdown_step(name: str, step: Callable[[], Awaitable]):
+    """Run one shutdown step, so that a failure does not skip the ones after it"""
+    try:
+        await step()
+    except Exception as e:
+        logger.exception(f"Error during shutdown ({name}): {e}")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Manage startup and shutdown events."""
-    global telegram_service
+    """Manage startup and shutdown events.
+
+    Startup only does what the first request needs. Webhook registration,
+    training the fast-path model and importing the LLM backend run in the
+    background, so a restarted process serves requests right away.
+    """
+    global telegram_service, webhook_active
     
     # Create data directory for notes if it doesn't exist
-    os.makedirs("data/notes", exist_ok=True)
+    os.makedirs(DATA_DIR, exist_ok=True)
     
     # Startup: Initialize Telegram bot service
     telegram_service = TelegramBotService()
-    telegram_service.start()
-    
-    # Set up Telegram webhook
-    webhook_url = await get_webhook_url()
-    if webhook_url:
-        print(f"Setting webhook URL to: {webhook_url}")
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"https://api.telegram.org/bot{TELEGRAM_API_TOKEN}/setWebhook",
-                params={"url": webhook_url}
-            )
-            if response.status_code != 200 or not response.json().get("ok"):
-                print(f"Error setting webhook: {response.status_code} - {response.text}")
-                print("Continuing with polling method...")
-    else:
-        print("No webhook URL available. Please start ngrok or set WEBHOOK_BASE_URL")
+    await telegram_service.start()
+    await update_dispatcher.start()
+
+    # With several workers, only the primary one receives updates
+    background = [
+        asyncio.create_task(fast_path_classifier.load()), asyncio.create_task(warm_up()),
+        asyncio.create_task(act_as_primary(telegram_service)),
+    ]
 
     yield  # Hand control back to FastAPI
 
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+
+    # Stop receiving updates, then finish the ones already accepted
+    if webhook_active:
+        await shutdown_step("deleteWebhook", lambda: telegram_service.client.call("deleteWebhook"))
+        webhook_active = False
+    await shutdown_step("stop polling", telegram_service.stop_polling)
+    await shutdown_step("update dispatcher", update_dispatcher.stop)
+
     # Shutdown: Clean up Telegram service
     if telegram_service:
-        telegram_service.stop()
-    
-    # Remove webhook on shutdown
-    async with httpx.AsyncClient() as client:
-        await client.get(f"https://api.telegram.org/bot{TELEGRAM_API_TOKEN}/deleteWebhook")
+        await shutdown_step("Telegram client", telegram_service.stop)
+    await shutdown_step("LLM client", openai_client.stop)
 
 app = FastAPI(title="Second Brain Agent", lifespan=lifespan)
 app.include_router(router)
@@ -78,8 +157,21 @@ async def root():
     return {"message": "Second Brain Agent is running"}
 
 def start():
-    """Start the FastAPI application"""
+    """Start the FastAPI application in development mode, reloading on code changes"""
+    import uvicorn
     uvicorn.run("app.main:app", host=API_HOST, port=API_PORT, reload=True)
 
+def serve(workers: int = WEB_WORKERS):
+    """Start the FastAPI application for production, on ``workers`` processes"""
+    import uvicorn
+    if workers > 1 and STORAGE_BACKEND != "sqlite":
+        raise SystemExit("Several workers need STORAGE_BACKEND=sqlite")
+    # Workers read their settings from the environment they inherit
+    os.environ["WEB_WORKERS"] = str(workers)
+    uvicorn.run("app.main:app", host=API_HOST, port=API_PORT, workers=workers, proxy_headers=True)
+
 if __name__ == "__main__":
-    start()
\ No newline at end of file
+    if sys.argv[1:2] == ["serve"]:
+        serve(int(sys.argv[2]) if len(sys.argv) > 2 else WEB_WORKERS)
+    else:
+        start()
\ No newline at end of file
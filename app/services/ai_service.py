@@ -1,15 +1,25 @@
 from datetime import datetime
-from app.config import OPENAI_API_KEY, OPENAI_MODEL
 from app.utils.helpers import format_conversation_history
 from app.services.brain_service import brain_service
-from litellm import acompletion
-from typing import Dict
+from app.services.time_index import time_bound
+from app.services.llm import chat_completion, stream_completion
+from app.config import HISTORY_TOKEN_BUDGETS
+from typing import Callable, Dict, List, Optional
 import logging
 import json
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def _date_or_none(value) -> Optional[str]:
+    """A date bound from the LLM, or None if it is missing or not a date"""
+    try:
+        time_bound(value)
+        return value
+    except (ValueError, AttributeError):
+        logger.warning(f"Ignoring unparseable date from intent: {value!r}")
+        return None
+
 async def get_ai_response(intent_data: Dict, conversation_history: list) -> str:
     """Generate AI response based on the intent and perform necessary actions"""
     try:
@@ -22,12 +32,20 @@ async def get_ai_response(intent_data: Dict, conversation_history: list) -> str:
 
         if intent == 'save':
             # Save new note
-            note = await brain_service.save_note(
-                title=intent_data.get('title', 'Untitled Note'),
-                content=intent_data.get('content', ''),
-                tags=intent_data.get('tags', [])
+            note, duplicates = await brain_service.save_note_checked(
+                title=intent_data.get('title') or 'Untitled Note',
+                content=intent_data.get('content') or '',
+                tags=intent_data.get('tags') or []
             )
             response_message = f"✅ Note saved successfully with ID: {note.id}"
+            if duplicates:
+                existing, score = duplicates[0]
+                response_message += (
+                    f"\n\nIt looks like a near-duplicate of \"{existing.title}\" "
+                    f"(ID: {existing.id}, {score:.0%} similar). "
+                    f"Reply \"merge note {note.id} into {existing.id}\" to combine them, or "
+                    f"\"replace note {existing.id} with {note.id}\" to update that note with this one."
+                )
 
         elif intent == 'update':
             # Update existing note
@@ -35,27 +53,45 @@ async def get_ai_response(intent_data: Dict, conversation_history: list) -> str:
                 note_id=intent_data.get('note_id'),
                 title=intent_data.get('title'),
                 content=intent_data.get('content'),
-                tags=intent_data.get('tags')
+                tags=intent_data.get('tags') or None,  # An empty list means no tags were named, not "remove them all"
+                add_tags=intent_data.get('add_tags')
             )
             response_message = f"✅ Note {note.id} updated successfully"
 
+        elif intent == 'merge':
+            # Fold a note (usually one just saved) into the existing note it duplicates
+            try:
+                note = await brain_service.merge_notes(
+                    source_id=intent_data.get('note_id'),
+                    target_id=intent_data.get('target_note_id'),
+                    replace=bool(intent_data.get('replace'))
+                )
+                response_message = f"✅ Merged note {intent_data.get('note_id')} into {note.id}"
+            except (FileNotFoundError, ValueError) as e:
+                response_message = f"❌ {e}"
+
         elif intent == 'delete':
             # Delete note
             success = await brain_service.delete_note(intent_data.get('note_id'))
             response_message = "✅ Note deleted successfully" if success else "❌ Note not found"
 
         elif intent == 'query':
-            # Search notes
-            notes = await brain_service.search_notes(
+            # Search notes; only the 5 shown are read, the rest are just counted
+            notes, total = await brain_service.find_notes(
                 query=intent_data.get('search_query'),
-                tags=intent_data.get('tags')
+                tags=intent_data.get('tags'),
+                mode=intent_data.get('search_mode'),
+                since=_date_or_none(intent_data.get('since')),
+                until=_date_or_none(intent_data.get('until')),
+                date_field="created_at",
+                limit=5
             )
             if notes:
                 response_message = "📝 Here are the matching notes:\n\n"
-                for note in notes[:5]:  # Limit to 5 results
+                for note in notes:
                     response_message += f"- {note.title} (ID: {note.id})\n"
-                if len(notes) > 5:
-                    response_message += f"\n...and {len(notes) - 5} more notes."
+                if total > len(notes):
+                    response_message += f"\n...and {total - len(notes)} more notes."
             else:
                 response_message = "No matching notes found."
 
@@ -68,8 +104,13 @@ async def get_ai_response(intent_data: Dict, conversation_history: list) -> str:
         return "I apologize, but I'm having trouble processing your request right now. Please try again."
 
 
-async def get_small_talk_response(user_message: str, conversation_history: list) -> str:
-    """Handle non-task related conversation while guiding back to Second Brain functionality"""
+async def get_small_talk_response(user_message: str, conversation_history: list,
+                                  on_progress: Optional[Callable[[str], None]] = None) -> str:
+    """Handle non-task related conversation while guiding back to Second Brain functionality.
+
+    With ``on_progress``, the response is streamed and the callback gets the
+    text generated so far each time more arrives.
+    """
     try:
         system_prompt = """
         You are a friendly AI assistant that helps users manage their Second Brain - a personal knowledge management system.
@@ -81,7 +122,9 @@ async def get_small_talk_response(user_message: str, conversation_history: list)
         Conversation history: {conversation_history}
         """
         
-        formatted_history = format_conversation_history(conversation_history)
+        formatted_history = format_conversation_history(
+            conversation_history, max_tokens=HISTORY_TOKEN_BUDGETS.get("small_talk")
+        )
         messages = [
             {
                 "role": "system", 
@@ -93,13 +136,28 @@ async def get_small_talk_response(user_message: str, conversation_history: list)
             {"role": "user", "content": user_message}
         ]
         
-        response = await acompletion(
-            api_key=OPENAI_API_KEY,
-            model=OPENAI_MODEL,
-            messages=messages,
-            max_tokens=200
-        )
-        return response["choices"][0]["message"]["content"]
+        if on_progress is None:
+            return await chat_completion("small_talk", messages, max_tokens=200)
+        response = ""
+        async for text in stream_completion("small_talk", messages, max_tokens=200):
+            response += text
+            on_progress(response)
+        return response
     except Exception as e:
         logger.error(f"Error getting small talk response: {e}")
-        return "I apologize, but I'm having trouble generating a response right now. Please try again."
\ No newline at end of file
+        return "I apologize, but I'm having trouble generating a response right now. Please try again."
+
+async def summarize_conversation(previous_summary: Optional[str], messages: List[dict]) -> str:
+    """Fold older messages into a chat's rolling summary"""
+    system_prompt = """
+    You maintain a short running summary of a conversation between a user and their Second Brain assistant.
+    Update the summary with the new messages. Keep note titles, note ids, topics and preferences the user
+    mentioned; drop greetings and pleasantries. Reply with at most three sentences and nothing else.
+
+    Current summary: {previous_summary}
+    """
+    messages = [
+        {"role": "system", "content": system_prompt.format(previous_summary=previous_summary or "(none)")},
+        {"role": "user", "content": format_conversation_history(messages)}
+    ]
+    return (await chat_completion("summary", messages, max_tokens=150)).strip()
@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import mmap
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+from typing import AsyncIterator, Iterator, List, NamedTuple, Optional
+from app.config import DATA_DIR
+import logging
+
+logger = logging.getLogger(__name__)
+
+DIGEST = re.compile(r"[0-9a-f]{64}")
+
+
+class BlobInfo(NamedTuple):
+    digest: str
+    size: int
+    created: bool  # False if an identical blob was already stored
+
+
+class BlobTooLargeError(ValueError):
+    pass
+
+
+class BlobWriter:
+    """Writes one blob to a temporary file while hashing it; ``commit`` files it under its digest"""
+
+    def __init__(self, store: "BlobStore", max_bytes: Optional[int] = None):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._hash = hashlib.sha256()
+        os.makedirs(store.tmp_dir, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=store.tmp_dir)
+        self._file = os.fdopen(fd, 'wb')
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            raise BlobTooLargeError(f"Blob is larger than {self.max_bytes} bytes")
+        self._hash.update(data)
+        self._file.write(data)
+
+    def commit(self) -> BlobInfo:
+        self._file.close()
+        digest = self._hash.hexdigest()
+        path = self.store.path(digest)
+        if os.path.exists(path):
+            os.remove(self.tmp_path)
+            return BlobInfo(digest, self.size, False)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(self.tmp_path, path)
+        return BlobInfo(digest, self.size, True)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class BlobStore:
+    """Content-addressed file store, so identical files are kept once however often they are added.
+
+    A blob lives at ``root/ab/cd/<sha256>``. It is written to a temporary
+    file while being hashed and renamed into place at the end, so readers
+    never see partial blobs. Blobs are read through memory maps rather
+    than loaded whole. ``link`` records which notes refer to a blob.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.tmp_dir = os.path.join(root, "tmp")
+        self.refs_dir = os.path.join(root, "refs")
+
+    def path(self, digest: str) -> str:
+        if not DIGEST.fullmatch(digest):
+            raise ValueError(f"Invalid blob digest: {digest!r}")
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    @contextmanager
+    def writer(self, max_bytes: Optional[int] = None) -> Iterator[BlobWriter]:
+        """A ``BlobWriter`` that is discarded if the block raises or does not commit it"""
+        writer = BlobWriter(self, max_bytes)
+        try:
+            yield writer
+        finally:
+            writer.abort()
+
+    async def put_stream(self, chunks: AsyncIterator[bytes], max_bytes: Optional[int] = None) -> BlobInfo:
+        """Store a blob from a stream of chunks, writing each to disk as it arrives"""
+        with self.writer(max_bytes) as writer:
+            async for chunk in chunks:
+                await asyncio.to_thread(writer.write, chunk)
+            return await asyncio.to_thread(writer.commit)
+
+    def put_bytes(self, data: bytes) -> BlobInfo:
+        with self.writer() as writer:
+            writer.write(data)
+            return writer.commit()
+
+    @contextmanager
+    def open(self, digest: str) -> Iterator[memoryview]:
+        """Map a blob into memory read-only; pages are loaded as they are touched"""
+        with open(self.path(digest), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                yield memoryview(b"")  # Empty files cannot be mapped
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    yield view
+                finally:
+                    view.release()
+
+    def read(self, digest: str, offset: int = 0, length: Optional[int] = None) -> bytes:
+        with self.open(digest) as view:
+            end = len(view) if length is None else min(len(view), offset + length)
+            return bytes(view[offset:end])
+
+    def link(self, digest: str, ref: str):
+        """Record that ``ref`` (a note id) refers to a blob"""
+        self.path(digest)  # Validates the digest before it is used as a file name
+        os.makedirs(self.refs_dir, exist_ok=True)
+        with open(os.path.join(self.refs_dir, digest), 'a', encoding='utf-8') as f:
+            f.write(ref + "\n")
+
+    def links(self, digest: str) -> List[str]:
+        self.path(digest)
+        try:
+            with open(os.path.join(self.refs_dir, digest), 'r', encoding='utf-8') as f:
+                return [line.strip() for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+
+blob_store = BlobStore(os.path.join(DATA_DIR, "blobs"))
@@ -1,123 +1,527 @@
+import asyncio
+import itertools
 import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from functools import partial
+from typing import AsyncIterator, Iterable, Iterator, List, Optional, Dict, Any, Tuple
 from app.api.models import Note
+from app.services.search_index import SearchIndex
+from app.services.tag_index import TagIndex
+from app.services.time_index import TimeIndex, time_bound
+from app.services.minhash_index import MinHashIndex
+from app.services.metrics import BRAIN_LATENCY, BRAIN_ERRORS, timed
+from app.services.vector_index import VectorIndex
+from app.services.storage import NoteExistsError, NoteStorage, create_storage
+from app.services.shared_state import is_primary_process
+from app.utils.ids import generate_note_id
+from app.config import (
+    DATA_DIR, STORAGE_BACKEND, BRAIN_IO_THREADS, BRAIN_IO_CONCURRENCY, BRAIN_SCAN_CHUNK_SIZE,
+    SEARCH_MODE, SEMANTIC_MIN_SCORE, SEMANTIC_TOP_K
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
+MAX_ID_ATTEMPTS = 5
+SYNC_BATCH_SIZE = 500
+SYNC_SAVE_INTERVAL = 1.0  # Seconds between saves of the index sync position; replaying from an older one is harmless
+SEARCH_MODES = ("keyword", "semantic", "hybrid")
+RRF_K = 60  # Reciprocal rank fusion constant for hybrid ranking
+DUPLICATES_SHOWN = 3
+
+
+def merge_content(existing: str, new: str) -> str:
+    """Combine two notes' content, keeping just one when it already contains the other"""
+    if " ".join(new.split()) in " ".join(existing.split()):
+        return existing
+    if " ".join(existing.split()) in " ".join(new.split()):
+        return new
+    return f"{existing.rstrip()}\n\n{new.strip()}"
+
+
 class BrainService:
-    def __init__(self):
-        self.data_dir = "data/notes"
+    """Notes with their search, vector and tag indexes.
+
+    With a storage backend that tracks changes, the indexes follow the
+    storage change log rather than this process's own writes, so several
+    processes can share one data directory: before each read or after each
+    write, changes committed by any process are applied. Only the primary
+    process writes the index files; the others open them read-only and keep
+    their updates in memory.
+    """
+
+    def __init__(self, data_dir: str = DATA_DIR, storage: Optional[NoteStorage] = None):
+        self.data_dir = data_dir
         self._ensure_data_directory()
+        self.storage = storage or create_storage(STORAGE_BACKEND, self.data_dir)
+        self._create_indexes()
+
+        # Decided on first use, so a process that never touches the indexes (e.g. a reloader) never claims them
+        self.read_only: Optional[bool] = None if self.storage.tracks_changes else False
+        # Position in the storage change log the indexes reflect; the index files were saved at this point or later
+        self.sync_path = os.path.join(self.data_dir, "index", "sync.json")
+        self.change_seq = self._load_change_seq()
+        self._seq_saved_at = 0.0
+        self._sync_lock = threading.Lock()
+
+        # Storage and index work runs on a bounded thread pool so it never blocks the event loop
+        self._executor = ThreadPoolExecutor(max_workers=BRAIN_IO_THREADS, thread_name_prefix="brain-io")
+        self._io_limit = asyncio.Semaphore(BRAIN_IO_CONCURRENCY)
+        self.scan_chunk_size = BRAIN_SCAN_CHUNK_SIZE
+
+    def _create_indexes(self):
+        """Index objects that load their files, or build them, on first use"""
+        self.search_index = SearchIndex(os.path.join(self.data_dir, "index"), self._iter_all_notes)
+        self.vector_index = VectorIndex(os.path.join(self.data_dir, "vectors"), self._iter_all_notes)
+        self.tag_index = TagIndex(os.path.join(self.data_dir, "index"), self._iter_all_notes)
+        self.time_index = TimeIndex(self.storage.iter_timestamps)
+        self.minhash_index = MinHashIndex(os.path.join(self.data_dir, "index"), self._iter_all_notes)
 
     def _ensure_data_directory(self):
         """Create data directory if it doesn't exist"""
         os.makedirs(self.data_dir, exist_ok=True)
 
-    def _get_note_path(self, note_id: str) -> str:
-        """Get the full path for a note file"""
-        return os.path.join(self.data_dir, f"{note_id}.json")
+    def _iter_all_notes(self):
+        """Yield every stored note"""
+        return self.storage.iter_notes()
 
-    async def save_note(self, title: str, content: str, tags: List[str] = [], metadata: Dict[str, Any] = {}) -> Note:
-        """Save a new note"""
+    async def _run(self, func, *args, **kwargs):
+        """Run a blocking call on the I/O pool, bounded by the concurrency limit"""
+        async with self._io_limit:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def _scan_notes(self, notes: Optional[Iterator[Note]] = None,
+                          chunk_size: Optional[int] = None) -> AsyncIterator[Note]:
+        """Yield every stored note (or those from ``notes``), reading and parsing them in chunks off the event loop"""
+        notes = self._iter_all_notes() if notes is None else notes
+        chunk_size = chunk_size or self.scan_chunk_size
+        while True:
+            chunk = await self._run(lambda: list(itertools.islice(notes, chunk_size)))
+            if not chunk:
+                return
+            for note in chunk:
+                yield note
+            # Let other requests run between chunks of a long scan
+            await asyncio.sleep(0)
+
+    def _load_change_seq(self) -> int:
+        try:
+            with open(self.sync_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get("seq", 0)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read index sync position, replaying the change log: {e}")
+            return 0
+
+    def _save_change_seq(self):
+        os.makedirs(os.path.dirname(self.sync_path), exist_ok=True)
+        tmp_path = f"{self.sync_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"seq": self.change_seq}, f)
+        os.replace(tmp_path, self.sync_path)
+        self._seq_saved_at = time.monotonic()
+
+    def _sync(self, written: Iterable[Note] = ()):
+        """Apply changes committed since the last sync, by any process, to the indexes.
+
+        ``written`` are notes this process has just stored, which need not
+        be read back from storage.
+        """
+        if not self.storage.tracks_changes:
+            return
+        known = {note.id: note for note in written}
+        with self._sync_lock:
+            if self.read_only is None:
+                self._claim_indexes()
+            while True:
+                changes = self.storage.changes_since(self.change_seq, limit=SYNC_BATCH_SIZE)
+                if not changes:
+                    return
+                fresh = {
+                    change.note_id: known[change.note_id] for change in changes
+                    if change.note_id in known and known[change.note_id].updated_at.isoformat() == change.updated_at
+                }
+                stale = [change.note_id for change in changes if not change.deleted and change.note_id not in fresh]
+                fresh.update((note.id, note) for note in self.storage.get_many(stale))
+                # A note missing from storage was deleted after this batch was read; its deletion comes next
+                notes = [fresh[change.note_id] for change in changes if change.note_id in fresh]
+                self._apply(notes, [change.note_id for change in changes if change.deleted])
+                self.change_seq = changes[-1].seq
+                if not self.read_only and time.monotonic() - self._seq_saved_at >= SYNC_SAVE_INTERVAL:
+                    self._save_change_seq()
+
+    def _claim_indexes(self):
+        """Decide whether this process writes the index files or only reads them"""
+        self.read_only = not is_primary_process(self.data_dir)
+        for index in (self.search_index, self.vector_index, self.tag_index, self.minhash_index):
+            index.read_only = self.read_only
+        index_files = (
+            self.search_index.files.snapshot_path, self.vector_index.rows_path, self.tag_index.files.snapshot_path,
+            self.minhash_index.files.snapshot_path,
+        )
+        if not self.read_only and not any(os.path.exists(path) for path in index_files + (self.sync_path,)):
+            # The indexes will be built from all current notes, so past changes need not be replayed
+            self.change_seq = self.storage.last_change_seq()
+            self._save_change_seq()
+
+    def _reclaim_indexes(self) -> bool:
+        """Start writing the index files after the primary exited; False if this process already decides them"""
+        with self._sync_lock:
+            if self.read_only is not True:
+                return False
+            # As on a restart: reopen the files the old primary left and replay the change log since they were saved
+            self._create_indexes()
+            self.change_seq = self._load_change_seq()
+            self.read_only = None
+        self._sync()
+        return not self.read_only
+
+    async def reclaim_indexes(self) -> bool:
+        """Take over writing the index files, for a worker that has just become the primary.
+
+        A worker that opened the indexes read-only keeps its changes in
+        memory, so without this no process would save them until a restart.
+        """
+        return await self._run(self._reclaim_indexes)
+
+    def _apply(self, notes: List[Note], removed: List[str]):
+        if notes:
+            self.search_index.add_notes(notes)
+            self.vector_index.add_notes(notes)
+            self.tag_index.add_notes(notes)
+            self.time_index.add_notes(notes)
+            self.minhash_index.add_notes(notes)
+        for note_id in removed:
+            self.search_index.remove_note(note_id)
+            self.vector_index.remove_note(note_id)
+            self.tag_index.remove_note(note_id)
+            self.time_index.remove_note(note_id)
+            self.minhash_index.remove_note(note_id)
+
+    def _indexed(self, notes: List[Note] = (), removed: List[str] = ()):
+        """Bring the indexes up to date after this process stored ``notes`` or deleted ``removed``"""
+        if self.storage.tracks_changes:
+            self._sync(notes)
+        else:
+            self._apply(list(notes), list(removed))
+
+    def _synced(self, func, *args, **kwargs):
+        """Call an index read after catching up with other processes' writes"""
+        self._sync()
+        return func(*args, **kwargs)
+
+    def _rank(self, query: str, mode: str) -> List[str]:
+        """Rank note ids for a query by keyword (BM25), semantic (cosine) or fused relevance"""
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        keyword = self.search_index.search(query) if mode != "semantic" else []
+        semantic = [
+            (note_id, score) for note_id, score in self.vector_index.search(query, limit=SEMANTIC_TOP_K)
+            if score >= SEMANTIC_MIN_SCORE
+        ] if mode != "keyword" else []
+        if mode != "hybrid":
+            return [note_id for note_id, _ in (keyword if mode == "keyword" else semantic)]
+
+        fused: Dict[str, float] = {}
+        for ranking in (keyword, semantic):
+            for rank, (note_id, _) in enumerate(ranking):
+                fused[note_id] = fused.get(note_id, 0.0) + 1 / (RRF_K + rank + 1)
+        return sorted(fused, key=fused.get, reverse=True)
+
+    def _insert_note(self, note: Note) -> Tuple[Note, List[Tuple[str, float]]]:
+        for attempt in range(MAX_ID_ATTEMPTS):
+            try:
+                self.storage.insert(note)
+                break
+            except NoteExistsError:
+                if attempt == MAX_ID_ATTEMPTS - 1:
+                    raise
+                note.id = generate_note_id()
+        self._indexed([note])
+        # Indexing signed the note, so finding its near-duplicates only probes its LSH buckets
+        duplicates = self.minhash_index.similar(note.id, limit=DUPLICATES_SHOWN)
+        if duplicates:
+            logger.info(f"Note {note.id} is a near-duplicate of {', '.join(note_id for note_id, _ in duplicates)}")
+        return note, duplicates
+
+    def _put_notes(self, notes: List[Note]) -> int:
+        # One storage transaction and one write per index for the whole batch
+        count = self.storage.put_many(notes)
+        self._indexed(notes)
+        return count
+
+    def _update_note(self, note_id: str, title: Optional[str], content: Optional[str],
+                     tags: Optional[List[str]], add_tags: Optional[List[str]] = None) -> Note:
+        note = self.storage.get(note_id)
+        if note is None:
+            raise FileNotFoundError(f"Note {note_id} not found")
+
+        if title:
+            note.title = title
+        if content:
+            note.content = content
+        if tags is not None:
+            note.tags = tags
+        if add_tags:
+            note.tags = list(dict.fromkeys(note.tags + add_tags))
+        note.updated_at = datetime.now()
+
+        self.storage.put(note)
+        self._indexed([note])
+        return note
+
+    def _merge_notes(self, source_id: str, target_id: str, replace: bool) -> Note:
+        if source_id == target_id:
+            raise ValueError("Cannot merge a note into itself")
+        source, target = self.storage.get(source_id), self.storage.get(target_id)
+        for note_id, note in ((source_id, source), (target_id, target)):
+            if note is None:
+                raise FileNotFoundError(f"Note {note_id} not found")
+
+        target.content = source.content if replace else merge_content(target.content, source.content)
+        target.tags = list(dict.fromkeys(target.tags + source.tags))
+        target.metadata = {**source.metadata, **target.metadata}
+        if "document" in source.metadata and "document" in target.metadata:
+            # The target keeps its own file; the source's stays reachable alongside it
+            target.metadata["merged_documents"] = (
+                target.metadata.get("merged_documents", []) + [source.metadata["document"]]
+                + source.metadata.get("merged_documents", [])
+            )
+        target.updated_at = datetime.now()
+        # One atomic write, so a crash cannot leave the merged note next to its source
+        self.storage.replace_many(put=[target], delete=[source_id])
+        self._indexed([target], [source_id])
+        return target
+
+    def _delete_note(self, note_id: str) -> bool:
+        if self.storage.delete(note_id):
+            self._indexed(removed=[note_id])
+            return True
+        return False
+
+    def stats(self) -> dict:
+        """Sizes of the in-memory indexes"""
+        return {
+            "indexed_notes": len(self.search_index.doc_lengths),
+            "index_terms": len(self.search_index.postings),
+            "vector_rows": len(self.vector_index.id_rows),
+            "vector_matrix_bytes": self.vector_index.matrix.nbytes if self.vector_index.matrix is not None else 0,
+            "tags": len(self.tag_index.postings),
+            "minhash_signatures": len(self.minhash_index.signatures),
+        }
+
+    def _candidate_ids(self, query: Optional[str], tags: Optional[List[str]], mode: Optional[str],
+                       since: Optional[str] = None, until: Optional[str] = None, date_field: str = "updated_at",
+                       limit: Optional[int] = None) -> Tuple[List[str], int]:
+        """The first ``limit`` ids matching the query (in rank order, otherwise newest first), tags and date range,
+        and the number of matches, from the indexes alone.
+
+        Without a query the time index walk stops at ``limit`` and the
+        matches are counted, not listed.
+        """
+        self._sync()
+        if query:
+            ranked = self._rank(query, mode or SEARCH_MODE)
+            if tags:
+                ranked = self.tag_index.filter(ranked, tags)
+            if since or until:
+                ranked = self.time_index.filter(ranked, date_field, since, until)
+            return (ranked[:limit] if limit else ranked), len(ranked)
+        candidates = self.tag_index.match(tags) if tags else None
+        ids = self.time_index.newest(candidates, date_field, since, until, limit=limit)
+        total = len(ids) if not limit or len(ids) < limit else self.time_index.count(candidates, date_field, since, until)
+        return ids, total
+
+    def _recent_ids(self, tags: Optional[List[str]], since: Optional[str], until: Optional[str], date_field: str,
+                    before: Optional[Tuple[str, str]], limit: Optional[int]) -> List[str]:
+        """Ids of matching notes newest first by (updated_at, id) after ``before``, stopping at ``limit``"""
+        self._sync()
+        candidates = self.tag_index.match(tags) if tags else None
+        return self.time_index.newest(candidates, date_field, since, until, before, limit)
+
+    def _ranked_ids(self, query: str, tags: Optional[List[str]], mode: Optional[str], since: Optional[str],
+                    until: Optional[str], date_field: str, offset: int, limit: Optional[int]) -> List[str]:
+        """Ids of matching notes in rank order, skipping the first ``offset``"""
+        ids, _ = self._candidate_ids(query, tags, mode, since, until, date_field)
+        return ids[offset:offset + limit] if limit else ids[offset:]
+
+    async def _load_notes(self, note_ids: List[str]) -> List[Note]:
+        notes = []
+        for start in range(0, len(note_ids), self.scan_chunk_size):
+            notes.extend(await self._run(self.storage.get_many, note_ids[start:start + self.scan_chunk_size]))
+        return notes
+
+    @timed(BRAIN_LATENCY, BRAIN_ERRORS, "list_tags")
+    async def list_tags(self, prefix: Optional[str] = None, tags: Optional[List[str]] = None,
+                        limit: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Tag facet counts, optionally narrowed to a prefix or to notes carrying ``tags``"""
+        return await self._run(self._synced, self.tag_index.facets, tags=tags, prefix=prefix, limit=limit)
+
+    @timed(BRAIN_LATENCY, BRAIN_ERRORS, "top_tags")
+    async def top_tags(self, limit: int = 20) -> List[str]:
+        """The most used tags, for prompting the LLM to reuse existing ones"""
+        return await self._run(self._synced, self.tag_index.top_tags, limit)
+
+    @timed(BRAIN_LATENCY, BRAIN_ERRORS, "save_note")
+    async def save_note_checked(self, title: str, content: str, tags: List[str] = [],
+                                metadata: Dict[str, Any] = {}) -> Tuple[Note, List[Tuple[Note, float]]]:
+        """Save a new note, returning it with the existing notes it nearly duplicates.
+
+        Near-duplicates are found through the MinHash index and come with
+        their estimated similarity, most similar first.
+        """
         try:
             note = Note(
-                id=datetime.now().strftime("%Y%m%d_%H%M%S"),
+                id=generate_note_id(),
                 title=title,
                 content=content,
                 tags=tags,
                 metadata=metadata
             )
-            
-            with open(self._get_note_path(note.id), 'w', encoding='utf-8') as f:
-                json.dump(note.dict(), f, default=str)
-            
-            return note
+            note, duplicates = await self._run(self._insert_note, note)
+            loaded = {found.id: found for found in await self._load_notes([note_id for note_id, _ in duplicates])}
+            return note, [(loaded[note_id], score) for note_id, score in duplicates if note_id in loaded]
         except Exception as e:
             logger.error(f"Error saving note: {e}")
             raise
 
-    async def update_note(self, note_id: str, title: Optional[str] = None, 
-                         content: Optional[str] = None, tags: Optional[List[str]] = None) -> Note:
-        """Update an existing note"""
+    async def save_note(self, title: str, content: str, tags: List[str] = [], metadata: Dict[str, Any] = {}) -> Note:
+        """Save a new note; see ``save_note_checked`` for its near-duplicates"""
+        note, _ = await self.save_note_checked(title, content, tags, metadata)
+        return note
+
+    @timed(BRAIN_LATENCY, BRAIN_ERRORS, "save_notes")
+    async def save_notes(self, notes: List[Note]) -> int:
+        """Store a batch of notes, replacing any with the same id, and index them together"""
+        for note in notes:
+            if not note.id:
+                note.id = generate_note_id()
         try:
-            note_path = self._get_note_path(note_id)
-            if not os.path.exists(note_path):
-                raise FileNotFoundError(f"Note {note_id} not found")
+            return await self._run(self._put_notes, notes)
+        except Exception as e:
+            logger.error(f"Error saving notes: {e}")
+            raise
+
+    async def iter_changed(self, since: Optional[str] = None, until: Optional[str] = None) -> AsyncIterator[Note]:
+        """Yield notes changed after ``since`` up to ``until``, oldest change first"""
+        async for note in self._scan_notes(self.storage.iter_changed(since, until)):
+            yield note
 
-            with open(note_path, 'r', encoding='utf-8') as f:
-                note_data = json.load(f)
-                
-            note = Note(**note_data)
-            if title:
-                note.title = title
-            if content:
-                note.content = content
-            if tags is not None:
-                note.tags = tags
-            note.updated_at = datetime.now()
-
-            with open(note_path, 'w', encoding='utf-8') as f:
-                json.dump(note.dict(), f, default=str)
-
-            return note
+    async def iter_change_log(self, since_seq: int, until_seq: int) -> AsyncIterator[Tuple[str, Optional[Note]]]:
+        """Yield (note id, note) for notes changed between two change log positions, in commit order.
+
+        Deleted notes, including those merged into another, come with None.
+        Only for storage that tracks changes.
+        """
+        async for change, note in self._scan_notes(self.storage.iter_change_log(since_seq, until_seq)):
+            yield change.note_id, note
+
+    @timed(BRAIN_LATENCY, BRAIN_ERRORS, "update_note")
+    async def update_note(self, note_id: str, title: Optional[str] = None, content: Optional[str] = None,
+                          tags: Optional[List[str]] = None, add_tags: Optional[List[str]] = None) -> Note:
+        """Update an existing note; ``tags`` replaces its tags, ``add_tags`` adds to them"""
+        try:
+            return await self._run(self._update_note, note_id, title, content, tags, add_tags)
         except Exception as e:
             logger.error(f"Error updating note: {e}")
             raise
 
+    @timed(BRAIN_LATENCY, BRAIN_ERRORS, "merge_notes")
+    async def merge_notes(self, source_id: str, target_id: str, replace: bool = False) -> Note:
+        """Fold one note into another and delete it.
+
+        The target keeps its title and gains the source's tags. Its content
+        is combined with the source's, or with ``replace`` becomes the
+        source's content.
+        """
+        try:
+            return await self._run(self._merge_notes, source_id, target_id, replace)
+        except Exception as e:
+            logger.error(f"Error merging notes: {e}")
+            raise
+
+    @timed(BRAIN_LATENCY, BRAIN_ERRORS, "delete_note")
     async def delete_note(self, note_id: str) -> bool:
         """Delete a note"""
         try:
-            note_path = self._get_note_path(note_id)
-            if os.path.exists(note_path):
-                os.remove(note_path)
-                return True
-            return False
+            return await self._run(self._delete_note, note_id)
         except Exception as e:
             logger.error(f"Error deleting note: {e}")
             raise
 
+    @timed(BRAIN_LATENCY, BRAIN_ERRORS, "get_note")
     async def get_note(self, note_id: str) -> Optional[Note]:
         """Retrieve a specific note"""
         try:
-            note_path = self._get_note_path(note_id)
-            if not os.path.exists(note_path):
-                return None
-
-            with open(note_path, 'r', encoding='utf-8') as f:
-                note_data = json.load(f)
-                return Note(**note_data)
+            return await self._run(self.storage.get, note_id)
         except Exception as e:
             logger.error(f"Error retrieving note: {e}")
             raise
 
-    async def search_notes(self, query: str = None, tags: List[str] = None) -> List[Note]:
-        """Search notes by content and/or tags"""
-        try:
-            notes = []
-            for filename in os.listdir(self.data_dir):
-                if not filename.endswith('.json'):
-                    continue
+    @timed(BRAIN_LATENCY, BRAIN_ERRORS, "find_notes")
+    async def find_notes(self, query: str = None, tags: List[str] = None, mode: str = None,
+                         since: Optional[str] = None, until: Optional[str] = None, date_field: str = "updated_at",
+                         limit: Optional[int] = None) -> Tuple[List[Note], int]:
+        """Search notes, returning the first ``limit`` matches and the total number of matches.
 
-                with open(os.path.join(self.data_dir, filename), 'r', encoding='utf-8') as f:
-                    note_data = json.load(f)
-                    note = Note(**note_data)
+        With a query, matches are ranked by relevance using ``mode``: keyword
+        (inverted index), semantic (embeddings) or hybrid (both, fused).
+        Without one, they are newest first. ``since`` and ``until`` (ISO
+        dates or datetimes, inclusive) restrict ``date_field``, either
+        ``created_at`` or ``updated_at``. Matches are resolved from the
+        indexes, so only the returned notes are read from storage.
+        """
+        try:
+            since, until = time_bound(since), time_bound(until, upper=True)
+            ids, total = await self._run(self._candidate_ids, query, tags, mode, since, until, date_field, limit)
+            return await self._load_notes(ids), total
+        except Exception as e:
+            logger.error(f"Error searching notes: {e}")
+            raise
 
-                    # Filter by query
-                    if query and query.lower() not in note.title.lower() and query.lower() not in note.content.lower():
-                        continue
+    @timed(BRAIN_LATENCY, BRAIN_ERRORS, "search_notes")
+    async def search_notes(self, query: str = None, tags: List[str] = None, mode: str = None,
+                           since: Optional[str] = None, until: Optional[str] = None, date_field: str = "updated_at",
+                           limit: Optional[int] = None) -> List[Note]:
+        """Search notes by content, tags and date range; see ``find_notes``"""
+        notes, _ = await self.find_notes(query, tags, mode, since, until, date_field, limit)
+        return notes
 
-                    # Filter by tags
-                    if tags and not all(tag in note.tags for tag in tags):
-                        continue
+    async def iter_notes(self, query: str = None, tags: List[str] = None, mode: str = None,
+                         before: Optional[Tuple[str, str]] = None, limit: Optional[int] = None,
+                         since: Optional[str] = None, until: Optional[str] = None,
+                         date_field: str = "updated_at", offset: int = 0) -> AsyncIterator[Note]:
+        """Yield matching notes newest first by (updated_at, id), after the ``before`` cursor.
 
-                    notes.append(note)
+        With a query they come in rank order instead, as in ``find_notes``,
+        and pages are taken by ``offset`` into the ranking. Filtered
+        listings walk the time index and stop at ``limit``, so only the
+        requested page is read. Without any filter the limit is pushed down
+        into the storage scan instead.
+        """
+        if query or tags or since or until:
+            since, until = time_bound(since), time_bound(until, upper=True)
+            if query:
+                ids = await self._run(self._ranked_ids, query, tags, mode, since, until, date_field, offset, limit)
+            else:
+                ids = await self._run(self._recent_ids, tags, since, until, date_field, before, limit)
+            for start in range(0, len(ids), self.scan_chunk_size):
+                for note in await self._run(self.storage.get_many, ids[start:start + self.scan_chunk_size]):
+                    yield note
+            return
 
-            return sorted(notes, key=lambda x: x.updated_at, reverse=True)
-        except Exception as e:
-            logger.error(f"Error searching notes: {e}")
-            raise
+        chunk_size = min(limit, self.scan_chunk_size) if limit else None
+        count = 0
+        async for note in self._scan_notes(self.storage.iter_recent(before), chunk_size):
+            yield note
+            count += 1
+            if limit and count >= limit:
+                return
 
-brain_service = BrainService()
\ No newline at end of file
+brain_service = BrainService()
@@ -0,0 +1,314 @@
+import argparse
+import asyncio
+import gzip
+import itertools
+import json
+import os
+import re
+import tarfile
+import zipfile
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from pydantic import ValidationError
+from app.api.models import Note
+import logging
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 500
+EXPORT_CHUNK_BYTES = 64 * 1024
+MARKDOWN_SUFFIXES = (".md", ".markdown")
+FRONT_MATTER = re.compile(r"\A---[ \t]*\r?\n(.*?)\r?\n---[ \t]*(?:\r?\n|\Z)", re.DOTALL)
+
+
+def _scalar(value: str):
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+        return value[1:-1]
+    return value
+
+
+def parse_front_matter(text: str) -> Tuple[Dict[str, object], str]:
+    """Split Markdown into its front-matter fields and body.
+
+    Supports the flat YAML subset notes use in practice: ``key: value``,
+    inline lists (``tags: [a, b]``) and block lists (``- item`` lines).
+    """
+    match = FRONT_MATTER.match(text)
+    if not match:
+        return {}, text
+    fields: Dict[str, object] = {}
+    key = None
+    for line in match.group(1).splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        if stripped.startswith("- ") and key is not None:
+            if not isinstance(fields.get(key), list):
+                fields[key] = []
+            fields[key].append(_scalar(stripped[2:]))
+            continue
+        key, _, value = stripped.partition(":")
+        key, value = key.strip(), value.strip()
+        if value.startswith("[") and value.endswith("]"):
+            fields[key] = [_scalar(item) for item in value[1:-1].split(",") if item.strip()]
+        else:
+            fields[key] = _scalar(value) if value else None
+    return fields, text[match.end():]
+
+
+def markdown_record(text: str, name: str) -> dict:
+    """Build an import record from a Markdown file; the title falls back to the first heading, then the file name"""
+    fields, body = parse_front_matter(text)
+    body = body.strip()
+    if not fields.get("title"):
+        heading = re.match(r"#\s+(.+)\n?", body)
+        if heading:
+            fields["title"] = heading.group(1).strip()
+            body = body[heading.end():].strip()
+        else:
+            fields["title"] = os.path.splitext(os.path.basename(name))[0]
+    fields["content"] = body
+    metadata = fields.get("metadata") or {}
+    if not isinstance(metadata, dict):
+        raise ValueError(f"metadata must be a mapping, not {type(metadata).__name__}")
+    fields["metadata"] = {**metadata, "source": name}
+    return fields
+
+
+def _markdown_file(read: Callable[[], bytes], name: str) -> dict:
+    """Read and parse one Markdown file; one that cannot be becomes an ``_error`` record so it is counted, not fatal"""
+    try:
+        return markdown_record(read().decode("utf-8"), name)
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        return {"_error": f"{name}: {e}"}
+
+
+def note_from_record(record: dict) -> Note:
+    """Validate an import record as a Note; unknown fields are kept in ``metadata``"""
+    known = {key: value for key, value in record.items() if key in Note.model_fields and value is not None}
+    extra = {key: value for key, value in record.items() if key not in Note.model_fields}
+    if isinstance(known.get("tags"), str):
+        known["tags"] = [tag.strip() for tag in known["tags"].split(",") if tag.strip()]
+    if extra:
+        known["metadata"] = {**extra, **known.get("metadata", {})}
+    return Note(**known)
+
+
+def _parse_line(line: bytes, number: int) -> Optional[dict]:
+    """Parse one JSONL line; malformed lines become an ``_error`` record so they are counted, not fatal"""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        record = json.loads(line.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        return {"_error": f"line {number}: {e}"}
+    if not isinstance(record, dict):
+        return {"_error": f"line {number}: expected an object, got {type(record).__name__}"}
+    return record
+
+
+def iter_jsonl_lines(lines: Iterable[bytes]) -> Iterator[dict]:
+    for number, line in enumerate(lines, 1):
+        record = _parse_line(line, number)
+        if record is not None:
+            yield record
+
+
+def iter_source(path: str) -> Iterator[dict]:
+    """Stream import records from JSONL (optionally gzipped), a Markdown directory, or a zip/tar archive of Markdown"""
+    lower = path.lower()
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(MARKDOWN_SUFFIXES):
+                    full_path = os.path.join(root, name)
+
+                    def read(full_path=full_path):
+                        with open(full_path, 'rb') as f:
+                            return f.read()
+                    yield _markdown_file(read, os.path.relpath(full_path, path))
+    elif lower.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if info.filename.lower().endswith(MARKDOWN_SUFFIXES):
+                    yield _markdown_file(lambda: archive.read(info), info.filename)
+    elif lower.endswith((".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")):
+        # Stream mode reads members in order without loading the archive index
+        with tarfile.open(path, "r|*") as archive:
+            for member in archive:
+                if member.isfile() and member.name.lower().endswith(MARKDOWN_SUFFIXES):
+                    yield _markdown_file(lambda: archive.extractfile(member).read(), member.name)
+    else:
+        # Lines are decoded one at a time, so a bad byte sequence only fails its own record
+        opener = gzip.open if lower.endswith(".gz") else open
+        with opener(path, 'rb') as f:
+            yield from iter_jsonl_lines(f)
+
+
+async def iter_in_thread(records: Iterator[dict], chunk_size: int = IMPORT_BATCH_SIZE) -> AsyncIterator[dict]:
+    """Read a blocking iterator in chunks off the event loop"""
+    while True:
+        chunk = await asyncio.to_thread(lambda: list(itertools.islice(records, chunk_size)))
+        if not chunk:
+            return
+        for record in chunk:
+            yield record
+
+
+async def iter_request_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[dict]:
+    """Parse a streamed JSONL body, transparently gunzipping it"""
+    decompressor = None
+    buffer = b""
+    number = 0
+    async for chunk in chunks:
+        if decompressor is None:
+            # 47 = auto-detect gzip or zlib headers
+            decompressor = zlib.decompressobj(47) if chunk[:2] == b"\x1f\x8b" else False
+        buffer += decompressor.decompress(chunk) if decompressor else chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            number += 1
+            record = _parse_line(line, number)
+            if record is not None:
+                yield record
+    if decompressor:
+        buffer += decompressor.flush()
+    record = _parse_line(buffer, number + 1)
+    if record is not None:
+        yield record
+
+
+async def import_notes(brain, records: AsyncIterator[dict], batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    """Validate records and save them in batches, so storage and index writes are amortized.
+
+    Only one batch is held in memory. Records with an existing id replace
+    that note, and ``{"id": ..., "deleted": true}`` tombstones from an
+    incremental export delete it. Invalid records are counted and skipped.
+    """
+    result = {"imported": 0, "deleted": 0, "failed": 0, "errors": []}
+    batch: List[Note] = []
+
+    async def flush():
+        if batch:
+            result["imported"] += await brain.save_notes(batch)
+            batch.clear()
+
+    number = 0
+    async for record in records:
+        number += 1
+        try:
+            if "_error" in record:
+                raise ValueError(record["_error"])
+            if record.get("deleted") is True:
+                if not record.get("id"):
+                    raise ValueError("deletion without an id")
+                await flush()  # Applied after the records before it, in export order
+                result["deleted"] += int(await brain.delete_note(str(record["id"])))
+                continue
+            batch.append(note_from_record(record))
+        except (ValueError, TypeError, ValidationError) as e:
+            result["failed"] += 1
+            if len(result["errors"]) < 20:
+                result["errors"].append(f"record {number}: {e}")
+            continue
+        if len(batch) >= batch_size:
+            await flush()
+    await flush()
+    return result
+
+
+def export_watermark(brain) -> str:
+    """Upper bound for an export; pass it as ``since`` next time to get only later changes.
+
+    With storage that tracks changes it is a position in the change log,
+    so notes imported with old timestamps and deletions are picked up too.
+    Otherwise it is the current time, compared with ``updated_at``.
+    """
+    if brain.storage.tracks_changes:
+        return str(brain.storage.last_change_seq())
+    return datetime.now().isoformat()
+
+
+def iter_export(brain, since: Optional[str], until: str) -> AsyncIterator[dict]:
+    """Export records for notes changed after the ``since`` watermark up to ``until``.
+
+    Incremental exports include a ``{"id": ..., "deleted": true}``
+    tombstone for each note deleted or merged into another since, which
+    ``import_notes`` applies as a deletion. Raises ValueError for a
+    ``since`` that is not a watermark of this storage.
+    """
+    if not brain.storage.tracks_changes:
+        return (note.model_dump(mode="json") async for note in brain.iter_changed(since, until))
+    if since is not None and not since.isdigit():
+        raise ValueError(f"Invalid export watermark: {since!r}; pass the watermark of a previous export")
+
+    async def records():
+        async for note_id, note in brain.iter_change_log(int(since or 0), int(until)):
+            if note is not None:
+                yield note.model_dump(mode="json")
+            elif since is not None:
+                yield {"id": note_id, "deleted": True}
+    return records()
+
+
+async def export_jsonl_gz(records: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    """Stream export records as gzip-compressed JSONL"""
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip container
+    pending = []
+    size = 0
+    async for record in records:
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        pending.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            data = compressor.compress(b"".join(pending))
+            pending, size = [], 0
+            if data:
+                yield data
+    yield compressor.compress(b"".join(pending)) + compressor.flush()
+
+
+async def _run_cli(args):
+    from app.services.brain_service import brain_service
+
+    if args.command == "import":
+        result = await import_notes(
+            brain_service, iter_in_thread(iter_source(args.source), args.batch_size), args.batch_size
+        )
+        for error in result["errors"]:
+            logger.warning(error)
+        print(f"Imported {result['imported']} notes, deleted {result['deleted']} ({result['failed']} failed) "
+              f"from {args.source}")
+    else:
+        until = export_watermark(brain_service)
+        counts = {"notes": 0, "deleted": 0}
+
+        async def counted():
+            async for record in iter_export(brain_service, args.since, until):
+                counts["deleted" if record.get("deleted") else "notes"] += 1
+                yield record
+
+        with open(args.output, 'wb') as f:
+            async for data in export_jsonl_gz(counted()):
+                f.write(data)
+        print(f"Exported {counts['notes']} notes and {counts['deleted']} deletions to {args.output}; "
+              f"next incremental export: --since {until}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import and export of notes")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="Import JSONL(.gz), a Markdown directory, or a zip/tar of Markdown")
+    import_parser.add_argument("source")
+    import_parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    export_parser = commands.add_parser("export", help="Export notes as gzip-compressed JSONL")
+    export_parser.add_argument("output")
+    export_parser.add_argument("--since", help="Only notes changed after a previous export's watermark")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run_cli(args))
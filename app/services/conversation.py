@@ -1,22 +1,372 @@
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict, deque
 from datetime import datetime
-from typing import Dict
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set
+from app.config import (
+    DATA_DIR, CONVERSATION_HISTORY_SIZE, CONVERSATION_MAX_CHATS, CONVERSATION_MAX_BYTES,
+    CONVERSATION_IDLE_SECONDS, CONVERSATION_SPILL, CONVERSATION_SUMMARY_BATCH, SHARED_STATE
+)
+from app.services.metrics import CONVERSATION_EVENTS
+import logging
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_OVERHEAD_BYTES = 200  # Rough per-message cost of the dict, keys and timestamp
+MAX_UNSUMMARIZED_BATCHES = 4
+MAX_COMMIT_ATTEMPTS = 3
+
+# Folds messages that left the history window into the chat's previous summary
+Summarizer = Callable[[Optional[str], List[dict]], Awaitable[str]]
+
+
+def _message_size(message: dict) -> int:
+    return MESSAGE_OVERHEAD_BYTES + sys.getsizeof(message["content"])
+
+
+class ConversationSpill:
+    """Compact on-disk store for conversations evicted from memory.
+
+    Also serves as the shared store when several processes serve the same
+    chats: every row carries a version, and ``save`` with an expected
+    version only succeeds if no other process saved the chat in between.
+    """
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        # Also used from threads, one at a time under ConversationState's lock
+        self._conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations "
+            "(chat_id INTEGER PRIMARY KEY, data BLOB NOT NULL, version INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(conversations)")}
+        if "version" not in columns:
+            self._conn.execute("ALTER TABLE conversations ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    def save(self, chat_id: int, state: dict, expected_version: Optional[int] = None) -> Optional[int]:
+        """Store a chat; with ``expected_version``, return its new version, or None if that is out of date"""
+        data = zlib.compress(json.dumps(state).encode("utf-8"))
+        if expected_version is None:
+            self._conn.execute(
+                "INSERT INTO conversations (chat_id, data) VALUES (?, ?) "
+                "ON CONFLICT (chat_id) DO UPDATE SET data = excluded.data, version = version + 1",
+                (chat_id, data)
+            )
+            return None
+        if expected_version == 0:
+            cursor = self._conn.execute(
+                "INSERT INTO conversations (chat_id, data, version) VALUES (?, ?, 1) ON CONFLICT (chat_id) DO NOTHING",
+                (chat_id, data)
+            )
+        else:
+            cursor = self._conn.execute(
+                "UPDATE conversations SET data = ?, version = version + 1 WHERE chat_id = ? AND version = ?",
+                (data, chat_id, expected_version)
+            )
+        return expected_version + 1 if cursor.rowcount == 1 else None
+
+    def version(self, chat_id: int) -> int:
+        """Version of a stored chat, 0 if it is not stored"""
+        row = self._conn.execute("SELECT version FROM conversations WHERE chat_id = ?", (chat_id,)).fetchone()
+        return row[0] if row else 0
+
+    def load(self, chat_id: int, keep: bool = False) -> Optional[dict]:
+        """Return a stored conversation (with its ``version``), removing it unless ``keep``"""
+        row = self._conn.execute("SELECT data, version FROM conversations WHERE chat_id = ?", (chat_id,)).fetchone()
+        if row is None:
+            return None
+        if not keep:
+            self._conn.execute("DELETE FROM conversations WHERE chat_id = ?", (chat_id,))
+        state = json.loads(zlib.decompress(row[0]))
+        # Older spills stored only the message list
+        state = {"messages": state} if isinstance(state, list) else state
+        state["version"] = row[1]
+        return state
+
+    def count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
 
 class ConversationState:
-    def __init__(self):
-        self.conversations: Dict[int, list] = {}
-        
-    def add_message(self, user_id: int, role: str, content: str, message_type: str = "text"):
-        if user_id not in self.conversations:
-            self.conversations[user_id] = []
-        
-        self.conversations[user_id].append({
+    """Recent messages per chat, bounded in memory.
+
+    Each chat keeps a ring buffer of its last ``history_size`` messages.
+    Whole chats are evicted least-recently-used first when the chat count
+    or approximate memory budget is exceeded, or when they have been idle
+    for ``idle_seconds``. With a spill store, evicted chats are written to
+    disk and reloaded on the chat's next message.
+
+    With a ``summarizer``, messages pushed out of a chat's ring buffer are
+    folded into a rolling summary of the chat, in the background once
+    ``summary_batch`` of them have accumulated.
+
+    With ``shared``, the spill store is the source of truth for processes
+    serving the same chats: every change is written through to it, and a
+    chat is reloaded whenever another process has saved a newer version.
+
+    With a spill store, the async methods run in a thread, so its disk
+    I/O, and waits on other processes' writes, never block the event loop.
+    """
+
+    def __init__(self, history_size: int = CONVERSATION_HISTORY_SIZE, max_chats: int = CONVERSATION_MAX_CHATS,
+                 max_bytes: int = CONVERSATION_MAX_BYTES, idle_seconds: float = CONVERSATION_IDLE_SECONDS,
+                 spill: Optional[ConversationSpill] = None, summarizer: Optional[Summarizer] = None,
+                 summary_batch: int = CONVERSATION_SUMMARY_BATCH, shared: bool = False):
+        if shared and spill is None:
+            raise ValueError("Shared conversation state needs a spill store")
+        self.history_size = history_size
+        self.max_chats = max_chats
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.spill = spill
+        self.summarizer = summarizer
+        self.summary_batch = summary_batch
+        self.shared = shared
+
+        self.conversations: "OrderedDict[int, Deque[dict]]" = OrderedDict()
+        self.last_active: Dict[int, float] = {}
+        self.chat_bytes: Dict[int, int] = {}
+        self.summaries: Dict[int, str] = {}
+        self.unsummarized: Dict[int, List[dict]] = {}
+        self.versions: Dict[int, int] = {}
+        self._summarizing: Set[int] = set()
+        self._background: Set[asyncio.Task] = set()
+        self.total_bytes = 0
+        self.counters = Counter()
+        self._lock = threading.RLock()
+
+    def _count(self, event: str):
+        self.counters[event] += 1
+        CONVERSATION_EVENTS.labels(event).inc()
+
+    async def _offload(self, func, *args):
+        # Any call may read or write the spill store, which is SQLite on disk
+        if self.spill is not None:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    def _get(self, user_id: int) -> Optional[Deque[dict]]:
+        messages = self.conversations.get(user_id)
+        if messages is not None and self.shared and self.spill.version(user_id) != self.versions.get(user_id, 0):
+            # Another process changed the chat since it was cached here
+            self._forget(user_id)
+            self._count("refreshed")
+            messages = None
+        if messages is None and self.spill is not None:
+            spilled = self.spill.load(user_id, keep=self.shared)
+            if spilled is not None:
+                self._count("reloaded")
+                self.versions[user_id] = spilled["version"]
+                messages = deque(spilled["messages"], maxlen=self.history_size)
+                self.conversations[user_id] = messages
+                if spilled.get("summary"):
+                    self.summaries[user_id] = spilled["summary"]
+                if spilled.get("unsummarized"):
+                    self.unsummarized[user_id] = spilled["unsummarized"]
+                self.chat_bytes[user_id] = self._chat_size(user_id)
+                self.total_bytes += self.chat_bytes[user_id]
+                self.last_active[user_id] = time.monotonic()
+                self._enforce_budget()
+        if messages is not None:
+            self.conversations.move_to_end(user_id)
+            self.last_active[user_id] = time.monotonic()
+        return messages
+
+    def _chat_size(self, user_id: int) -> int:
+        messages = list(self.conversations.get(user_id, ())) + self.unsummarized.get(user_id, [])
+        summary = self.summaries.get(user_id)
+        return (sys.getsizeof(summary) if summary else 0) + sum(_message_size(m) for m in messages)
+
+    def _resize(self, user_id: int):
+        size = self._chat_size(user_id)
+        self.total_bytes += size - self.chat_bytes.get(user_id, 0)
+        self.chat_bytes[user_id] = size
+
+    def _state(self, user_id: int) -> dict:
+        return {
+            "messages": list(self.conversations[user_id]),
+            "summary": self.summaries.get(user_id),
+            "unsummarized": self.unsummarized.get(user_id),
+        }
+
+    def _forget(self, user_id: int):
+        """Drop a chat from memory without saving it"""
+        self.conversations.pop(user_id, None)
+        self.summaries.pop(user_id, None)
+        self.unsummarized.pop(user_id, None)
+        self.versions.pop(user_id, None)
+        self.last_active.pop(user_id, None)
+        self.total_bytes -= self.chat_bytes.pop(user_id, 0)
+
+    def _commit(self, user_id: int) -> bool:
+        """Write a changed chat through to the shared store; False if another process changed it first"""
+        if not self.shared:
+            return True
+        version = self.spill.save(user_id, self._state(user_id), self.versions.get(user_id, 0))
+        if version is None:
+            self._forget(user_id)
+            self._count("conflicts")
+            return False
+        self.versions[user_id] = version
+        return True
+
+    def _evict(self, user_id: int):
+        state = self._state(user_id)
+        self._forget(user_id)
+        self._count("evicted")
+        # A shared store already holds the latest state
+        if self.spill is not None and not self.shared:
+            self.spill.save(user_id, state)
+            self._count("spilled")
+
+    def _enforce_budget(self):
+        now = time.monotonic()
+        # The OrderedDict is in recency order, so idle and LRU chats are at the front
+        while self.conversations:
+            oldest = next(iter(self.conversations))
+            over_budget = len(self.conversations) > self.max_chats or self.total_bytes > self.max_bytes
+            idle = now - self.last_active.get(oldest, now) > self.idle_seconds
+            if not (over_budget or idle) or len(self.conversations) == 1 and not idle:
+                break
+            self._evict(oldest)
+
+    @staticmethod
+    def _message(role: str, content: str, message_type: str) -> dict:
+        return {
             "role": role,
             "content": content,
             "type": message_type,
             "timestamp": datetime.now().isoformat()
-        })
-        
-    def get_conversation_history(self, user_id: int, max_messages: int = 10) -> list:
-        return self.conversations.get(user_id, [])[-max_messages:]
+        }
+
+    def _add(self, user_id: int, message: dict) -> bool:
+        """Append and save a message; True if the chat has a batch of messages to summarize"""
+        with self._lock:
+            for attempt in range(MAX_COMMIT_ATTEMPTS):
+                self._append(user_id, message)
+                if self._commit(user_id):
+                    break
+            else:
+                logger.warning(f"Could not save message for chat {user_id}: it kept changing in other processes")
+                return False
+            due = len(self.unsummarized.get(user_id, ())) >= self.summary_batch
+            self._enforce_budget()
+            return due
+
+    def add_message(self, user_id: int, role: str, content: str, message_type: str = "text"):
+        if self._add(user_id, self._message(role, content, message_type)):
+            self._schedule_summary(user_id)
+
+    async def add_message_async(self, user_id: int, role: str, content: str, message_type: str = "text"):
+        if await self._offload(self._add, user_id, self._message(role, content, message_type)):
+            self._schedule_summary(user_id)
+
+    def _append(self, user_id: int, message: dict):
+        messages = self._get(user_id)
+        if messages is None:
+            messages = self.conversations[user_id] = deque(maxlen=self.history_size)
+            self.last_active[user_id] = time.monotonic()
+            self.chat_bytes[user_id] = 0
+
+        if len(messages) == messages.maxlen:
+            dropped = messages[0]
+            if self.summarizer is not None:
+                # Kept (and still counted) until folded into the summary
+                pending = self.unsummarized.setdefault(user_id, [])
+                pending.append(dropped)
+                # If the summarizer is failing or behind, forget the oldest instead of growing without bound
+                dropped = pending.pop(0) if len(pending) > MAX_UNSUMMARIZED_BATCHES * self.summary_batch else None
+            if dropped is not None:
+                self.chat_bytes[user_id] -= _message_size(dropped)
+                self.total_bytes -= _message_size(dropped)
+
+        messages.append(message)
+        size = _message_size(message)
+        self.chat_bytes[user_id] += size
+        self.total_bytes += size
+
+    def _schedule_summary(self, user_id: int):
+        if user_id in self._summarizing:
+            return
+        try:
+            task = asyncio.get_running_loop().create_task(self._refresh_summary(user_id))
+        except RuntimeError:
+            return  # No event loop (e.g. a script); retried on the next message
+        self._summarizing.add(user_id)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _refresh_summary(self, user_id: int):
+        batch = list(self.unsummarized.get(user_id, []))
+        try:
+            summary = await self.summarizer(self.summaries.get(user_id), batch)
+        except Exception as e:
+            logger.warning(f"Could not summarize conversation {user_id}: {e}")
+            self._count("summary_errors")
+            return
+        finally:
+            self._summarizing.discard(user_id)
+        await self._offload(self._apply_summary, user_id, batch, summary)
+
+    def _apply_summary(self, user_id: int, batch: List[dict], summary: str):
+        with self._lock:
+            if self.shared:
+                self._get(user_id)  # Another process may have changed the chat meanwhile
+            if user_id not in self.conversations:
+                return  # Evicted meanwhile; the batch was spilled with the chat and is summarized after reload
+            pending = self.unsummarized.get(user_id, [])
+            if not batch or batch[-1] not in pending:
+                return  # Already summarized by another process
+            self.summaries[user_id] = summary
+            # Messages dropped while the summary was generated stay pending for the next refresh
+            remaining = pending[pending.index(batch[-1]) + 1:]
+            if remaining:
+                self.unsummarized[user_id] = remaining
+            else:
+                self.unsummarized.pop(user_id, None)
+            self._resize(user_id)
+            if self._commit(user_id):
+                self._count("summaries")
+
+    def get_summary(self, user_id: int) -> Optional[str]:
+        return self.summaries.get(user_id)
+
+    def get_conversation_history(self, user_id: int, max_messages: int = 10, include_summary: bool = True) -> list:
+        """Recent messages, oldest first, preceded by the chat's summary message if it has one"""
+        with self._lock:
+            messages = self._get(user_id)
+            if not messages:
+                return []
+            history = list(messages)[-max_messages:]
+            summary = self.summaries.get(user_id)
+        if include_summary and summary:
+            history.insert(0, {"role": "system", "content": summary, "type": "summary"})
+        return history
+
+    async def get_conversation_history_async(self, user_id: int, max_messages: int = 10,
+                                             include_summary: bool = True) -> list:
+        return await self._offload(self.get_conversation_history, user_id, max_messages, include_summary)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "chats": len(self.conversations),
+                "messages": sum(len(m) for m in self.conversations.values()),
+                "bytes": self.total_bytes,
+                "spilled_chats": self.spill.count() if self.spill is not None else 0,
+                **self.counters,
+            }
 
-conversation_state = ConversationState()
\ No newline at end of file
+conversation_state = ConversationState(
+    spill=ConversationSpill(os.path.join(DATA_DIR, "state", "conversations.db"))
+    if CONVERSATION_SPILL or SHARED_STATE else None,
+    shared=SHARED_STATE
+)
@@ -0,0 +1,162 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import numpy as np
+from app.api.models import Note
+from app.services.minhash_index import MinHasher, band_keys, note_text, similarity
+from app.config import DEDUP_THRESHOLD, DEDUP_NUM_PERM, DEDUP_BANDS, DEDUP_SHINGLE_WORDS
+import logging
+
+logger = logging.getLogger(__name__)
+
+REPORT_CHUNK_SIZE = 500  # Notes per task sent to a worker process
+
+
+@lru_cache(maxsize=4)
+def _hasher(num_perm: int, shingle_words: int) -> MinHasher:
+    return MinHasher(num_perm, shingle_words)
+
+
+def sign_texts(texts: List[str], num_perm: int = DEDUP_NUM_PERM,
+               shingle_words: int = DEDUP_SHINGLE_WORDS) -> List[Optional[np.ndarray]]:
+    """Signatures of a batch of texts; runs in the report's worker processes"""
+    hasher = _hasher(num_perm, shingle_words)
+    return [hasher.signature(text) for text in texts]
+
+
+class _Groups:
+    """Union-find over note ids"""
+
+    def __init__(self):
+        self.parent: Dict[str, str] = {}
+
+    def find(self, note_id: str) -> str:
+        root = note_id
+        while self.parent.get(root, root) != root:
+            root = self.parent[root]
+        while note_id != root:
+            self.parent[note_id], note_id = root, self.parent.get(note_id, root)
+        return root
+
+    def union(self, a: str, b: str):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            # Ids sort by creation time, so the oldest note ends up as the group's root
+            self.parent[max(a, b)] = min(a, b)
+
+
+async def dedup_report(notes: AsyncIterator[Note], threshold: float = DEDUP_THRESHOLD, bands: int = DEDUP_BANDS,
+                       num_perm: int = DEDUP_NUM_PERM, shingle_words: int = DEDUP_SHINGLE_WORDS,
+                       workers: Optional[int] = None, chunk_size: int = REPORT_CHUNK_SIZE) -> dict:
+    """Group a whole corpus into sets of near-duplicate notes.
+
+    Notes are signed in a pool of worker processes, a chunk at a time and
+    with at most two chunks per worker in flight, while the corpus is still
+    being read. Signatures are then bucketed by LSH band; notes sharing a
+    bucket whose signatures reach ``threshold`` join the same group. Each
+    group lists its oldest note first, with the others' similarity to it.
+    """
+    if num_perm % bands:
+        raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    loop = asyncio.get_running_loop()
+    titles: Dict[str, str] = {}
+    signatures: Dict[str, np.ndarray] = {}
+    in_flight: List[Tuple[List[str], asyncio.Future]] = []
+
+    def collect(ids: List[str], signed: List[Optional[np.ndarray]]):
+        signatures.update((note_id, signature) for note_id, signature in zip(ids, signed) if signature is not None)
+
+    # Spawned rather than forked: the caller may already be running threads
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        async def submit(chunk: List[Note]):
+            if len(in_flight) >= 2 * workers:
+                ids, future = in_flight.pop(0)
+                collect(ids, await future)
+            texts = [note_text(note) for note in chunk]
+            future = loop.run_in_executor(pool, sign_texts, texts, num_perm, shingle_words)
+            in_flight.append(([note.id for note in chunk], future))
+
+        chunk: List[Note] = []
+        async for note in notes:
+            titles[note.id] = note.title
+            chunk.append(note)
+            if len(chunk) >= chunk_size:
+                await submit(chunk)
+                chunk = []
+        if chunk:
+            await submit(chunk)
+        for ids, future in in_flight:
+            collect(ids, await future)
+
+    groups = _Groups()
+    buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(bands)]
+    for note_id, signature in signatures.items():
+        for band, key in enumerate(band_keys(signature, bands)):
+            buckets[band].setdefault(key, []).append(note_id)
+    for band_buckets in buckets:
+        for ids in band_buckets.values():
+            for i, a in enumerate(ids):
+                for b in ids[i + 1:]:
+                    # Pairs already grouped need no check
+                    if groups.find(a) != groups.find(b) and similarity(signatures[a], signatures[b]) >= threshold:
+                        groups.union(a, b)
+
+    members: Dict[str, List[str]] = {}
+    for note_id in groups.parent:  # Every grouped note except the roots
+        members.setdefault(groups.find(note_id), []).append(note_id)
+    report_groups = []
+    for root, ids in members.items():
+        report_groups.append({
+            "keep": {"id": root, "title": titles[root]},
+            "duplicates": [
+                {
+                    "id": note_id, "title": titles[note_id],
+                    "similarity": round(similarity(signatures[root], signatures[note_id]), 3),
+                }
+                for note_id in sorted(ids)
+            ],
+        })
+    report_groups.sort(key=lambda group: (-len(group["duplicates"]), group["keep"]["id"]))
+    return {
+        "notes": len(titles),
+        "signed": len(signatures),
+        "threshold": threshold,
+        "groups": report_groups,
+        "duplicates": sum(len(group["duplicates"]) for group in report_groups),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+async def _run_cli(args):
+    from app.services.brain_service import brain_service
+
+    report = await dedup_report(brain_service.iter_changed(), args.threshold, workers=args.workers)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    for group in report["groups"]:
+        keep = group["keep"]
+        print(f"\"{keep['title']}\" ({keep['id']})")
+        for duplicate in group["duplicates"]:
+            print(f"    {duplicate['similarity']:.0%}  \"{duplicate['title']}\" ({duplicate['id']})")
+    print(f"{report['duplicates']} near-duplicates in {len(report['groups'])} groups among {report['notes']} notes "
+          f"({report['seconds']}s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report groups of near-duplicate notes")
+    parser.add_argument("--threshold", type=float, default=DEDUP_THRESHOLD, help="Estimated Jaccard similarity, 0-1")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--out", help="Also write the report as JSON here")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run_cli(args))
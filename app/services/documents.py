@@ -0,0 +1,152 @@
+import asyncio
+import codecs
+import os
+from typing import Iterator, List, Optional, Tuple
+from app.api.models import Document, Note
+from app.agent.fast_path import HASHTAG
+from app.services.blob_store import BlobStore, BlobTooLargeError, blob_store
+from app.services.brain_service import brain_service
+from app.services.telegram import TelegramClient, telegram_client
+from app.config import DOCUMENT_MAX_BYTES, DOCUMENT_PREVIEW_CHARS, DOCUMENT_CHUNK_BYTES
+import logging
+
+logger = logging.getLogger(__name__)
+
+TEXT_SUFFIXES = (".txt", ".md", ".markdown", ".csv", ".json", ".log", ".rst", ".org")
+TOO_LARGE = "That file is too large; I can read files up to {} MB."
+
+
+class DocumentError(Exception):
+    """A document that cannot be ingested; the message is shown to the user"""
+
+
+def document_kind(file_name: Optional[str], mime_type: Optional[str]) -> Optional[str]:
+    """``"text"``, ``"pdf"`` or None for unsupported files"""
+    name = (file_name or "").lower()
+    mime_type = (mime_type or "").lower()
+    if mime_type == "application/pdf" or name.endswith(".pdf"):
+        return "pdf"
+    if mime_type.startswith("text/") or name.endswith(TEXT_SUFFIXES):
+        return "text"
+    return None
+
+
+def iter_text(store: BlobStore, digest: str, kind: str, chunk_bytes: int = DOCUMENT_CHUNK_BYTES) -> Iterator[str]:
+    """Extract a stored file's text piece by piece, so large files are never decoded whole"""
+    if kind == "pdf":
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise DocumentError("Reading PDFs needs the pypdf package, which is not installed.")
+        with open(store.path(digest), 'rb') as f:
+            for page in PdfReader(f).pages:
+                yield (page.extract_text() or "") + "\n\n"
+        return
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    with store.open(digest) as view:
+        for start in range(0, len(view), chunk_bytes):
+            yield decoder.decode(view[start:start + chunk_bytes])
+    yield decoder.decode(b"", final=True)
+
+
+def extract_text(store: BlobStore, digest: str, kind: str, preview_chars: int = DOCUMENT_PREVIEW_CHARS,
+                 chunk_bytes: int = DOCUMENT_CHUNK_BYTES) -> Tuple[Optional[dict], str]:
+    """Store a file's extracted text as a blob of independently decodable chunks.
+
+    Returns the text's metadata (its blob, length and chunk byte ranges),
+    or None if the file has no text, and a preview for the note body.
+    """
+    preview: List[str] = []
+    preview_length = 0
+    chunks: List[List[int]] = []
+    pending: List[bytes] = []
+    pending_size = offset = chars = 0
+
+    with store.writer() as writer:
+        def flush():
+            nonlocal pending_size, offset
+            if pending_size:
+                writer.write(b"".join(pending))
+                chunks.append([offset, pending_size])
+                offset += pending_size
+                pending.clear()
+                pending_size = 0
+
+        for text in iter_text(store, digest, kind, chunk_bytes):
+            if not text:
+                continue
+            chars += len(text)
+            if preview_length < preview_chars:
+                preview.append(text[:preview_chars - preview_length])
+                preview_length += len(preview[-1])
+            data = text.encode("utf-8")
+            pending.append(data)
+            pending_size += len(data)
+            if pending_size >= chunk_bytes:
+                flush()
+        flush()
+        if not chars or not "".join(preview).strip():
+            return None, ""
+        info = writer.commit()
+
+    preview_text = "".join(preview).strip()
+    if chars > preview_chars:
+        preview_text += "…"
+    return {"blob": info.digest, "chars": chars, "chunks": chunks}, preview_text
+
+
+def read_text(note: Note, chunk: Optional[int] = None, store: BlobStore = blob_store) -> str:
+    """A document note's full extracted text, or one chunk of it, read through a memory map"""
+    text = note.metadata.get("document", {}).get("text")
+    if not text:
+        return note.content
+    if chunk is None:
+        return store.read(text["blob"]).decode("utf-8")
+    offset, length = text["chunks"][chunk]
+    return store.read(text["blob"], offset, length).decode("utf-8")
+
+
+async def ingest_document(document: Document, caption: Optional[str] = None, client: TelegramClient = telegram_client,
+                          store: BlobStore = blob_store, brain=brain_service) -> Tuple[Note, bool]:
+    """Download a Telegram document into the blob store and save it as a note.
+
+    Returns the note and whether it is new: a file that was sent before is
+    stored once, and its existing note is returned.
+    """
+    kind = document_kind(document.file_name, document.mime_type)
+    if kind is None:
+        raise DocumentError("I can only read text, Markdown and PDF files for now.")
+    if document.file_size and document.file_size > DOCUMENT_MAX_BYTES:
+        raise DocumentError(TOO_LARGE.format(DOCUMENT_MAX_BYTES // (1024 * 1024)))
+
+    file_info = await client.get_file(document.file_id)
+    try:
+        blob = await store.put_stream(client.download_file(file_info["file_path"]), max_bytes=DOCUMENT_MAX_BYTES)
+    except BlobTooLargeError:
+        raise DocumentError(TOO_LARGE.format(DOCUMENT_MAX_BYTES // (1024 * 1024)))
+
+    if not blob.created:
+        for note_id in await asyncio.to_thread(store.links, blob.digest):
+            note = await brain.get_note(note_id)
+            if note is not None:
+                return note, False
+
+    text, preview = await asyncio.to_thread(extract_text, store, blob.digest, kind)
+    file_name = document.file_name or f"document-{blob.digest[:8]}"
+    caption = (caption or "").strip()
+    content = "\n\n".join(part for part in (caption, preview) if part) or f"(No text found in {file_name})"
+    note = await brain.save_note(
+        title=os.path.splitext(file_name)[0] or file_name,
+        content=content,
+        tags=HASHTAG.findall(caption),
+        metadata={
+            "source": "telegram_document",
+            "document": {
+                "blob": blob.digest, "file_name": file_name, "mime_type": document.mime_type,
+                "size": blob.size, "text": text,
+            },
+        },
+    )
+    await asyncio.to_thread(store.link, blob.digest, note.id)
+    logger.info(f"Ingested {file_name} ({blob.size} bytes) as note {note.id}")
+    return note, True
@@ -0,0 +1,99 @@
+import json
+import os
+from typing import IO, Callable
+from app.services.shared_state import file_lock
+import logging
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_COMPACT_THRESHOLD = 1000
+
+
+class JournaledSnapshot:
+    """The files an index persists itself in: a snapshot plus a journal of the changes made since.
+
+    Changes are appended to the journal as JSON lines. Once
+    ``compact_threshold`` have accumulated, the index is written out by
+    ``write_snapshot`` as a new snapshot, which replaces the old one and the
+    journal. Loading holds a shared lock that compaction waits for, so a
+    reader never pairs a new snapshot with an old journal.
+
+    With ``read_only``, for processes that share the files with the one
+    that writes them, nothing is written.
+    """
+
+    def __init__(self, index_dir: str, snapshot_name: str, journal_name: str,
+                 write_snapshot: Callable[[IO], None], binary: bool = False,
+                 compact_threshold: int = JOURNAL_COMPACT_THRESHOLD):
+        self.index_dir = index_dir
+        self.snapshot_path = os.path.join(index_dir, snapshot_name)
+        self.journal_path = os.path.join(index_dir, journal_name)
+        self.lock_path = os.path.join(index_dir, ".lock")
+        self.write_snapshot = write_snapshot
+        self.binary = binary
+        self.compact_threshold = compact_threshold
+        self.read_only = False
+        self.journal_entries = 0
+        self._partial_line = False
+
+    def load(self, read_snapshot: Callable[[IO], bool], apply: Callable[[dict], None]) -> bool:
+        """Read the snapshot, then replay the journal's entries through ``apply``.
+
+        Returns False, having read nothing else, if there is no snapshot or
+        ``read_snapshot`` rejects it; the index is then rebuilt and ``save``d.
+        """
+        os.makedirs(self.index_dir, exist_ok=True)
+        with file_lock(self.lock_path, shared=True):
+            if not os.path.exists(self.snapshot_path):
+                return False
+            with open(self.snapshot_path, 'rb' if self.binary else 'r', **self._encoding()) as f:
+                if not read_snapshot(f):
+                    return False
+            self._replay(apply)
+        return True
+
+    def _replay(self, apply: Callable[[dict], None]):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                self._partial_line = not line.endswith("\n")
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash mid-append can leave a partial last line
+                    logger.warning(f"Skipping corrupt journal entry in {self.journal_path}")
+                    continue
+                apply(entry)
+                self.journal_entries += 1
+
+    def _encoding(self) -> dict:
+        return {} if self.binary else {"encoding": "utf-8"}
+
+    def save(self):
+        """Write a new snapshot and start an empty journal"""
+        if self.read_only:
+            return
+        os.makedirs(self.index_dir, exist_ok=True)
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, 'wb' if self.binary else 'w', **self._encoding()) as f:
+            self.write_snapshot(f)
+        with file_lock(self.lock_path):
+            os.replace(tmp_path, self.snapshot_path)
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+        self.journal_entries = 0
+        self._partial_line = False
+
+    def append(self, *entries: dict):
+        """Record changes in the journal, compacting it into a new snapshot when it has grown long"""
+        if self.read_only or not entries:
+            return
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            if self._partial_line:
+                f.write("\n")  # Keep the first new entry off the partial line
+                self._partial_line = False
+            f.writelines(json.dumps(entry) + "\n" for entry in entries)
+        self.journal_entries += len(entries)
+        if self.journal_entries >= self.compact_threshold:
+            self.save()
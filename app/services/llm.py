@@ -0,0 +1,185 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+import httpx
+from app.services.llm_cache import DiskCache, LLMCache, make_cache_key
+from app.services.llm_scheduler import llm_scheduler
+from app.services.metrics import LLM_TOKENS
+from app.config import (
+    OPENAI_API_KEY, OPENAI_MODEL, OPENAI_API_BASE, LLM_BACKEND, LLM_TIMEOUT, DATA_DIR, LLM_CACHE_SIZE,
+    LLM_CACHE_TTLS, LLM_CACHE_DISK
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_BASE = "https://api.openai.com/v1"
+
+llm_cache = LLMCache(
+    max_entries=LLM_CACHE_SIZE,
+    ttls=LLM_CACHE_TTLS,
+    disk=DiskCache(os.path.join(DATA_DIR, "cache", "llm_cache.db")) if LLM_CACHE_DISK else None,
+)
+
+
+class OpenAIClient:
+    """Minimal client for an OpenAI-compatible chat completions endpoint, on a pooled connection.
+
+    A drop-in for ``litellm.acompletion`` covering the one call this app
+    makes: responses are the API's JSON, and ``stream=True`` returns an
+    async iterator of the streamed chunks.
+    """
+
+    def __init__(self, base_url: Optional[str] = OPENAI_API_BASE, api_key: Optional[str] = OPENAI_API_KEY,
+                 timeout: float = LLM_TIMEOUT):
+        self.base_url = (base_url or DEFAULT_API_BASE).rstrip("/")
+        self.api_key = api_key
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60),
+            )
+
+    async def stop(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _request(self, model: str, messages: list, api_key: Optional[str], params: dict) -> dict:
+        # litellm-style provider prefixes name the provider, not the model
+        body = {"model": model.removeprefix("openai/"), "messages": messages, **params}
+        headers = {"Authorization": f"Bearer {api_key or self.api_key}"}
+        return {"json": body, "headers": headers}
+
+    async def acompletion(self, model: str, messages: list, api_key: Optional[str] = None, stream: bool = False,
+                          **params):
+        await self.start()
+        request = self._request(model, messages, api_key, params)
+        if stream:
+            request["json"]["stream"] = True
+            return self._stream(request)
+        response = await self._client.post("/chat/completions", **request)
+        response.raise_for_status()
+        return response.json()
+
+    async def _stream(self, request: dict) -> AsyncIterator[dict]:
+        async with self._client.stream("POST", "/chat/completions", **request) as response:
+            if response.is_error:
+                await response.aread()
+                response.raise_for_status()
+            async for line in response.aiter_lines():
+                # Server-sent events: "data: {chunk}" lines, ending with "data: [DONE]"
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    return
+                yield json.loads(data)
+
+
+openai_client = OpenAIClient()
+_completion: Optional[Callable[..., Awaitable]] = None
+
+
+def completion_backend() -> Callable[..., Awaitable]:
+    """The configured backend's ``acompletion``, importing litellm on first use"""
+    global _completion
+    if _completion is None:
+        if LLM_BACKEND == "openai":
+            _completion = openai_client.acompletion
+        else:
+            start = time.perf_counter()
+            from litellm import acompletion  # Takes seconds, so it is kept off the startup path
+            logger.info(f"Imported litellm in {time.perf_counter() - start:.2f}s")
+            _completion = acompletion
+    return _completion
+
+
+async def warm_up():
+    """Load the LLM backend in a thread, so the first message does not wait for the import"""
+    try:
+        await asyncio.to_thread(completion_backend)
+    except ImportError as e:
+        logger.error(f"Could not load the LLM backend: {e}")
+
+
+async def _acompletion(model: str, **kwargs):
+    backend = completion_backend()
+    if OPENAI_API_BASE and LLM_BACKEND != "openai":
+        kwargs["api_base"] = OPENAI_API_BASE
+    return await backend(model=model, api_key=OPENAI_API_KEY, **kwargs)
+
+
+def is_json(content: str) -> bool:
+    try:
+        json.loads(content)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+async def chat_completion(call_type: str, messages: list, cache_if: Optional[Callable[[str], Any]] = None,
+                          **params) -> str:
+    """Run a chat completion through the response cache and the scheduler, and return the message content.
+
+    ``call_type`` selects the cache TTL and the deadline; ``params`` are
+    passed on to the LLM and are part of the cache key.
+    """
+    async def attempt(model: str) -> str:
+        response = await _acompletion(model, messages=messages, **params)
+        usage = response.get("usage") or {}
+        LLM_TOKENS.labels(call_type, "prompt").inc(usage.get("prompt_tokens") or 0)
+        LLM_TOKENS.labels(call_type, "completion").inc(usage.get("completion_tokens") or 0)
+        return response["choices"][0]["message"]["content"]
+
+    async def call() -> str:
+        return await llm_scheduler.run(call_type, attempt)
+
+    key = make_cache_key(OPENAI_MODEL, messages, **params)
+    return await llm_cache.get_or_call(call_type, key, call, cache_if=cache_if)
+
+
+def _delta_text(chunk) -> str:
+    delta = chunk["choices"][0]["delta"]
+    content = delta.get("content") if isinstance(delta, dict) else getattr(delta, "content", None)
+    return content or ""
+
+
+def _finish_reason(chunk) -> Optional[str]:
+    choice = chunk["choices"][0]
+    return choice.get("finish_reason") if isinstance(choice, dict) else getattr(choice, "finish_reason", None)
+
+
+async def stream_completion(call_type: str, messages: list, **params) -> AsyncIterator[str]:
+    """Yield a chat completion's text as it is generated.
+
+    A cached response is yielded whole. A stream is cached like
+    ``chat_completion`` results only if the model finished it normally
+    (``finish_reason`` "stop") with some text, so a stream that was cut
+    off, abandoned by the caller or empty is not replayed from the cache.
+    """
+    key = make_cache_key(OPENAI_MODEL, messages, **params)
+    cached = llm_cache.get(call_type, key)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    finish_reason = None
+    chunks = llm_scheduler.stream(call_type, lambda model: _acompletion(model, messages=messages, stream=True, **params))
+    async for chunk in chunks:
+        finish_reason = _finish_reason(chunk) or finish_reason
+        text = _delta_text(chunk)
+        if text:
+            parts.append(text)
+            yield text
+    text = "".join(parts)
+    if finish_reason == "stop" and text.strip():
+        await llm_cache.put(call_type, key, text)
@@ -0,0 +1,174 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from app.services.metrics import LLM_CACHE_EVENTS, LLM_CACHE_EVICTIONS
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace and case so trivially different prompts share a cache entry"""
+    return " ".join(text.split()).casefold()
+
+
+def make_cache_key(model: str, messages: list, **params) -> str:
+    normalized = [{"role": m["role"], "content": normalize_text(m["content"])} for m in messages]
+    payload = json.dumps({"model": model, "messages": normalized, "params": params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """SQLite-backed second cache tier that survives restarts"""
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),))
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ? AND expires_at >= ?", (key, time.time())
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set(self, key: str, value: str, expires_at: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)", (key, value, expires_at)
+            )
+
+
+class LLMCache:
+    """LRU cache of LLM responses with a TTL per call type.
+
+    Lookups check memory, then the optional disk tier. Concurrent misses for
+    the same key share a single in-flight call instead of each calling the
+    LLM.
+    """
+
+    def __init__(self, max_entries: int, ttls: Dict[str, float], default_ttl: float = 300,
+                 disk: Optional[DiskCache] = None):
+        self.max_entries = max_entries
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self.disk = disk
+        self.entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.counters = Counter()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def _set_memory(self, key: str, value: str, expires_at: float):
+        self.entries[key] = (value, expires_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.counters["evictions"] += 1
+            LLM_CACHE_EVICTIONS.inc()
+
+    def _count(self, call_type: str, event: str):
+        self.counters[f"{call_type}_{event}"] += 1
+        LLM_CACHE_EVENTS.labels(call_type, event).inc()
+
+    def get(self, call_type: str, key: str) -> Optional[str]:
+        """Return a cached response from memory, counting the hit or miss"""
+        if self.ttls.get(call_type, self.default_ttl) <= 0:
+            self._count(call_type, "bypass")
+            return None
+        value = self._get_memory(key)
+        self._count(call_type, "hits" if value is not None else "misses")
+        return value
+
+    async def put(self, call_type: str, key: str, value: str):
+        """Store a response computed outside ``get_or_call``, such as a streamed one"""
+        ttl = self.ttls.get(call_type, self.default_ttl)
+        if ttl <= 0:
+            return
+        expires_at = time.time() + ttl
+        self._set_memory(key, value, expires_at)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value, expires_at)
+
+    async def get_or_call(self, call_type: str, key: str, factory: Callable[[], Awaitable[str]],
+                          cache_if: Optional[Callable[[str], Any]] = None) -> str:
+        """Return the cached response for ``key`` or compute it with ``factory``.
+
+        A response is only stored if ``cache_if`` (when given) accepts it.
+        """
+        ttl = self.ttls.get(call_type, self.default_ttl)
+        if ttl <= 0:
+            self._count(call_type, "bypass")
+            return await factory()
+
+        while True:
+            value = self._get_memory(key)
+            if value is not None:
+                self._count(call_type, "hits")
+                return value
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            self._count(call_type, "collapsed")
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # If only the caller making the call was cancelled, wait for or make the call again
+                if not inflight.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            if self.disk is not None:
+                cached = await asyncio.to_thread(self.disk.get, key)
+                if cached is not None:
+                    self._count(call_type, "disk_hits")
+                    self._set_memory(key, *cached)
+                    future.set_result(cached[0])
+                    return cached[0]
+
+            self._count(call_type, "misses")
+            value = await factory()
+            if cache_if is None or cache_if(value):
+                expires_at = time.time() + ttl
+                self._set_memory(key, value, expires_at)
+                if self.disk is not None:
+                    await asyncio.to_thread(self.disk.set, key, value, expires_at)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody else may be waiting; mark the exception as retrieved
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        return {"entries": len(self.entries), **self.counters}
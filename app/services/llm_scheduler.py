@@ -0,0 +1,358 @@
+import asyncio
+import contextvars
+import random
+import time
+from collections import Counter, OrderedDict, deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+from app.services.metrics import (
+    LLM_LATENCY, LLM_ERRORS, LLM_FIRST_TOKEN, LLM_QUEUE_WAIT, LLM_RETRIES, LLM_HEDGES, QUEUE_DEPTH
+)
+from app.config import (
+    OPENAI_MODEL, LLM_MAX_CONCURRENCY, LLM_DEADLINES, LLM_MAX_RETRIES, LLM_HEDGE, LLM_FALLBACK_MODEL
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+DEFAULT_DEADLINE = 60.0
+HEDGE_MODES = ("off", "duplicate", "fallback")
+LATENCY_WINDOW = 200  # Recent calls per model and call type that statistics are taken over
+MIN_SAMPLES = 20  # Calls needed before a model's p95 and error rate are acted on
+RATE_LIMIT_BACKOFF = 1.0
+MAX_RATE_LIMIT_BACKOFF = 30.0
+# With a fallback model, calls go to it while the primary fails this often, except every PROBE_EVERY-th one
+FALLBACK_ERROR_RATE = 0.5
+PROBE_EVERY = 10
+
+# The chat an LLM call is made for, so calls can be queued fairly per chat; set for each update
+current_chat: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("llm_chat", default=None)
+
+
+def is_rate_limit(error: Exception) -> bool:
+    """Whether an error from either LLM backend is the provider's rate limit"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or type(error).__name__ == "RateLimitError"
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class ModelStats:
+    """Latencies and outcomes of a model's recent calls of one type"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.failures: Deque[bool] = deque(maxlen=window)
+        self.counters = Counter()
+
+    def record(self, seconds: Optional[float]):
+        """Record a successful call's latency, or a failure if ``seconds`` is None"""
+        self.counters["calls"] += 1
+        self.failures.append(seconds is None)
+        if seconds is None:
+            self.counters["errors"] += 1
+        else:
+            self.latencies.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if len(self.latencies) < MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    def error_rate(self) -> Optional[float]:
+        if len(self.failures) < MIN_SAMPLES:
+            return None
+        return sum(self.failures) / len(self.failures)
+
+    def snapshot(self) -> dict:
+        p50, p95 = self.percentile(50), self.percentile(95)
+        return {
+            **self.counters,
+            "p50_ms": p50 * 1000 if p50 is not None else None,
+            "p95_ms": p95 * 1000 if p95 is not None else None,
+            "error_rate": self.error_rate(),
+        }
+
+
+class LLMScheduler:
+    """Admission, deadlines, retries and hedging for every LLM call.
+
+    At most ``max_concurrency`` calls are in flight. Further calls wait in
+    per-chat queues served round-robin, so one busy chat cannot starve the
+    others. A call's deadline covers its wait, retries and hedges. A
+    rate-limit error pauses new calls for everyone, with exponential
+    backoff or the provider's Retry-After. Latency and error statistics
+    per model and call type decide when a slow call is hedged and when
+    the fallback model is preferred.
+    """
+
+    def __init__(self, model: str = OPENAI_MODEL, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 deadlines: Dict[str, float] = LLM_DEADLINES, max_retries: int = LLM_MAX_RETRIES,
+                 hedge: str = LLM_HEDGE, fallback_model: Optional[str] = LLM_FALLBACK_MODEL):
+        if hedge not in HEDGE_MODES:
+            raise ValueError(f"Unknown LLM hedging mode: {hedge} (expected one of {', '.join(HEDGE_MODES)})")
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.deadlines = deadlines
+        self.max_retries = max_retries
+        self.hedge = hedge
+        self.fallback_model = fallback_model
+
+        self.active = 0
+        self.resume_at = 0.0  # Monotonic time before which no call starts, after a rate-limit error
+        self.model_stats: Dict[Tuple[str, str], ModelStats] = {}
+        self.counters = Counter()
+        self._waiting: "OrderedDict[Optional[int], Deque[asyncio.Future]]" = OrderedDict()
+        self._routed = 0
+
+    @property
+    def queued(self) -> int:
+        return sum(len(waiters) for waiters in self._waiting.values())
+
+    def deadline(self, call_type: str) -> float:
+        return self.deadlines.get(call_type, DEFAULT_DEADLINE)
+
+    def _try_acquire(self) -> bool:
+        if self.active < self.max_concurrency and not self._waiting:
+            self.active += 1
+            return True
+        return False
+
+    async def _acquire(self, chat_id: Optional[int]):
+        if self._try_acquire():
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(chat_id, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()  # The slot was handed over just as the wait was cancelled
+            else:
+                waiters = self._waiting.get(chat_id)
+                if waiters is not None and future in waiters:
+                    waiters.remove(future)
+                    if not waiters:
+                        del self._waiting[chat_id]
+            raise
+
+    def _release(self):
+        # Hand the slot to the next chat in turn, which then goes to the back of the line
+        while self._waiting:
+            chat_id, waiters = next(iter(self._waiting.items()))
+            future = waiters.popleft()
+            if waiters:
+                self._waiting.move_to_end(chat_id)
+            else:
+                del self._waiting[chat_id]
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    async def _acquire_slot(self, call_type: str):
+        start = time.perf_counter()
+        await self._acquire(current_chat.get())
+        LLM_QUEUE_WAIT.labels(call_type).observe(time.perf_counter() - start)
+
+    async def _cool_down(self):
+        delay = self.resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _stats(self, model: str, call_type: str) -> ModelStats:
+        stats = self.model_stats.get((model, call_type))
+        if stats is None:
+            stats = self.model_stats[(model, call_type)] = ModelStats()
+        return stats
+
+    def _choose_model(self, call_type: str) -> str:
+        if self.fallback_model:
+            error_rate = self._stats(self.model, call_type).error_rate()
+            if error_rate is not None and error_rate >= FALLBACK_ERROR_RATE:
+                # Keep probing the primary so it is used again once it recovers
+                self._routed += 1
+                if self._routed % PROBE_EVERY:
+                    self.counters["routed_to_fallback"] += 1
+                    return self.fallback_model
+        return self.model
+
+    def _next_model(self, call_type: str, model: str, error: Exception, attempt: int) -> str:
+        """The model to try next after ``error``; re-raises it when no attempts are left"""
+        if attempt >= self.max_retries:
+            raise error
+        if is_rate_limit(error):
+            delay = retry_after(error) or (
+                min(RATE_LIMIT_BACKOFF * 2 ** attempt, MAX_RATE_LIMIT_BACKOFF) * random.uniform(0.5, 1.0)
+            )
+            self.resume_at = max(self.resume_at, time.monotonic() + delay)
+            LLM_RETRIES.labels(call_type, "rate_limit").inc()
+            logger.warning(f"LLM rate limit hit on {model}, pausing calls for {delay:.1f}s")
+            return model
+        if self.fallback_model and model != self.fallback_model:
+            LLM_RETRIES.labels(call_type, "fallback").inc()
+            logger.warning(f"LLM call to {model} failed ({error}), retrying with {self.fallback_model}")
+            return self.fallback_model
+        raise error
+
+    def _hedge_model(self, model: str) -> Optional[str]:
+        if self.hedge == "duplicate":
+            return model
+        if self.hedge == "fallback" and self.fallback_model and self.fallback_model != model:
+            return self.fallback_model
+        return None
+
+    async def _attempt(self, call_type: str, model: str, call: Callable[[str], Awaitable[T]]) -> T:
+        stats = self._stats(model, call_type)
+        start = time.perf_counter()
+        try:
+            result = await call(model)
+        except asyncio.CancelledError:
+            raise  # A hedge that lost the race says nothing about the model
+        except Exception:
+            stats.record(None)
+            LLM_ERRORS.labels(call_type).inc()
+            LLM_LATENCY.labels(call_type).observe(time.perf_counter() - start)
+            raise
+        seconds = time.perf_counter() - start
+        stats.record(seconds)
+        LLM_LATENCY.labels(call_type).observe(seconds)
+        return result
+
+    async def _hedged(self, call_type: str, model: str, call: Callable[[str], Awaitable[T]]) -> T:
+        """Run one attempt; if it outlasts the model's p95, race a second one against it"""
+        hedge_model = self._hedge_model(model)
+        delay = self._stats(model, call_type).percentile(95) if hedge_model else None
+        if delay is None:
+            return await self._attempt(call_type, model, call)
+
+        tasks = [asyncio.ensure_future(self._attempt(call_type, model, call))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            # Hedges only use spare capacity, so they never delay other chats' calls
+            if done or not self._try_acquire():
+                return await tasks[0]
+            LLM_HEDGES.labels(call_type, "sent").inc()
+            hedge = asyncio.ensure_future(self._attempt(call_type, hedge_model, call))
+            hedge.add_done_callback(lambda _: self._release())
+            tasks.append(hedge)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            LLM_HEDGES.labels(call_type, "won").inc()
+                        return task.result()
+            return await tasks[0]  # Both failed; raise the first attempt's error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()  # Retrieved, so the loser's error is not reported as unhandled
+
+    async def _run(self, call_type: str, call: Callable[[str], Awaitable[T]]) -> T:
+        await self._acquire_slot(call_type)
+        try:
+            model = self._choose_model(call_type)
+            attempt = 0
+            while True:
+                await self._cool_down()
+                try:
+                    return await self._hedged(call_type, model, call)
+                except Exception as e:
+                    model = self._next_model(call_type, model, e, attempt)
+                    attempt += 1
+        finally:
+            self._release()
+
+    async def run(self, call_type: str, call: Callable[[str], Awaitable[T]]) -> T:
+        """Return ``await call(model)``, scheduled within the limits, deadline and retry policy"""
+        try:
+            return await asyncio.wait_for(self._run(call_type, call), self.deadline(call_type))
+        except asyncio.TimeoutError:
+            self.counters[f"{call_type}_deadline_exceeded"] += 1
+            raise
+
+    async def stream(self, call_type: str,
+                     open_stream: Callable[[str], Awaitable[AsyncIterator[T]]]) -> AsyncIterator[T]:
+        """Yield the chunks of ``await open_stream(model)``, scheduled like ``run``.
+
+        Retries and the fallback model apply until the first chunk arrives.
+        Streams are not hedged, as that would show the user two replies.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline(call_type)
+
+        def remaining() -> float:
+            return max(0.0, deadline - loop.time())
+
+        try:
+            await asyncio.wait_for(self._acquire_slot(call_type), remaining())
+        except asyncio.TimeoutError:
+            self.counters[f"{call_type}_deadline_exceeded"] += 1
+            raise
+        try:
+            model = self._choose_model(call_type)
+            attempt = 0
+            start = time.perf_counter()
+            while True:
+                await asyncio.wait_for(self._cool_down(), remaining())
+                try:
+                    chunks = (await asyncio.wait_for(open_stream(model), remaining())).__aiter__()
+                    first = await asyncio.wait_for(chunks.__anext__(), remaining())
+                    break
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    raise
+                except Exception as e:
+                    self._stats(model, call_type).record(None)
+                    LLM_ERRORS.labels(call_type).inc()
+                    model = self._next_model(call_type, model, e, attempt)
+                    attempt += 1
+            LLM_FIRST_TOKEN.labels(call_type).observe(time.perf_counter() - start)
+            yield first
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), remaining())
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise
+                except Exception:
+                    self._stats(model, call_type).record(None)
+                    LLM_ERRORS.labels(call_type).inc()
+                    raise
+                yield chunk
+            seconds = time.perf_counter() - start
+            self._stats(model, call_type).record(seconds)
+            LLM_LATENCY.labels(call_type).observe(seconds)
+        except asyncio.TimeoutError:
+            self.counters[f"{call_type}_deadline_exceeded"] += 1
+            raise
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            **self.counters,
+            "models": {f"{model}:{call_type}": stats.snapshot() for (model, call_type), stats in self.model_stats.items()},
+        }
+
+
+llm_scheduler = LLMScheduler()
+QUEUE_DEPTH.set_function(lambda: llm_scheduler.queued, "llm")
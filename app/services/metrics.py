@@ -0,0 +1,250 @@
+import bisect
+import functools
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Seconds; spans a cached lookup up to a slow LLM call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    """A named metric family; children are keyed by their label values.
+
+    Updates are plain dict and list operations with no locking, cheap enough
+    for the hot path. Nearly all of them happen on the event loop thread.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+            for key, child in self._children.items()
+        ]
+
+
+class Gauge(Metric):
+    """A gauge, either set directly or read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def set_function(self, function: Callable[[], float], *values: str):
+        self._functions[tuple(str(v) for v in values)] = function
+
+    def _samples(self) -> List[str]:
+        values = {key: child.value for key, child in self._children.items()}
+        for key, function in self._functions.items():
+            values[key] = function()
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values.items()]
+
+
+class _HistogramChild:
+    __slots__ = ("upper_bounds", "counts", "sum")
+
+    def __init__(self, upper_bounds: Sequence[float]):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % le)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return registry.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return registry.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# Metrics shared across modules are defined here so each has a single owner
+LLM_LATENCY = histogram("llm_request_duration_seconds", "LLM API call latency, cache misses only", ["call_type"])
+LLM_FIRST_TOKEN = histogram("llm_first_token_seconds", "Time to the first streamed token", ["call_type"])
+LLM_TOKENS = counter("llm_tokens_total", "Tokens used by LLM calls", ["call_type", "kind"])
+LLM_ERRORS = counter("llm_errors_total", "Failed LLM calls", ["call_type"])
+LLM_QUEUE_WAIT = histogram("llm_queue_wait_seconds", "Time an LLM call waits for a concurrency slot", ["call_type"])
+LLM_RETRIES = counter("llm_retries_total", "LLM calls retried, by reason", ["call_type", "reason"])
+LLM_HEDGES = counter("llm_hedges_total", "Hedged LLM calls, by outcome", ["call_type", "outcome"])
+TELEGRAM_LATENCY = histogram("telegram_api_duration_seconds", "Telegram Bot API call latency", ["method"])
+TELEGRAM_ERRORS = counter("telegram_api_errors_total", "Failed Telegram Bot API calls", ["method"])
+TELEGRAM_SEND_LATENCY = histogram(
+    "telegram_send_message_duration_seconds", "Time to deliver a reply, including queueing and rate limits"
+)
+BRAIN_LATENCY = histogram("brain_operation_duration_seconds", "BrainService operation latency", ["operation"])
+BRAIN_ERRORS = counter("brain_operation_errors_total", "Failed BrainService operations", ["operation"])
+UPDATE_LATENCY = histogram("webhook_update_duration_seconds", "Time to handle a Telegram update end to end")
+UPDATE_QUEUE_WAIT = histogram("webhook_queue_wait_seconds", "Time a Telegram update waits before a worker picks it up")
+UPDATES = counter("webhook_updates_total", "Telegram updates received, by outcome", ["status"])
+QUEUE_DEPTH = gauge("queue_depth", "Items waiting in internal queues", ["queue"])
+LLM_CACHE_EVENTS = counter(
+    "llm_cache_events_total", "LLM cache lookups, by outcome: hits, disk_hits, misses, collapsed or bypass",
+    ["call_type", "event"]
+)
+LLM_CACHE_EVICTIONS = counter("llm_cache_evictions_total", "LLM cache entries evicted from memory")
+CONVERSATION_EVENTS = counter(
+    "conversation_events_total", "Conversation cache events: evicted, spilled, reloaded, refreshed, conflicts, "
+    "summaries and summary_errors", ["event"]
+)
+FAST_PATH_CLASSIFICATIONS = counter(
+    "fast_path_classifications_total", "Messages classified, by what decided them: rules, model or llm", ["outcome"]
+)
+
+
+def timed(metric: Histogram, errors: Counter, *labels: str):
+    """Decorate a coroutine function to observe its latency and count its exceptions"""
+    def decorator(func):
+        child = metric.labels(*labels)
+        error_child = errors.labels(*labels)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                error_child.inc()
+                raise
+            finally:
+                child.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
@@ -0,0 +1,233 @@
+import re
+import threading
+import zlib
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from app.api.models import Note
+from app.services.journaled_snapshot import JournaledSnapshot
+from app.config import DEDUP_ENABLED, DEDUP_THRESHOLD, DEDUP_NUM_PERM, DEDUP_BANDS, DEDUP_SHINGLE_WORDS
+import logging
+
+logger = logging.getLogger(__name__)
+
+WORD = re.compile(r"\w+", re.UNICODE)
+SIGN_BATCH = 4096  # Shingles hashed per step, bounding the (num_perm x batch) intermediate array
+SEED = 1  # Fixed, so signatures from any process or run are comparable
+
+
+def note_text(note: Note) -> str:
+    """The text compared for duplicates: the content, or the title of a note without any"""
+    return note.content if note.content.strip() else note.title
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures: the fraction of positions where they agree"""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+def band_keys(signature: np.ndarray, bands: int) -> List[bytes]:
+    return [band.tobytes() for band in signature.reshape(bands, -1)]
+
+
+class MinHasher:
+    """MinHash signatures over the word shingles of a text.
+
+    Each of the ``num_perm`` hash functions is a multiply-add-shift hash of
+    a shingle's crc32, and a signature holds each function's minimum over
+    the shingles, so two signatures agree in a position with probability
+    equal to the Jaccard similarity of their shingle sets.
+    """
+
+    def __init__(self, num_perm: int = DEDUP_NUM_PERM, shingle_words: int = DEDUP_SHINGLE_WORDS):
+        self.num_perm = num_perm
+        self.shingle_words = shingle_words
+        rng = np.random.default_rng(SEED)
+        self.a = rng.integers(0, 2 ** 64, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2 ** 64, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str) -> np.ndarray:
+        """crc32s of the text's distinct runs of ``shingle_words`` words (all of them, if it has fewer)"""
+        tokens = WORD.findall(text.lower())
+        if not tokens:
+            return np.empty(0, dtype=np.uint64)
+        k = min(self.shingle_words, len(tokens))
+        hashes = {zlib.crc32(" ".join(tokens[i:i + k]).encode("utf-8")) for i in range(len(tokens) - k + 1)}
+        return np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """The text's signature, or None if it has no words"""
+        hashes = self.shingles(text)
+        if not hashes.size:
+            return None
+        signature = np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint32)
+        for start in range(0, hashes.size, SIGN_BATCH):
+            block = hashes[None, start:start + SIGN_BATCH]
+            # uint64 arithmetic wraps, i.e. is modulo 2**64; the high 32 bits are the hash
+            values = (self.a[:, None] * block + self.b[:, None]) >> np.uint64(32)
+            np.minimum(signature, values.min(axis=1).astype(np.uint32), out=signature)
+        return signature
+
+
+class MinHashIndex:
+    """Persistent MinHash signatures of notes, with an LSH index for finding near-duplicates.
+
+    Each signature is cut into ``bands`` bands and a note goes into one
+    bucket per band, so a lookup only compares the notes sharing a bucket
+    with it instead of scanning the corpus. Notes at ``threshold``
+    similarity share a bucket with high probability (about 95% at 0.8 with
+    the default 16 bands of 8), much less similar ones rarely do, and
+    candidates are checked against the whole signature.
+
+    Like ``TagIndex``, the index is a snapshot (``minhash.npz``) plus a
+    journal, rebuilt from ``note_loader`` if no snapshot exists or it was
+    made with other settings, and can be opened ``read_only``. A disabled index ignores changes and finds nothing.
+    """
+
+    def __init__(self, index_dir: str, note_loader: Callable[[], Iterable[Note]],
+                 hasher: Optional[MinHasher] = None, bands: int = DEDUP_BANDS,
+                 threshold: float = DEDUP_THRESHOLD, enabled: bool = DEDUP_ENABLED):
+        self.hasher = hasher or MinHasher()
+        if self.hasher.num_perm % bands:
+            raise ValueError(f"DEDUP_NUM_PERM ({self.hasher.num_perm}) must be a multiple of DEDUP_BANDS ({bands})")
+        self.files = JournaledSnapshot(index_dir, "minhash.npz", "minhash.journal", self._write_snapshot, binary=True)
+        self.note_loader = note_loader
+        self.bands = bands
+        self.threshold = threshold
+        self.enabled = enabled
+
+        self.signatures: Dict[str, np.ndarray] = {}
+        self.buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(bands)]
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    @property
+    def read_only(self) -> bool:
+        return self.files.read_only
+
+    @read_only.setter
+    def read_only(self, value: bool):
+        self.files.read_only = value
+
+    def _params(self) -> List[int]:
+        return [self.hasher.num_perm, self.hasher.shingle_words, SEED]
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        if not self.files.load(self._read_snapshot, self._apply):
+            logger.info("MinHash index not found or built with other settings, rebuilding from notes...")
+            for note in self.note_loader():
+                signature = self.hasher.signature(note_text(note))
+                if signature is not None:
+                    self._add(note.id, signature)
+            self.files.save()
+        self._loaded = True
+
+    def _read_snapshot(self, f) -> bool:
+        with np.load(f) as data:
+            # Signatures made with other settings are not comparable
+            if data["params"].tolist() != self._params():
+                return False
+            for note_id, signature in zip(data["ids"].tolist(), data["signatures"]):
+                self._add(note_id, signature)
+        return True
+
+    def _write_snapshot(self, f):
+        ids = list(self.signatures)
+        matrix = np.array([self.signatures[note_id] for note_id in ids], dtype=np.uint32)
+        np.savez(f, ids=np.array(ids, dtype=str), signatures=matrix.reshape(len(ids), self.hasher.num_perm),
+                 params=np.array(self._params()))
+
+    def _apply(self, entry: dict):
+        self._remove(entry["id"])
+        if entry["op"] == "add":
+            self._add(entry["id"], np.array(entry["signature"], dtype=np.uint32))
+
+    def _add(self, note_id: str, signature: np.ndarray):
+        self.signatures[note_id] = signature
+        for band, key in enumerate(band_keys(signature, self.bands)):
+            self.buckets[band].setdefault(key, []).append(note_id)
+
+    def _remove(self, note_id: str):
+        signature = self.signatures.pop(note_id, None)
+        if signature is None:
+            return
+        for band, key in enumerate(band_keys(signature, self.bands)):
+            ids = self.buckets[band].get(key)
+            if ids is None:
+                continue
+            if note_id in ids:
+                ids.remove(note_id)
+            if not ids:
+                del self.buckets[band][key]
+
+    def add_note(self, note: Note):
+        self.add_notes([note])
+
+    def add_notes(self, notes: Iterable[Note]):
+        """Sign and index a batch of notes with a single journal write"""
+        if not self.enabled:
+            return
+        signed = [(note.id, self.hasher.signature(note_text(note))) for note in notes]
+        with self._lock:
+            self._ensure_loaded()
+            entries = []
+            for note_id, signature in signed:
+                current = self.signatures.get(note_id)
+                if signature is None:
+                    if current is not None:
+                        self._remove(note_id)
+                        entries.append({"op": "remove", "id": note_id})
+                    continue
+                if current is not None and np.array_equal(current, signature):
+                    continue
+                self._remove(note_id)
+                self._add(note_id, signature)
+                entries.append({"op": "add", "id": note_id, "signature": signature.tolist()})
+            if entries:
+                self.files.append(*entries)
+
+    def remove_note(self, note_id: str):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            if note_id not in self.signatures:
+                return
+            self._remove(note_id)
+            self.files.append({"op": "remove", "id": note_id})
+
+    def _matches(self, signature: np.ndarray, exclude: Optional[str], threshold: Optional[float],
+                 limit: Optional[int]) -> List[Tuple[str, float]]:
+        candidates = set()
+        for band, key in enumerate(band_keys(signature, self.bands)):
+            candidates.update(self.buckets[band].get(key, ()))
+        candidates.discard(exclude)
+        threshold = self.threshold if threshold is None else threshold
+        scored = [(note_id, similarity(signature, self.signatures[note_id])) for note_id in candidates]
+        matches = sorted((match for match in scored if match[1] >= threshold), key=lambda match: (-match[1], match[0]))
+        return matches[:limit] if limit else matches
+
+    def similar(self, note_id: str, threshold: Optional[float] = None,
+                limit: Optional[int] = 5) -> List[Tuple[str, float]]:
+        """(note id, similarity) of the indexed note's near-duplicates, most similar first"""
+        if not self.enabled:
+            return []
+        with self._lock:
+            self._ensure_loaded()
+            signature = self.signatures.get(note_id)
+            if signature is None:
+                return []
+            return self._matches(signature, note_id, threshold, limit)
+
+    def find(self, text: str, threshold: Optional[float] = None,
+             limit: Optional[int] = 5) -> List[Tuple[str, float]]:
+        """(note id, similarity) of notes that are near-duplicates of ``text``, most similar first"""
+        if not self.enabled:
+            return []
+        signature = self.hasher.signature(text)
+        if signature is None:
+            return []
+        with self._lock:
+            self._ensure_loaded()
+            return self._matches(signature, None, threshold, limit)
@@ -0,0 +1,167 @@
+import json
+import math
+import re
+import threading
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from app.api.models import Note
+from app.services.journaled_snapshot import JournaledSnapshot
+import logging
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is",
+    "it", "of", "on", "or", "that", "the", "this", "to", "was", "with",
+}
+TITLE_WEIGHT = 2  # Title terms count twice towards term frequency
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase word tokens, dropping stopwords"""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def note_terms(note: Note) -> Dict[str, int]:
+    """Build the weighted term frequencies for a note's title and content"""
+    terms = Counter(tokenize(note.content))
+    for term in tokenize(note.title):
+        terms[term] += TITLE_WEIGHT
+    return dict(terms)
+
+
+class SearchIndex:
+    """Persistent inverted index over note titles and content with BM25 ranking.
+
+    The index is stored as a JSON snapshot plus an append-only journal of
+    changes since the snapshot (a ``JournaledSnapshot``). It is loaded on
+    first use; if no snapshot exists it is rebuilt from the notes yielded
+    by ``note_loader``.
+
+    A ``read_only`` index loads the files but keeps its changes in memory,
+    for processes that share the files with the one that writes them.
+    """
+
+    def __init__(self, index_dir: str, note_loader: Callable[[], Iterable[Note]],
+                 k1: float = 1.5, b: float = 0.75):
+        self.files = JournaledSnapshot(index_dir, "search_index.json", "search_index.journal", self._write_snapshot)
+        self.note_loader = note_loader
+        self.k1 = k1
+        self.b = b
+
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.doc_terms: Dict[str, List[str]] = {}
+        self.total_length = 0
+        self._loaded = False
+        # BrainService calls into the index from its I/O thread pool
+        self._lock = threading.RLock()
+
+    @property
+    def read_only(self) -> bool:
+        return self.files.read_only
+
+    @read_only.setter
+    def read_only(self, value: bool):
+        self.files.read_only = value
+
+    def _ensure_loaded(self):
+        """Load the index from disk, or rebuild it from the notes, on first use"""
+        if self._loaded:
+            return
+        if not self.files.load(self._read_snapshot, self._apply):
+            logger.info("Search index not found, rebuilding from notes...")
+            for note in self.note_loader():
+                self._add(note.id, note_terms(note))
+            self.files.save()
+        self._loaded = True
+
+    def _read_snapshot(self, f) -> bool:
+        for note_id, terms in json.load(f).get("docs", {}).items():
+            self._add(note_id, terms)
+        return True
+
+    def _write_snapshot(self, f):
+        docs = {
+            note_id: {term: self.postings[term][note_id] for term in terms}
+            for note_id, terms in self.doc_terms.items()
+        }
+        json.dump({"version": 1, "docs": docs}, f)
+
+    def _apply(self, entry: dict):
+        self._remove(entry["id"])
+        if entry["op"] == "add":
+            self._add(entry["id"], entry["terms"])
+
+    def _add(self, note_id: str, terms: Dict[str, int]):
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[note_id] = tf
+        length = sum(terms.values())
+        self.doc_lengths[note_id] = length
+        self.doc_terms[note_id] = list(terms)
+        self.total_length += length
+
+    def _remove(self, note_id: str):
+        terms = self.doc_terms.pop(note_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(note_id, None)
+            if not postings:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(note_id, 0)
+
+    def add_note(self, note: Note):
+        """Index a new note, or re-index an existing one in place"""
+        terms = note_terms(note)
+        with self._lock:
+            self._ensure_loaded()
+            self._remove(note.id)
+            self._add(note.id, terms)
+            self.files.append({"op": "add", "id": note.id, "terms": terms})
+
+    def add_notes(self, notes: Iterable[Note]):
+        """Index a batch of notes with a single journal write"""
+        entries = [{"op": "add", "id": note.id, "terms": note_terms(note)} for note in notes]
+        with self._lock:
+            self._ensure_loaded()
+            for entry in entries:
+                self._remove(entry["id"])
+                self._add(entry["id"], entry["terms"])
+            self.files.append(*entries)
+
+    def remove_note(self, note_id: str):
+        """Drop a note from the index"""
+        with self._lock:
+            self._ensure_loaded()
+            if note_id not in self.doc_terms:
+                return
+            self._remove(note_id)
+            self.files.append({"op": "remove", "id": note_id})
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Return (note_id, score) pairs ranked by BM25, best match first"""
+        query_terms = set(tokenize(query))
+        with self._lock:
+            self._ensure_loaded()
+            if not query_terms or not self.doc_lengths:
+                return []
+
+            doc_count = len(self.doc_lengths)
+            avg_length = self.total_length / doc_count
+            scores: Dict[str, float] = {}
+            for term in query_terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for note_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[note_id] / avg_length)
+                    scores[note_id] = scores.get(note_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:limit] if limit else ranked
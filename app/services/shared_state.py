@@ -0,0 +1,117 @@
+import asyncio
+import fcntl
+import os
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+from app.config import DATA_DIR
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHAT_LOCK_POLL_SECONDS = 0.005
+CHAT_LOCK_MAX_POLL_SECONDS = 0.1
+
+
+class ProcessLock:
+    """Exclusive lock on a file, held by at most one process on the host until it exits.
+
+    Used to elect the primary worker: the one that owns the index files and
+    receives updates from Telegram.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        if self.held:
+            return True
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self.held:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+@contextmanager
+def file_lock(path: str, shared: bool = False):
+    """Block until holding a shared or exclusive lock on ``path``"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # Closing the descriptor releases the lock
+
+
+class ChatLocks:
+    """Mutual exclusion per chat across processes, so one chat is handled by one worker at a time.
+
+    Each chat locks one byte of a shared lock file (POSIX record locks), so
+    unrelated chats never contend. Record locks belong to the process, so
+    this does not exclude coroutines of the same process; the dispatcher
+    already serializes a chat within a process.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def _open(self) -> int:
+        # One descriptor for the process lifetime: closing any descriptor of the file drops all its record locks
+        if self._fd is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        return self._fd
+
+    @staticmethod
+    def _offset(chat_id: int) -> int:
+        return chat_id & ((1 << 62) - 1)  # Group chat ids are negative
+
+    @asynccontextmanager
+    async def hold(self, chat_id: int):
+        fd, offset = self._open(), self._offset(chat_id)
+        delay = CHAT_LOCK_POLL_SECONDS
+        while True:
+            try:
+                fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, offset)
+                break
+            except (BlockingIOError, PermissionError):
+                # Polled rather than blocking a thread per waiting chat
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, CHAT_LOCK_MAX_POLL_SECONDS)
+        try:
+            yield
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN, 1, offset)
+
+
+_primary_locks: Dict[str, ProcessLock] = {}
+chat_locks = ChatLocks(os.path.join(DATA_DIR, "state", "chats.lock"))
+
+
+def is_primary_process(data_dir: str = DATA_DIR) -> bool:
+    """Whether this process is (or has just become) the primary worker for ``data_dir``"""
+    # One lock object per path: a second descriptor in the same process would not get the flock
+    path = os.path.join(os.path.abspath(data_dir), "state", "primary.lock")
+    lock = _primary_locks.get(path)
+    if lock is None:
+        lock = _primary_locks[path] = ProcessLock(path)
+    return lock.try_acquire()
@@ -0,0 +1,520 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+from app.api.models import Note
+from app.services.shared_state import file_lock
+import logging
+
+logger = logging.getLogger(__name__)
+
+JSON_MIGRATED = "json_migrated"  # Meta key set once the legacy notes directory has been fully imported
+
+
+class NoteExistsError(Exception):
+    """Raised when inserting a note whose id is already taken"""
+
+
+def recency_key(note: Note) -> Tuple[str, str]:
+    """Sort key for newest-first listing and pagination cursors"""
+    return (note.updated_at.isoformat(), note.id)
+
+
+class NoteChange(NamedTuple):
+    """Latest change to a note, as recorded in a storage change log"""
+    seq: int
+    note_id: str
+    updated_at: Optional[str]
+    deleted: bool
+
+
+def serialize_note(note: Note) -> str:
+    return json.dumps(note.model_dump(mode="json"))
+
+
+def deserialize_note(data: str) -> Note:
+    return Note(**json.loads(data))
+
+
+class NoteStorage:
+    """Interface for the backends BrainService persists notes through"""
+
+    # Whether changes_since() is available, letting several processes keep their indexes in sync
+    tracks_changes = False
+
+    def get(self, note_id: str) -> Optional[Note]:
+        raise NotImplementedError
+
+    def get_many(self, note_ids: List[str]) -> List[Note]:
+        """Fetch several notes, in the given order, skipping missing ids"""
+        notes = [self.get(note_id) for note_id in note_ids]
+        return [note for note in notes if note is not None]
+
+    def put(self, note: Note):
+        raise NotImplementedError
+
+    def insert(self, note: Note):
+        """Store a new note, raising NoteExistsError instead of overwriting"""
+        raise NotImplementedError
+
+    def put_many(self, notes: Iterable[Note]) -> int:
+        count = 0
+        for note in notes:
+            self.put(note)
+            count += 1
+        return count
+
+    def delete(self, note_id: str) -> bool:
+        raise NotImplementedError
+
+    def replace_many(self, put: Iterable[Note] = (), delete: Iterable[str] = ()):
+        """Store ``put`` and delete the ``delete`` ids in one atomic write"""
+        raise NotImplementedError
+
+    def exists(self, note_id: str) -> bool:
+        return self.get(note_id) is not None
+
+    def iter_notes(self) -> Iterator[Note]:
+        raise NotImplementedError
+
+    def iter_timestamps(self) -> Iterator[Tuple[str, str, str]]:
+        """Yield (id, created_at, updated_at) for every note, timestamps in ISO form"""
+        for note in self.iter_notes():
+            yield note.id, note.created_at.isoformat(), note.updated_at.isoformat()
+
+    def iter_recent(self, before: Optional[Tuple[str, str]] = None) -> Iterator[Note]:
+        """Yield notes newest first by (updated_at, id), starting after the ``before`` cursor"""
+        notes = sorted(self.iter_notes(), key=recency_key, reverse=True)
+        for note in notes:
+            if before is None or recency_key(note) < before:
+                yield note
+
+    def iter_changed(self, since: Optional[str] = None, until: Optional[str] = None) -> Iterator[Note]:
+        """Yield notes with ``since < updated_at <= until`` (ISO timestamps), oldest change first"""
+        notes = sorted(self.iter_notes(), key=recency_key)
+        for note in notes:
+            updated_at = note.updated_at.isoformat()
+            if (since is None or updated_at > since) and (until is None or updated_at <= until):
+                yield note
+
+    def count(self) -> int:
+        return sum(1 for _ in self.iter_notes())
+
+    def changes_since(self, seq: int, limit: int = 1000) -> List[NoteChange]:
+        """The latest change of each note changed after ``seq``, in commit order"""
+        raise NotImplementedError
+
+    def last_change_seq(self) -> int:
+        raise NotImplementedError
+
+    def iter_change_log(self, since_seq: int, until_seq: int) -> Iterator[Tuple[NoteChange, Optional[Note]]]:
+        """Yield each note's latest change with ``since_seq < seq <= until_seq`` and the note (None if deleted)"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class JsonFileStorage(NoteStorage):
+    """Legacy layout: one JSON file per note in a directory"""
+
+    def __init__(self, notes_dir: str):
+        self.notes_dir = notes_dir
+        os.makedirs(self.notes_dir, exist_ok=True)
+
+    def _get_note_path(self, note_id: str) -> str:
+        """Get the full path for a note file"""
+        return os.path.join(self.notes_dir, f"{note_id}.json")
+
+    def get(self, note_id: str) -> Optional[Note]:
+        note_path = self._get_note_path(note_id)
+        if not os.path.exists(note_path):
+            return None
+        with open(note_path, 'r', encoding='utf-8') as f:
+            return deserialize_note(f.read())
+
+    def _write_temp(self, note: Note) -> str:
+        """Write a note to a unique temp file in the notes directory"""
+        tmp_path = os.path.join(self.notes_dir, f".{note.id}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(serialize_note(note))
+            f.flush()
+            os.fsync(f.fileno())
+        return tmp_path
+
+    def put(self, note: Note):
+        # Rename over the old file so readers never see a partial write
+        os.replace(self._write_temp(note), self._get_note_path(note.id))
+
+    def insert(self, note: Note):
+        tmp_path = self._write_temp(note)
+        try:
+            # link() fails if the target exists, unlike rename()
+            os.link(tmp_path, self._get_note_path(note.id))
+        except FileExistsError:
+            raise NoteExistsError(f"Note {note.id} already exists")
+        finally:
+            os.remove(tmp_path)
+
+    def delete(self, note_id: str) -> bool:
+        note_path = self._get_note_path(note_id)
+        if not os.path.exists(note_path):
+            return False
+        os.remove(note_path)
+        return True
+
+    def replace_many(self, put: Iterable[Note] = (), delete: Iterable[str] = ()):
+        # Files cannot be changed together; a crash in between leaves the deleted notes in place
+        self.put_many(put)
+        for note_id in delete:
+            self.delete(note_id)
+
+    def exists(self, note_id: str) -> bool:
+        return os.path.exists(self._get_note_path(note_id))
+
+    def iter_notes(self) -> Iterator[Note]:
+        for filename in os.listdir(self.notes_dir):
+            if not filename.endswith('.json'):
+                continue
+            with open(os.path.join(self.notes_dir, filename), 'r', encoding='utf-8') as f:
+                yield deserialize_note(f.read())
+
+
+class SQLiteStorage(NoteStorage):
+    """Single-file storage in an embedded SQLite database running in WAL mode.
+
+    Every write is an atomic transaction, lookups by id go through the
+    primary key index, and ``put_many`` commits a whole batch at once.
+
+    Each write also records the note in a change log holding one row per
+    note with a sequence number that grows in commit order, so processes
+    sharing the database can find what others changed.
+    """
+
+    tracks_changes = True
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS notes (
+                id TEXT PRIMARY KEY,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                data TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS notes_updated_at ON notes (updated_at, id)")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS note_changes (
+                note_id TEXT PRIMARY KEY,
+                seq INTEGER NOT NULL,
+                updated_at TEXT,
+                deleted INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS note_changes_seq ON note_changes (seq)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    @staticmethod
+    def _row(note: Note) -> tuple:
+        return (note.id, note.created_at.isoformat(), note.updated_at.isoformat(), serialize_note(note))
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front, so change sequence numbers follow commit order
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _log_changes(self, rows: List[tuple]):
+        """Record (note_id, updated_at, deleted) rows in the change log; call inside a transaction"""
+        self._conn.executemany(
+            "INSERT INTO note_changes (note_id, seq, updated_at, deleted) "
+            "VALUES (?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM note_changes), ?, ?) "
+            "ON CONFLICT (note_id) DO UPDATE SET seq = excluded.seq, updated_at = excluded.updated_at, "
+            "deleted = excluded.deleted",
+            rows
+        )
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (key, value)
+            )
+
+    def known_ids(self, note_ids: List[str]) -> Set[str]:
+        """The ids among ``note_ids`` ever written here, including since deleted ones"""
+        if not note_ids:
+            return set()
+        placeholders = ",".join("?" * len(note_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT note_id FROM note_changes WHERE note_id IN ({placeholders})", note_ids
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def get(self, note_id: str) -> Optional[Note]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM notes WHERE id = ?", (note_id,)).fetchone()
+        return deserialize_note(row[0]) if row else None
+
+    def get_many(self, note_ids: List[str]) -> List[Note]:
+        if not note_ids:
+            return []
+        placeholders = ",".join("?" * len(note_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, data FROM notes WHERE id IN ({placeholders})", note_ids
+            ).fetchall()
+        found = dict(rows)
+        return [deserialize_note(found[note_id]) for note_id in note_ids if note_id in found]
+
+    def put(self, note: Note):
+        self.put_many([note])
+
+    def insert(self, note: Note):
+        try:
+            with self._transaction():
+                self._conn.execute(
+                    "INSERT INTO notes (id, created_at, updated_at, data) VALUES (?, ?, ?, ?)",
+                    self._row(note)
+                )
+                self._log_changes([(note.id, note.updated_at.isoformat(), 0)])
+        except sqlite3.IntegrityError:
+            raise NoteExistsError(f"Note {note.id} already exists")
+
+    def _write(self, notes: Iterable[Note]) -> int:
+        """Replace notes and log the changes; call inside a transaction"""
+        rows = [self._row(note) for note in notes]
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO notes (id, created_at, updated_at, data) VALUES (?, ?, ?, ?)",
+            rows
+        )
+        self._log_changes([(row[0], row[2], 0) for row in rows])
+        return len(rows)
+
+    def _remove(self, note_ids: Iterable[str]) -> int:
+        """Delete notes and log the deletions; call inside a transaction"""
+        deleted = [
+            note_id for note_id in note_ids
+            if self._conn.execute("DELETE FROM notes WHERE id = ?", (note_id,)).rowcount > 0
+        ]
+        self._log_changes([(note_id, None, 1) for note_id in deleted])
+        return len(deleted)
+
+    def put_many(self, notes: Iterable[Note]) -> int:
+        with self._transaction():
+            return self._write(notes)
+
+    def delete(self, note_id: str) -> bool:
+        with self._transaction():
+            return self._remove([note_id]) > 0
+
+    def replace_many(self, put: Iterable[Note] = (), delete: Iterable[str] = ()):
+        with self._transaction():
+            self._write(put)
+            self._remove(delete)
+
+    def exists(self, note_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM notes WHERE id = ?", (note_id,)).fetchone()
+        return row is not None
+
+    def iter_notes(self, batch_size: int = 500) -> Iterator[Note]:
+        # Page by primary key so the lock is never held while the caller iterates
+        last_id = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, data FROM notes WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for _, data in rows:
+                yield deserialize_note(data)
+            last_id = rows[-1][0]
+
+    def iter_timestamps(self, batch_size: int = 5000) -> Iterator[Tuple[str, str, str]]:
+        # Reads only the timestamp columns, without parsing note bodies
+        last_id = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, created_at, updated_at FROM notes WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last_id = rows[-1][0]
+
+    def iter_recent(self, before: Optional[Tuple[str, str]] = None, batch_size: int = 100) -> Iterator[Note]:
+        # Walks the (updated_at, id) index, so only the pages actually consumed are read
+        cursor = before
+        while True:
+            with self._lock:
+                if cursor is None:
+                    rows = self._conn.execute(
+                        "SELECT updated_at, id, data FROM notes ORDER BY updated_at DESC, id DESC LIMIT ?",
+                        (batch_size,)
+                    ).fetchall()
+                else:
+                    rows = self._conn.execute(
+                        "SELECT updated_at, id, data FROM notes WHERE updated_at < ? OR (updated_at = ? AND id < ?) "
+                        "ORDER BY updated_at DESC, id DESC LIMIT ?",
+                        (cursor[0], cursor[0], cursor[1], batch_size)
+                    ).fetchall()
+            if not rows:
+                return
+            for _, _, data in rows:
+                yield deserialize_note(data)
+            cursor = (rows[-1][0], rows[-1][1])
+
+    def iter_changed(self, since: Optional[str] = None, until: Optional[str] = None,
+                     batch_size: int = 500) -> Iterator[Note]:
+        # Pages along the (updated_at, id) index in ascending order
+        until = until or "9999"
+        rows = None
+        while True:
+            with self._lock:
+                if rows is None:
+                    rows = self._conn.execute(
+                        "SELECT updated_at, id, data FROM notes WHERE updated_at > ? AND updated_at <= ? "
+                        "ORDER BY updated_at, id LIMIT ?",
+                        (since or "", until, batch_size)
+                    ).fetchall()
+                else:
+                    last_updated_at, last_id = rows[-1][0], rows[-1][1]
+                    rows = self._conn.execute(
+                        "SELECT updated_at, id, data FROM notes WHERE (updated_at > ? OR (updated_at = ? AND id > ?)) "
+                        "AND updated_at <= ? ORDER BY updated_at, id LIMIT ?",
+                        (last_updated_at, last_updated_at, last_id, until, batch_size)
+                    ).fetchall()
+            if not rows:
+                return
+            for _, _, data in rows:
+                yield deserialize_note(data)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+
+    def changes_since(self, seq: int, limit: int = 1000) -> List[NoteChange]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, note_id, updated_at, deleted FROM note_changes WHERE seq > ? ORDER BY seq LIMIT ?",
+                (seq, limit)
+            ).fetchall()
+        return [NoteChange(seq, note_id, updated_at, bool(deleted)) for seq, note_id, updated_at, deleted in rows]
+
+    def last_change_seq(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM note_changes").fetchone()[0]
+
+    def iter_change_log(self, since_seq: int, until_seq: int,
+                        batch_size: int = 500) -> Iterator[Tuple[NoteChange, Optional[Note]]]:
+        # A note changed again while this runs moves past until_seq, so it is left to the next export
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT c.seq, c.note_id, c.updated_at, c.deleted, n.data FROM note_changes c "
+                    "LEFT JOIN notes n ON n.id = c.note_id WHERE c.seq > ? AND c.seq <= ? ORDER BY c.seq LIMIT ?",
+                    (since_seq, until_seq, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for seq, note_id, updated_at, deleted, data in rows:
+                change = NoteChange(seq, note_id, updated_at, bool(deleted))
+                yield change, deserialize_note(data) if data is not None and not deleted else None
+            since_seq = rows[-1][0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def migrate_json_directory(notes_dir: str, storage: NoteStorage, batch_size: int = 500,
+                           resume: bool = False) -> int:
+    """Import every note from a legacy one-file-per-note directory into ``storage``.
+
+    With ``resume``, notes the SQLite ``storage`` has already seen, even
+    if deleted since, are skipped, so an interrupted import can be re-run
+    without overwriting newer changes.
+    """
+    source = JsonFileStorage(notes_dir)
+    imported = 0
+    batch = []
+
+    def flush():
+        nonlocal imported
+        if resume:
+            known = storage.known_ids([note.id for note in batch])
+            batch[:] = [note for note in batch if note.id not in known]
+        if batch:
+            imported += storage.put_many(batch)
+        batch.clear()
+
+    for note in source.iter_notes():
+        batch.append(note)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    logger.info(f"Imported {imported} notes from {notes_dir}")
+    return imported
+
+
+def create_storage(backend: str, data_dir: str) -> NoteStorage:
+    """Create the configured storage backend rooted at ``data_dir``"""
+    notes_dir = os.path.join(data_dir, "notes")
+    if backend == "json":
+        return JsonFileStorage(notes_dir)
+    if backend == "sqlite":
+        storage = SQLiteStorage(os.path.join(data_dir, "notes.db"))
+        # Import of notes written by the legacy JSON backend, resumed on every start until it has completed
+        if storage.get_meta(JSON_MIGRATED) is None:
+            with file_lock(os.path.join(data_dir, ".migrate.lock")):
+                if storage.get_meta(JSON_MIGRATED) is None:
+                    if os.path.isdir(notes_dir) and os.listdir(notes_dir):
+                        migrate_json_directory(notes_dir, storage, resume=True)
+                    storage.set_meta(JSON_MIGRATED, datetime.now().isoformat())
+        return storage
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import a data/notes directory into a SQLite note store")
+    parser.add_argument("notes_dir", help="Directory containing <id>.json note files")
+    parser.add_argument("db_path", help="SQLite database to import into")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    target = SQLiteStorage(args.db_path)
+    count = migrate_json_directory(args.notes_dir, target, batch_size=args.batch_size)
+    target.close()
+    print(f"Imported {count} notes into {args.db_path}")
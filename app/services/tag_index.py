@@ -0,0 +1,196 @@
+import bisect
+import heapq
+import json
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from app.api.models import Note
+from app.services.journaled_snapshot import JournaledSnapshot
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _contains(sorted_ids: List[str], note_id: str) -> bool:
+    i = bisect.bisect_left(sorted_ids, note_id)
+    return i < len(sorted_ids) and sorted_ids[i] == note_id
+
+
+class TagIndex:
+    """Persistent index from tag to the sorted ids of the notes carrying it.
+
+    Note ids sort by creation time, so each posting list is also in
+    creation order. Tags are kept in a sorted list (case-folded) for prefix
+    lookups. Like ``SearchIndex``, the index is a JSON snapshot plus a
+    journal, rebuilt from ``note_loader`` if no snapshot exists, and can be
+    opened ``read_only``.
+    """
+
+    def __init__(self, index_dir: str, note_loader: Callable[[], Iterable[Note]]):
+        self.files = JournaledSnapshot(index_dir, "tag_index.json", "tag_index.journal", self._write_snapshot)
+        self.note_loader = note_loader
+
+        self.postings: Dict[str, List[str]] = {}
+        self.note_tags: Dict[str, List[str]] = {}
+        self.sorted_tags: List[Tuple[str, str]] = []  # (casefolded tag, tag)
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    @property
+    def read_only(self) -> bool:
+        return self.files.read_only
+
+    @read_only.setter
+    def read_only(self, value: bool):
+        self.files.read_only = value
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        if not self.files.load(self._read_snapshot, self._apply):
+            logger.info("Tag index not found, rebuilding from notes...")
+            for note in self.note_loader():
+                self._add(note.id, note.tags)
+            self.files.save()
+        self._loaded = True
+
+    def _read_snapshot(self, f) -> bool:
+        for note_id, tags in json.load(f).get("docs", {}).items():
+            self._add(note_id, tags)
+        return True
+
+    def _write_snapshot(self, f):
+        json.dump({"version": 1, "docs": self.note_tags}, f)
+
+    def _apply(self, entry: dict):
+        self._remove(entry["id"])
+        if entry["op"] == "add":
+            self._add(entry["id"], entry["tags"])
+
+    def _add(self, note_id: str, tags: List[str]):
+        tags = list(dict.fromkeys(tags))
+        if not tags:
+            return
+        self.note_tags[note_id] = tags
+        for tag in tags:
+            ids = self.postings.get(tag)
+            if ids is None:
+                ids = self.postings[tag] = []
+                bisect.insort(self.sorted_tags, (tag.casefold(), tag))
+            bisect.insort(ids, note_id)
+
+    def _remove(self, note_id: str):
+        for tag in self.note_tags.pop(note_id, []):
+            ids = self.postings.get(tag)
+            if ids is None:
+                continue
+            i = bisect.bisect_left(ids, note_id)
+            if i < len(ids) and ids[i] == note_id:
+                del ids[i]
+            if not ids:
+                del self.postings[tag]
+                key = (tag.casefold(), tag)
+                i = bisect.bisect_left(self.sorted_tags, key)
+                if i < len(self.sorted_tags) and self.sorted_tags[i] == key:
+                    del self.sorted_tags[i]
+
+    def add_note(self, note: Note):
+        """Index a new note, or re-index an existing one's tags"""
+        with self._lock:
+            self._ensure_loaded()
+            if self.note_tags.get(note.id, []) == list(dict.fromkeys(note.tags)):
+                return
+            self._remove(note.id)
+            self._add(note.id, note.tags)
+            self.files.append({"op": "add", "id": note.id, "tags": note.tags})
+
+    def add_notes(self, notes: Iterable[Note]):
+        """Index a batch of notes with a single journal write"""
+        with self._lock:
+            self._ensure_loaded()
+            entries = []
+            for note in notes:
+                if self.note_tags.get(note.id, []) == list(dict.fromkeys(note.tags)):
+                    continue
+                self._remove(note.id)
+                self._add(note.id, note.tags)
+                entries.append({"op": "add", "id": note.id, "tags": note.tags})
+            if entries:
+                self.files.append(*entries)
+
+    def remove_note(self, note_id: str):
+        with self._lock:
+            self._ensure_loaded()
+            if note_id not in self.note_tags:
+                return
+            self._remove(note_id)
+            self.files.append({"op": "remove", "id": note_id})
+
+    def match(self, tags: List[str]) -> List[str]:
+        """Return the sorted ids of notes carrying all ``tags``.
+
+        Starts from the rarest tag and probes the other posting lists by
+        binary search, so the cost follows the smallest list.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            lists = []
+            for tag in set(tags):
+                ids = self.postings.get(tag)
+                if not ids:
+                    return []
+                lists.append(ids)
+            if not lists:
+                return []
+            lists.sort(key=len)
+            return [note_id for note_id in lists[0] if all(_contains(ids, note_id) for ids in lists[1:])]
+
+    def filter(self, note_ids: Iterable[str], tags: List[str]) -> List[str]:
+        """Keep the ids, in their given order, of notes carrying all ``tags``"""
+        with self._lock:
+            self._ensure_loaded()
+            return [
+                note_id for note_id in note_ids
+                if all(tag in self.note_tags.get(note_id, ()) for tag in tags)
+            ]
+
+    def facets(self, tags: Optional[List[str]] = None, prefix: Optional[str] = None,
+               limit: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Return (tag, note count) pairs, most used first.
+
+        With ``tags``, counts are over the notes carrying all of them (the
+        selected tags themselves are left out). With ``prefix``, only tags
+        starting with it (case-insensitive) are counted.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            if prefix:
+                folded = prefix.casefold()
+                start = bisect.bisect_left(self.sorted_tags, (folded, ""))
+                candidates = []
+                for key, tag in self.sorted_tags[start:]:
+                    if not key.startswith(folded):
+                        break
+                    candidates.append(tag)
+            else:
+                candidates = None
+
+            if tags:
+                selected = set(tags)
+                counts: Dict[str, int] = {}
+                for note_id in self.match(tags):
+                    for tag in self.note_tags[note_id]:
+                        if tag not in selected:
+                            counts[tag] = counts.get(tag, 0) + 1
+                if candidates is not None:
+                    counts = {tag: counts[tag] for tag in candidates if tag in counts}
+            else:
+                counts = {tag: len(self.postings[tag]) for tag in (candidates if candidates is not None else self.postings)}
+
+        ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit] if limit else ranked
+
+    def top_tags(self, limit: int = 20) -> List[str]:
+        """The ``limit`` most used tags"""
+        with self._lock:
+            self._ensure_loaded()
+            return heapq.nlargest(limit, self.postings, key=lambda tag: len(self.postings[tag]))
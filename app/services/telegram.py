@@ -1,9 +1,24 @@
+import asyncio
+import json
+import os
+import time
 import httpx
-from app.config import TELEGRAM_API_TOKEN
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from pydantic import ValidationError
+from app.api.models import TelegramUpdate
+from app.config import (
+    TELEGRAM_API_TOKEN, TELEGRAM_API_URL, TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE,
+    TELEGRAM_CHAT_BURST, TELEGRAM_MAX_RETRIES, TELEGRAM_EDIT_INTERVAL,
+    TELEGRAM_POLL_TIMEOUT, TELEGRAM_POLL_LIMIT, DATA_DIR
+)
+from app.services.metrics import TELEGRAM_LATENCY, TELEGRAM_ERRORS, TELEGRAM_SEND_LATENCY, QUEUE_DEPTH
 import logging
 
 logger = logging.getLogger(__name__)
-TELEGRAM_API_BASE = f"https://api.telegram.org/bot{TELEGRAM_API_TOKEN}"
+TELEGRAM_API_BASE = f"{TELEGRAM_API_URL}/bot{TELEGRAM_API_TOKEN}"
+TELEGRAM_FILE_BASE = f"{TELEGRAM_API_URL}/file/bot{TELEGRAM_API_TOKEN}"
+MAX_MESSAGE_LENGTH = 4096
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
 
 def escape_markdown(text: str) -> str:
     """Escape special characters for Telegram MarkdownV2"""
@@ -12,53 +27,452 @@ def escape_markdown(text: str) -> str:
         text = text.replace(char, f'\\{char}')
     return text
 
+def split_message(text: str, limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """Split text into chunks Telegram accepts, preferring line and word boundaries"""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n ")
+    if text or not chunks:
+        chunks.append(text)
+    return chunks
+
+
+class TokenBucket:
+    """Async token bucket allowing ``rate`` operations per second with bursts up to ``capacity``"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class TelegramClient:
+    """Long-lived Bot API client with pooled connections and a rate-limited send queue.
+
+    Outgoing messages go through a queue that delivers them in order per chat,
+    concurrently across chats, within Telegram's global and per-chat limits.
+    """
+
+    def __init__(self, base_url: str = TELEGRAM_API_BASE, global_rate: float = TELEGRAM_GLOBAL_RATE,
+                 chat_rate: float = TELEGRAM_CHAT_RATE, chat_burst: float = TELEGRAM_CHAT_BURST,
+                 max_retries: int = TELEGRAM_MAX_RETRIES, file_base_url: str = TELEGRAM_FILE_BASE,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url
+        self.file_base_url = file_base_url
+        self.transport = transport
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.global_bucket: Optional[TokenBucket] = None
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._chat_tails: Dict[int, asyncio.Task] = {}
+
+    @property
+    def started(self) -> bool:
+        return self._client is not None
+
+    async def start(self):
+        if self.started:
+            return
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(30.0, connect=10.0),
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60),
+            transport=self.transport,
+        )
+        self.global_bucket = TokenBucket(self.global_rate, self.global_rate)
+        self.chat_buckets = {}
+        self._queue = asyncio.Queue()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def stop(self):
+        if not self.started:
+            return
+        # Deliver what is already queued before closing the connection pool
+        await self._queue.join()
+        if self._chat_tails:
+            await asyncio.gather(*self._chat_tails.values(), return_exceptions=True)
+        self._dispatcher.cancel()
+        await asyncio.gather(self._dispatcher, return_exceptions=True)
+        await self._client.aclose()
+        self._client = None
+        self._queue = None
+        self._dispatcher = None
+
+    async def call(self, method: str, payload: Optional[dict] = None, timeout: Optional[float] = None) -> dict:
+        """Call a Bot API method, retrying on 429 and transport errors"""
+        await self.start()
+        kwargs = {"json": payload or {}}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        latency = TELEGRAM_LATENCY.labels(method)
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                response = await self._client.post(f"/{method}", **kwargs)
+                resp_json = response.json()
+            except (httpx.TransportError, ValueError) as e:
+                TELEGRAM_ERRORS.labels(method).inc()
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"Telegram {method} failed ({e}), retrying...")
+                await asyncio.sleep(2 ** attempt)
+                continue
+            finally:
+                latency.observe(time.perf_counter() - start)
+
+            if not resp_json.get("ok"):
+                TELEGRAM_ERRORS.labels(method).inc()
+            if response.status_code == 429 and attempt < self.max_retries:
+                retry_after = resp_json.get("parameters", {}).get("retry_after", 1)
+                logger.warning(f"Telegram rate limit hit on {method}, retrying after {retry_after}s")
+                await asyncio.sleep(retry_after)
+                continue
+            return resp_json
+
+    async def send_message(self, chat_id: int, text: str, parse_mode: Optional[str] = None, **extra) -> dict:
+        """Queue a message for delivery, splitting it if it is too long, and wait for the result"""
+        await self.start()
+        futures = []
+        for chunk in split_message(text):
+            payload = {"chat_id": chat_id, "text": chunk, **extra}
+            if parse_mode:
+                payload["parse_mode"] = parse_mode
+            future = asyncio.get_running_loop().create_future()
+            await self._queue.put((chat_id, payload, future))
+            futures.append(future)
+        results = await asyncio.gather(*futures)
+        return results[-1]
+
+    async def edit_message(self, chat_id: int, message_id: int, text: str) -> dict:
+        """Replace the text of a sent message, within the same rate limits as sends"""
+        await self.start()
+        await self._chat_bucket(chat_id).acquire()
+        await self.global_bucket.acquire()
+        return await self.call("editMessageText", {"chat_id": chat_id, "message_id": message_id, "text": text})
+
+    async def get_file(self, file_id: str) -> dict:
+        """Look up a file sent to the bot; its ``file_path`` is valid for at least an hour"""
+        resp_json = await self.call("getFile", {"file_id": file_id})
+        if not resp_json.get("ok"):
+            raise RuntimeError(f"getFile failed: {resp_json.get('description', resp_json)}")
+        return resp_json["result"]
+
+    async def download_file(self, file_path: str) -> AsyncIterator[bytes]:
+        """Stream a file's content in chunks, without holding it in memory.
+
+        A local Bot API server returns absolute paths on its own disk; those
+        are read directly.
+        """
+        if os.path.isabs(file_path):
+            with open(file_path, 'rb') as f:
+                while True:
+                    chunk = await asyncio.to_thread(f.read, DOWNLOAD_CHUNK_BYTES)
+                    if not chunk:
+                        return
+                    yield chunk
+        await self.start()
+        with TELEGRAM_LATENCY.labels("downloadFile").time():
+            async with self._client.stream("GET", f"{self.file_base_url}/{file_path}") as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_BYTES):
+                    yield chunk
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _prune_buckets(self):
+        for chat_id in [c for c, b in self.chat_buckets.items() if c not in self._chat_tails and b.is_full()]:
+            del self.chat_buckets[chat_id]
+
+    async def _dispatch(self):
+        while True:
+            chat_id, payload, future = await self._queue.get()
+            # Chain onto the chat's previous delivery to keep per-chat order
+            previous = self._chat_tails.get(chat_id)
+            task = asyncio.create_task(self._deliver(chat_id, payload, future, previous))
+            self._chat_tails[chat_id] = task
+            task.add_done_callback(lambda t, c=chat_id: self._on_delivered(c, t))
+            if len(self.chat_buckets) > 1000:
+                self._prune_buckets()
+
+    def _on_delivered(self, chat_id: int, task: asyncio.Task):
+        if self._chat_tails.get(chat_id) is task:
+            del self._chat_tails[chat_id]
+        self._queue.task_done()
+
+    async def _deliver(self, chat_id: int, payload: dict, future: asyncio.Future, previous: Optional[asyncio.Task]):
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        try:
+            await self._chat_bucket(chat_id).acquire()
+            await self.global_bucket.acquire()
+            resp_json = await self.call("sendMessage", payload)
+            if not resp_json.get("ok") and payload.get("parse_mode"):
+                logger.error(f"Error sending message: {resp_json}")
+                # Try sending without parse_mode if it fails
+                payload = {k: v for k, v in payload.items() if k != "parse_mode"}
+                resp_json = await self.call("sendMessage", payload)
+            if not resp_json.get("ok"):
+                logger.error(f"Error sending message: {resp_json}")
+            if not future.done():
+                future.set_result(resp_json)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+
+
+telegram_client = TelegramClient()
+QUEUE_DEPTH.set_function(lambda: telegram_client._queue.qsize() if telegram_client._queue else 0, "telegram_outgoing")
+
 async def send_telegram_message(chat_id: int, text: str, parse_mode: str = None):
     """Send message to Telegram chat"""
     try:
         # Only escape markdown if using markdown parse mode
         if parse_mode and parse_mode.lower().startswith('markdown'):
             text = escape_markdown(text)
-            
-        payload = {
-            "chat_id": chat_id,
-            "text": text,
-        }
-        
-        if parse_mode:
-            payload["parse_mode"] = parse_mode
-
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{TELEGRAM_API_BASE}/sendMessage",
-                json=payload
-            )
-            resp_json = response.json()
-            if not resp_json.get("ok"):
-                logger.error(f"Error sending message: {resp_json}")
-                # Try sending without parse_mode if it fails
-                if parse_mode:
-                    return await send_telegram_message(chat_id, text, parse_mode=None)
-            return resp_json
+
+        with TELEGRAM_SEND_LATENCY.time():
+            return await telegram_client.send_message(chat_id, text, parse_mode=parse_mode)
     except Exception as e:
         logger.error(f"Exception while sending message: {e}")
-        # Try one more time without parse_mode
-        if parse_mode:
-            return await send_telegram_message(chat_id, text, parse_mode=None)
         raise
 
 
-class TelegramBotService:
-    def start(self):
-        print("Telegram bot started...")  # For debugging
+class ProgressiveReply:
+    """A reply shown by editing one already-sent message, such as a placeholder.
+
+    ``update`` may be called as often as text arrives; edits are coalesced
+    so at most one is made per ``min_interval``, always with the latest
+    text. ``finish`` makes the final edit exactly once, sending any overflow
+    beyond Telegram's length limit as new messages. Without a message to
+    edit, the final text is sent as a new message instead.
+    """
+
+    def __init__(self, client: TelegramClient, chat_id: int, message_id: Optional[int],
+                 min_interval: float = TELEGRAM_EDIT_INTERVAL):
+        self.client = client
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.min_interval = min_interval
+        self.finished = False
+        self._pending: Optional[str] = None
+        self._shown: Optional[str] = None
+        self._last_edit = 0.0
+        self._editing = False
+        self._task: Optional[asyncio.Task] = None
 
-    def stop(self):
-        print("Telegram bot stopped...")  # For debugging
+    def update(self, text: str):
+        """Show ``text`` soon, replacing any update not yet shown"""
+        if self.finished or self.message_id is None:
+            return
+        self._pending = text[:MAX_MESSAGE_LENGTH]
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush())
 
+    async def _flush(self):
+        while self._pending is not None:
+            delay = self._last_edit + self.min_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            text, self._pending = self._pending, None
+            if text != self._shown:
+                try:
+                    await self._edit(text)
+                except Exception as e:
+                    logger.warning(f"Error editing message: {e}")
+        self._task = None
 
+    async def _edit(self, text: str) -> dict:
+        self._editing = True
+        try:
+            resp_json = await self.client.edit_message(self.chat_id, self.message_id, text)
+        finally:
+            self._editing = False
+            self._last_edit = time.monotonic()
+        if resp_json.get("ok"):
+            self._shown = text
+        else:
+            logger.warning(f"Error editing message: {resp_json}")
+        return resp_json
 
+    async def finish(self, text: str) -> Optional[dict]:
+        """Show the final text; later calls are ignored"""
+        if self.finished:
+            return None
+        self.finished = True
+        self._pending = None
+        if self._task is not None:
+            # Let an edit already in flight land first, so it cannot overwrite the final text
+            if not self._editing:
+                self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
 
+        if self.message_id is None:
+            return await self.client.send_message(self.chat_id, text)
+        chunks = split_message(text)
+        resp_json = {"ok": True}
+        if chunks[0] != self._shown:
+            resp_json = await self._edit(chunks[0])
+            if not resp_json.get("ok"):
+                resp_json = await self.client.send_message(self.chat_id, chunks[0])
+        for chunk in chunks[1:]:
+            resp_json = await self.client.send_message(self.chat_id, chunk)
+        return resp_json
+
+
+class UpdatePoller:
+    """Receive updates with getUpdates long polling, as an alternative to a webhook.
+
+    Each batch is handed to ``submit`` one update at a time; ``submit`` may
+    wait, which throttles polling to the rate updates are processed. The
+    offset is saved after every batch, so a restart resumes where the last
+    run stopped. An update that was submitted but not yet saved when the
+    process died is fetched again, and the dispatcher's deduplication drops it.
+    """
+
+    def __init__(self, client: TelegramClient, submit: Callable[[TelegramUpdate], Awaitable],
+                 state_path: str = os.path.join(DATA_DIR, "state", "telegram_offset.json"),
+                 timeout: int = TELEGRAM_POLL_TIMEOUT, limit: int = TELEGRAM_POLL_LIMIT):
+        self.client = client
+        self.submit = submit
+        self.state_path = state_path
+        self.timeout = timeout
+        self.limit = limit
+        self.offset: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def _load_offset(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                self.offset = json.load(f).get("offset")
+        except FileNotFoundError:
+            self.offset = None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read polling offset, starting from pending updates: {e}")
+            self.offset = None
 
+    def _save_offset(self):
+        if self.offset is None:
+            return
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"offset": self.offset}, f)
+        os.replace(tmp_path, self.state_path)
+
+    async def start(self):
+        if self.running:
+            return
+        self._load_offset()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Polling Telegram for updates (offset {self.offset})")
+
+    async def stop(self):
+        """Stop polling; an in-flight long poll is abandoned, updates already submitted are kept"""
+        if not self.running:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self._save_offset()
+        logger.info("Stopped polling Telegram")
+
+    async def poll_once(self) -> int:
+        """Fetch one batch and submit it; returns the number of updates received"""
+        payload = {"timeout": self.timeout, "limit": self.limit, "allowed_updates": ["message"]}
+        if self.offset is not None:
+            payload["offset"] = self.offset
+        # The HTTP timeout must outlast the long poll itself
+        resp_json = await self.client.call("getUpdates", payload, timeout=self.timeout + 10)
+        if not resp_json.get("ok"):
+            raise RuntimeError(f"getUpdates failed: {resp_json}")
+        updates = resp_json.get("result") or []
+        for raw in updates:
+            try:
+                update = TelegramUpdate.model_validate(raw)
+            except ValidationError as e:
+                logger.warning(f"Skipping malformed update {raw.get('update_id')}: {e}")
+            else:
+                await self.submit(update)
+            self.offset = raw["update_id"] + 1
+        if updates:
+            self._save_offset()
+        return len(updates)
+
+    async def _run(self):
+        failures = 0
+        while True:
+            try:
+                await self.poll_once()
+                failures = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                failures += 1
+                delay = min(30, 2 ** failures)
+                logger.error(f"Polling Telegram failed ({e}), retrying in {delay}s")
+                await asyncio.sleep(delay)
+
+
+class TelegramBotService:
+    def __init__(self, client: TelegramClient = telegram_client):
+        self.client = client
+        self.poller: Optional[UpdatePoller] = None
 
+    async def start(self):
+        await self.client.start()
+        logger.info("Telegram bot started...")
 
+    async def start_polling(self, submit: Callable[[TelegramUpdate], Awaitable], **kwargs):
+        """Receive updates by long polling instead of a webhook"""
+        if self.poller is None:
+            self.poller = UpdatePoller(self.client, submit, **kwargs)
+        await self.poller.start()
 
+    async def stop_polling(self):
+        if self.poller is not None:
+            await self.poller.stop()
 
+    async def stop(self):
+        await self.stop_polling()
+        await self.client.stop()
+        logger.info("Telegram bot stopped...")
@@ -0,0 +1,175 @@
+import bisect
+import heapq
+import threading
+from datetime import date, datetime
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+from app.api.models import Note
+import logging
+
+logger = logging.getLogger(__name__)
+
+TIME_FIELDS = ("created_at", "updated_at")
+MAX_ID = "\U0010ffff"
+# Walk the time order unless the candidate set is this many times smaller than the time range
+WALK_FACTOR = 4
+
+
+def time_bound(value: Union[str, date, None], upper: bool = False) -> Optional[str]:
+    """Normalize a date or datetime bound to the ISO form notes are stored with.
+
+    A bare date as an upper bound covers that whole day. Aware datetimes
+    are converted to local time, like the naive times notes carry.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, date):
+        parsed = datetime.combine(value, datetime.min.time())
+    else:
+        try:
+            parsed = datetime.fromisoformat(value.strip())
+        except ValueError:
+            raise ValueError(f"Invalid date: {value!r} (expected YYYY-MM-DD or an ISO datetime)")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    is_date_only = not isinstance(value, datetime) and (isinstance(value, date) or len(value.strip()) == 10)
+    if upper and is_date_only:
+        parsed = parsed.replace(hour=23, minute=59, second=59, microsecond=999999)
+    return parsed.isoformat()
+
+
+class TimeIndex:
+    """In-memory ordered index of note creation and update times.
+
+    Keeps ``(timestamp, note_id)`` pairs sorted per field, so newest-first
+    listings and date ranges only walk the part of the order they return.
+    It is built on first use from the ``(id, created_at, updated_at)``
+    tuples yielded by ``loader``, which reads timestamp columns rather than
+    whole notes, so unlike the other indexes it has no files.
+    """
+
+    def __init__(self, loader: Callable[[], Iterable[Tuple[str, str, str]]]):
+        self.loader = loader
+        self.order: Dict[str, List[Tuple[str, str]]] = {field: [] for field in TIME_FIELDS}
+        self.note_times: Dict[str, Tuple[str, str]] = {}
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        for note_id, created_at, updated_at in self.loader():
+            self.note_times[note_id] = (created_at, updated_at)
+        for i, field in enumerate(TIME_FIELDS):
+            self.order[field] = sorted((times[i], note_id) for note_id, times in self.note_times.items())
+        self._loaded = True
+
+    def _add(self, note_id: str, times: Tuple[str, str]):
+        self._remove(note_id)
+        self.note_times[note_id] = times
+        for field, value in zip(TIME_FIELDS, times):
+            bisect.insort(self.order[field], (value, note_id))
+
+    def _remove(self, note_id: str):
+        times = self.note_times.pop(note_id, None)
+        if times is None:
+            return
+        for field, value in zip(TIME_FIELDS, times):
+            entries = self.order[field]
+            i = bisect.bisect_left(entries, (value, note_id))
+            if i < len(entries) and entries[i] == (value, note_id):
+                del entries[i]
+
+    def add_note(self, note: Note):
+        self.add_notes([note])
+
+    def add_notes(self, notes: Iterable[Note]):
+        with self._lock:
+            self._ensure_loaded()
+            for note in notes:
+                times = (note.created_at.isoformat(), note.updated_at.isoformat())
+                if self.note_times.get(note.id) != times:
+                    self._add(note.id, times)
+
+    def remove_note(self, note_id: str):
+        with self._lock:
+            self._ensure_loaded()
+            self._remove(note_id)
+
+    def _bounds(self, field: str, since: Optional[str], until: Optional[str]) -> Tuple[int, int]:
+        entries = self.order[field]
+        lo = bisect.bisect_left(entries, (since, "")) if since else 0
+        hi = bisect.bisect_right(entries, (until, MAX_ID)) if until else len(entries)
+        return lo, max(lo, hi)
+
+    def count(self, candidates: Optional[List[str]] = None, field: str = "updated_at",
+              since: Optional[str] = None, until: Optional[str] = None) -> int:
+        """Number of notes, or of the distinct ``candidates``, whose ``field`` lies within [since, until].
+
+        Over all notes it is the width of the range in the order, found by
+        binary search.
+        """
+        if field not in TIME_FIELDS:
+            raise ValueError(f"Unknown date field: {field}")
+        with self._lock:
+            self._ensure_loaded()
+            if candidates is None:
+                lo, hi = self._bounds(field, since, until)
+                return hi - lo
+            return len(self.filter(candidates, field, since, until)) if since or until else len(candidates)
+
+    def filter(self, note_ids: Iterable[str], field: str = "updated_at", since: Optional[str] = None,
+               until: Optional[str] = None) -> List[str]:
+        """Keep the ids, in their given order, of notes whose ``field`` lies within [since, until]"""
+        i = TIME_FIELDS.index(field)
+        with self._lock:
+            self._ensure_loaded()
+            kept = []
+            for note_id in note_ids:
+                times = self.note_times.get(note_id)
+                if times and (not since or times[i] >= since) and (not until or times[i] <= until):
+                    kept.append(note_id)
+            return kept
+
+    def newest(self, candidates: Optional[Iterable[str]] = None, field: str = "updated_at",
+               since: Optional[str] = None, until: Optional[str] = None,
+               before: Optional[Tuple[str, str]] = None, limit: Optional[int] = None) -> List[str]:
+        """Ids newest first by (updated_at, id), stopping after ``limit``.
+
+        Restricted to ``candidates`` if given, to notes whose ``field`` lies
+        within [since, until], and to those after the ``before`` cursor.
+        When the range is in update order, the order is walked from its top
+        and the walk stops at ``limit``; otherwise the smaller of the range
+        and the candidates is filtered and the newest picked from it.
+        """
+        if field not in TIME_FIELDS:
+            raise ValueError(f"Unknown date field: {field}")
+        with self._lock:
+            self._ensure_loaded()
+            candidate_set: Optional[Set[str]] = set(candidates) if candidates is not None else None
+            if field == "updated_at":
+                order = self.order["updated_at"]
+                lo, hi = self._bounds(field, since, until)
+                if before is not None:
+                    hi = max(lo, min(hi, bisect.bisect_left(order, before)))
+                if candidate_set is None or hi - lo <= len(candidate_set) * WALK_FACTOR:
+                    ids = []
+                    for i in range(hi - 1, lo - 1, -1):
+                        note_id = order[i][1]
+                        if candidate_set is None or note_id in candidate_set:
+                            ids.append(note_id)
+                            if limit and len(ids) >= limit:
+                                break
+                    return ids
+
+            if candidate_set is None:
+                lo, hi = self._bounds(field, since, until)
+                matching = [note_id for _, note_id in self.order[field][lo:hi]]
+            else:
+                matching = self.filter(candidate_set, field, since, until)
+            keys = [(self.note_times[note_id][1], note_id) for note_id in matching]
+            if before is not None:
+                keys = [key for key in keys if key < before]
+        ranked = heapq.nlargest(limit, keys) if limit else sorted(keys, reverse=True)
+        return [note_id for _, note_id in ranked]
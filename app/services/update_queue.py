@@ -0,0 +1,262 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Set, Tuple
+from app.api.models import TelegramUpdate
+from app.services.metrics import UPDATE_QUEUE_WAIT
+from app.config import DATA_DIR, WEBHOOK_WORKERS, WEBHOOK_MAX_PENDING, WEBHOOK_DEDUP_WINDOW, SHARED_STATE
+import logging
+
+logger = logging.getLogger(__name__)
+
+UpdateHandler = Callable[[TelegramUpdate], Awaitable[None]]
+
+
+class UpdateDeduplicator:
+    """Remember recently seen update ids so redelivered updates are processed once.
+
+    Only the last ``window`` ids are kept; anything at or below the newest id
+    evicted from the window (the watermark) is treated as already seen. Both
+    are persisted so a restart does not reprocess redelivered updates.
+    """
+
+    blocking = False  # Whether calls may wait on other processes, and so are run off the event loop
+
+    def __init__(self, state_path: str, window: int = WEBHOOK_DEDUP_WINDOW):
+        self.state_path = state_path
+        self.window = window
+        self.recent: Deque[int] = deque(maxlen=window)
+        self._recent_set: Set[int] = set()
+        self.watermark = 0
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self.watermark = state.get("watermark", 0)
+            for update_id in state.get("recent", [])[-self.window:]:
+                self._remember(update_id)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load update dedup state: {e}")
+
+    def _remember(self, update_id: int):
+        if len(self.recent) == self.window:
+            evicted = self.recent[0]
+            self._recent_set.discard(evicted)
+            self.watermark = max(self.watermark, evicted)
+        self.recent.append(update_id)
+        self._recent_set.add(update_id)
+
+    def check_and_add(self, update_id: int) -> bool:
+        """Record an update id, returning False if it was already seen"""
+        if update_id in self._recent_set or update_id <= self.watermark:
+            return False
+        self._remember(update_id)
+        self._dirty = True
+        return True
+
+    def flush(self):
+        """Persist the window if it changed since the last flush"""
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"watermark": self.watermark, "recent": list(self.recent)}, f)
+        os.replace(tmp_path, self.state_path)
+        self._dirty = False
+
+
+class SharedUpdateDeduplicator:
+    """``UpdateDeduplicator`` backed by SQLite, for several processes receiving the same bot's updates.
+
+    The primary key makes check-and-add atomic across processes. ``flush``
+    trims the table to the last ``window`` ids and advances the watermark.
+    Calls can wait on other processes' writes, so the dispatcher makes
+    them from a thread.
+    """
+
+    blocking = True
+
+    def __init__(self, db_path: str, window: int = WEBHOOK_DEDUP_WINDOW):
+        self.window = window
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS seen_updates (update_id INTEGER PRIMARY KEY)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS dedup_watermark (id INTEGER PRIMARY KEY CHECK (id = 0), value INTEGER)")
+        self.watermark = self._read_watermark()
+
+    def _read_watermark(self) -> int:
+        row = self._conn.execute("SELECT value FROM dedup_watermark WHERE id = 0").fetchone()
+        return row[0] if row else 0
+
+    def check_and_add(self, update_id: int) -> bool:
+        if update_id <= self.watermark:
+            return False
+        with self._lock:
+            cursor = self._conn.execute("INSERT OR IGNORE INTO seen_updates (update_id) VALUES (?)", (update_id,))
+            return cursor.rowcount == 1
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        row = self._conn.execute(
+            "SELECT update_id FROM seen_updates ORDER BY update_id DESC LIMIT 1 OFFSET ?", (self.window,)
+        ).fetchone()
+        if row is not None:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute(
+                "INSERT INTO dedup_watermark (id, value) VALUES (0, ?) "
+                "ON CONFLICT (id) DO UPDATE SET value = MAX(value, excluded.value)", (row[0],)
+            )
+            self._conn.execute("DELETE FROM seen_updates WHERE update_id <= ?", (row[0],))
+            self._conn.execute("COMMIT")
+        self.watermark = self._read_watermark()
+
+
+class UpdateDispatcher:
+    """Process Telegram updates on a pool of workers, in order within each chat.
+
+    ``submit`` returns immediately. Each chat has its own FIFO of pending
+    updates and at most one update in flight, while different chats are
+    processed in parallel by up to ``workers`` tasks. When more than
+    ``max_pending`` updates are waiting, new ones are rejected and handed to
+    ``busy_handler`` instead.
+    """
+
+    def __init__(self, handler: UpdateHandler, busy_handler: Optional[UpdateHandler] = None,
+                 workers: int = WEBHOOK_WORKERS, max_pending: int = WEBHOOK_MAX_PENDING,
+                 deduplicator: Optional[UpdateDeduplicator] = None):
+        self.handler = handler
+        self.busy_handler = busy_handler
+        self.workers = workers
+        self.max_pending = max_pending
+        if deduplicator is None:
+            deduplicator = SharedUpdateDeduplicator(os.path.join(DATA_DIR, "state", "update_dedup.db")) \
+                if SHARED_STATE else UpdateDeduplicator(os.path.join(DATA_DIR, "state", "update_dedup.json"))
+        self.deduplicator = deduplicator
+
+        self.chat_queues: Dict[int, Deque[Tuple[TelegramUpdate, float]]] = {}
+        self.pending = 0
+        self._ready: Optional[asyncio.Queue] = None
+        self._tasks: list = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._background: Set[asyncio.Task] = set()
+        self._capacity: Optional[asyncio.Condition] = None
+
+    @property
+    def started(self) -> bool:
+        return self._ready is not None
+
+    async def start(self):
+        if self.started:
+            return
+        self._ready = asyncio.Queue()
+        self._capacity = asyncio.Condition()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._flush_task = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self, timeout: float = 10.0):
+        """Give queued updates ``timeout`` seconds to finish, then cancel the workers"""
+        if not self.started:
+            return
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping {self.pending} unprocessed updates on shutdown")
+        for task in self._tasks + [self._flush_task]:
+            task.cancel()
+        await asyncio.gather(*self._tasks, self._flush_task, return_exceptions=True)
+        await self._deduplicate(self.deduplicator.flush)
+        self._ready = None
+        self._tasks = []
+        self.chat_queues = {}
+        self.pending = 0
+
+    async def _deduplicate(self, method: Callable, *args):
+        if self.deduplicator.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def _drain(self):
+        while self.pending:
+            await asyncio.sleep(0.05)
+
+    async def submit(self, update: TelegramUpdate, chat_id: int, wait: bool = False) -> str:
+        """Queue an update for processing; returns "queued", "duplicate" or "busy".
+
+        With ``wait``, a full queue makes the caller wait for room instead of
+        shedding the update, for sources that can apply backpressure such as
+        long polling.
+        """
+        await self.start()
+        if not await self._deduplicate(self.deduplicator.check_and_add, update.update_id):
+            return "duplicate"
+
+        if wait and self.pending >= self.max_pending:
+            async with self._capacity:
+                await self._capacity.wait_for(lambda: self.pending < self.max_pending)
+
+        if self.pending >= self.max_pending:
+            logger.warning(f"Update queue full ({self.pending} pending), shedding update {update.update_id}")
+            if self.busy_handler:
+                task = asyncio.create_task(self._run_busy_handler(update))
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+            return "busy"
+
+        self.pending += 1
+        entry = (update, time.perf_counter())
+        queue = self.chat_queues.get(chat_id)
+        if queue is None:
+            # No queue means no update of this chat is pending or in flight
+            self.chat_queues[chat_id] = deque([entry])
+            self._ready.put_nowait(chat_id)
+        else:
+            queue.append(entry)
+        return "queued"
+
+    async def _run_busy_handler(self, update: TelegramUpdate):
+        try:
+            await self.busy_handler(update)
+        except Exception as e:
+            logger.error(f"Error notifying user that the queue is busy: {e}")
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._ready.get()
+            queue = self.chat_queues[chat_id]
+            update, enqueued_at = queue.popleft()
+            UPDATE_QUEUE_WAIT.observe(time.perf_counter() - enqueued_at)
+            try:
+                await self.handler(update)
+            except Exception as e:
+                logger.error(f"Error processing update {update.update_id}: {e}", exc_info=True)
+            finally:
+                self.pending -= 1
+                if queue:
+                    self._ready.put_nowait(chat_id)
+                else:
+                    del self.chat_queues[chat_id]
+                async with self._capacity:
+                    self._capacity.notify()
+
+    async def _flush_periodically(self, interval: float = 1.0):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._deduplicate(self.deduplicator.flush)
+            except (OSError, sqlite3.Error) as e:
+                logger.error(f"Error saving update dedup state: {e}")
@@ -0,0 +1,226 @@
+import math
+import os
+import threading
+import zlib
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from app.api.models import Note
+from app.services.shared_state import file_lock
+from app.services.search_index import tokenize
+import logging
+
+logger = logging.getLogger(__name__)
+
+SEARCH_BATCH_ROWS = 8192
+INITIAL_CAPACITY = 1024
+
+
+class HashingVectorizer:
+    """Embed text offline by hashing word and character n-gram features into a fixed-size vector"""
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    @staticmethod
+    def _features(text: str) -> Counter:
+        tokens = tokenize(text)
+        features = Counter(tokens)
+        for token in tokens:
+            padded = f"<{token}>"
+            # Character trigrams let "meeting" partially match "meet"
+            features.update(f"#{padded[i:i + 3]}" for i in range(len(padded) - 2))
+        return features
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, tf in self._features(text).items():
+            # crc32 is stable across processes, unlike hash()
+            h = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if h & 0x80000000 else -1.0
+            vector[h % self.dim] += sign * (1 + math.log(tf))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_note(self, note: Note) -> np.ndarray:
+        return self.embed(f"{note.title}\n{note.title}\n{note.content}")
+
+
+class VectorIndex:
+    """Note embeddings in a memory-mapped float32 matrix, searched by cosine similarity.
+
+    Row ``i`` of ``embeddings.f32`` holds the unit-length embedding of the
+    note recorded for row ``i`` in ``rows.log``, an append-only log of
+    ``row<TAB>note_id`` assignments (an empty id frees the row).
+
+    A ``read_only`` index maps the matrix copy-on-write: unchanged pages
+    stay shared with other processes, and its own changes never reach disk.
+    """
+
+    def __init__(self, index_dir: str, note_loader: Callable[[], Iterable[Note]], dim: int = 512):
+        self.index_dir = index_dir
+        self.matrix_path = os.path.join(index_dir, "embeddings.f32")
+        self.rows_path = os.path.join(index_dir, "rows.log")
+        self.lock_path = os.path.join(index_dir, ".lock")
+        self.note_loader = note_loader
+        self.read_only = False
+        self.vectorizer = HashingVectorizer(dim)
+        self.dim = dim
+
+        self.matrix: Optional[np.ndarray] = None
+        self.row_ids: List[Optional[str]] = []
+        self.id_rows: Dict[str, int] = {}
+        self.free_rows: List[int] = []
+        self.used_rows = 0  # One past the highest row ever assigned
+        self._log_entries = 0
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    def _open_matrix(self, capacity: int, mode: str = "r+"):
+        self.matrix = np.memmap(self.matrix_path, dtype=np.float32, mode=mode, shape=(capacity, self.dim))
+
+    def _flush(self):
+        if isinstance(self.matrix, np.memmap):
+            self.matrix.flush()  # A no-op for copy-on-write maps
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        os.makedirs(self.index_dir, exist_ok=True)
+        with file_lock(self.lock_path, shared=True):
+            if os.path.exists(self.matrix_path) and os.path.exists(self.rows_path):
+                self._open_matrix(os.path.getsize(self.matrix_path) // (4 * self.dim), "c" if self.read_only else "r+")
+                self._replay_rows()
+                self._loaded = True
+                return
+        logger.info("Vector index not found, embedding all notes...")
+        if self.read_only:
+            self.matrix = np.zeros((INITIAL_CAPACITY, self.dim), dtype=np.float32)
+        else:
+            self._open_matrix(INITIAL_CAPACITY, mode="w+")
+            open(self.rows_path, 'w').close()
+        self._reset_free_rows()
+        for note in self.note_loader():
+            self._put(note)
+        self._flush()
+        self._loaded = True
+
+    def _reset_free_rows(self):
+        capacity = self.matrix.shape[0]
+        self.row_ids = self.row_ids[:capacity] + [None] * (capacity - len(self.row_ids))
+        # Popped from the end, so the lowest free row is reused first
+        self.free_rows = [row for row in range(capacity - 1, -1, -1) if self.row_ids[row] is None]
+
+    def _replay_rows(self):
+        with open(self.rows_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                row, _, note_id = line.rstrip("\n").partition("\t")
+                if not row.isdigit():
+                    continue
+                self._assign(int(row), note_id or None)
+                self._log_entries += 1
+        self._reset_free_rows()
+
+    def _assign(self, row: int, note_id: Optional[str]):
+        if row >= len(self.row_ids):
+            self.row_ids.extend([None] * (row + 1 - len(self.row_ids)))
+        previous = self.row_ids[row]
+        if previous is not None and self.id_rows.get(previous) == row:
+            del self.id_rows[previous]
+        self.row_ids[row] = note_id
+        if note_id is not None:
+            self.id_rows[note_id] = row
+            self.used_rows = max(self.used_rows, row + 1)
+
+    def _log(self, row: int, note_id: Optional[str]):
+        if self.read_only:
+            return
+        with open(self.rows_path, 'a', encoding='utf-8') as f:
+            f.write(f"{row}\t{note_id or ''}\n")
+        self._log_entries += 1
+        if self._log_entries > 4 * max(len(self.id_rows), 256):
+            self._compact_log()
+
+    def _compact_log(self):
+        tmp_path = f"{self.rows_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for note_id, row in self.id_rows.items():
+                f.write(f"{row}\t{note_id}\n")
+        with file_lock(self.lock_path):
+            os.replace(tmp_path, self.rows_path)
+        self._log_entries = len(self.id_rows)
+
+    def _grow(self):
+        old_capacity = self.matrix.shape[0]
+        if self.read_only:
+            self.matrix = np.concatenate([self.matrix, np.zeros_like(self.matrix)])
+        else:
+            self.matrix.flush()
+            del self.matrix
+            with open(self.matrix_path, 'r+b') as f:
+                f.truncate(old_capacity * 2 * 4 * self.dim)
+            self._open_matrix(old_capacity * 2)
+        self.row_ids.extend([None] * old_capacity)
+        self.free_rows.extend(range(old_capacity * 2 - 1, old_capacity - 1, -1))
+
+    def _put(self, note: Note):
+        row = self.id_rows.get(note.id)
+        if row is None:
+            if not self.free_rows:
+                self._grow()
+            row = self.free_rows.pop()
+            self._assign(row, note.id)
+            self._log(row, note.id)
+        self.matrix[row] = self.vectorizer.embed_note(note)
+
+    def add_note(self, note: Note):
+        """Embed a new or updated note into its row"""
+        with self._lock:
+            self._ensure_loaded()
+            self._put(note)
+            self._flush()
+
+    def add_notes(self, notes: Iterable[Note]):
+        """Embed a batch of notes, flushing the matrix once"""
+        with self._lock:
+            self._ensure_loaded()
+            for note in notes:
+                self._put(note)
+            self._flush()
+
+    def remove_note(self, note_id: str):
+        """Clear a note's row and free it for reuse"""
+        with self._lock:
+            self._ensure_loaded()
+            row = self.id_rows.get(note_id)
+            if row is None:
+                return
+            self.matrix[row] = 0
+            self._flush()
+            self._assign(row, None)
+            self.free_rows.append(row)
+            self._log(row, None)
+
+    def search(self, query: str, limit: int = 50) -> List[Tuple[str, float]]:
+        """Return the ``limit`` notes most similar to ``query``, best first"""
+        query_vector = self.vectorizer.embed(query)
+        if not query_vector.any():
+            return []
+        with self._lock:
+            self._ensure_loaded()
+            used_rows = self.used_rows
+            scores = np.empty(used_rows, dtype=np.float32)
+            for start in range(0, used_rows, SEARCH_BATCH_ROWS):
+                end = min(start + SEARCH_BATCH_ROWS, used_rows)
+                scores[start:end] = self.matrix[start:end] @ query_vector
+
+            k = min(limit, used_rows)
+            if k == 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                (self.row_ids[row], float(scores[row]))
+                for row in top
+                if self.row_ids[row] is not None and scores[row] > 0
+            ]
@@ -1,7 +1,87 @@
-def format_conversation_history(history: list) -> str:
-        """Format the conversation history into a structured format"""
-        formatted_history = "\n".join(
-            [f"{msg['role'].capitalize()}: {msg['content']}" for msg in history]
-        )
-        return formatted_history
-    
\ No newline at end of file
+import base64
+import json
+from typing import Optional, Tuple, Union
+from app.config import HISTORY_MESSAGE_TOKENS
+
+CHARS_PER_TOKEN = 4  # Rough average for English text with OpenAI tokenizers
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate; close enough for budgeting without running a tokenizer"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def elide(text: str, max_tokens: int) -> str:
+    """Shorten text to about ``max_tokens``, keeping its start and end"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    head = max_chars * 2 // 3
+    tail = max_chars - head
+    return f"{text[:head]} [...{len(text) - max_chars} chars elided...] {text[-tail:]}"
+
+
+def _format_message(msg: dict, max_message_tokens: Optional[int]) -> str:
+    content = elide(msg['content'], max_message_tokens) if max_message_tokens else msg['content']
+    if msg.get('type') == 'summary':
+        return f"Summary of earlier conversation: {content}"
+    return f"{msg['role'].capitalize()}: {content}"
+
+
+def format_conversation_history(history: list, max_tokens: Optional[int] = None,
+                                max_message_tokens: Optional[int] = HISTORY_MESSAGE_TOKENS) -> str:
+        """Format the conversation history into a structured format.
+
+        Long messages are elided to ``max_message_tokens``. With
+        ``max_tokens``, the newest messages that fit the budget are kept; a
+        leading summary message is always kept, shortened if needed.
+        """
+        if max_tokens is None:
+            return "\n".join(_format_message(msg, max_message_tokens) for msg in history)
+
+        summary = [msg for msg in history[:1] if msg.get('type') == 'summary']
+        lines = []
+        remaining = max_tokens
+        if summary:
+            line = _format_message(summary[0], min(max_tokens // 2, max_message_tokens or max_tokens))
+            lines.append(line)
+            remaining -= estimate_tokens(line)
+
+        recent = []
+        messages = history[len(summary):]
+        for msg in reversed(messages):
+            line = _format_message(msg, max_message_tokens)
+            cost = estimate_tokens(line) + 1
+            if cost > remaining:
+                if not recent and remaining > 10:
+                    # Always keep some of the newest message
+                    recent.append(_format_message(msg, remaining - 5))
+                break
+            recent.append(line)
+            remaining -= cost
+
+        omitted = len(messages) - len(recent)
+        if omitted:
+            lines.append(f"({omitted} earlier messages omitted)")
+        lines.extend(reversed(recent))
+        return "\n".join(lines)
+
+
+def encode_cursor(key: Union[Tuple[str, str], int]) -> str:
+    """Encode a pagination key, an (updated_at, id) pair or a rank offset, as an opaque cursor string"""
+    value = key if isinstance(key, int) else list(key)
+    return base64.urlsafe_b64encode(json.dumps(value).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Union[Tuple[str, str], int]:
+    """Decode a cursor produced by encode_cursor, raising ValueError if it is malformed"""
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if isinstance(value, int) and not isinstance(value, bool):
+            if value < 0:
+                raise ValueError("negative offset")
+            return value
+        updated_at, note_id = value
+        return str(updated_at), str(note_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
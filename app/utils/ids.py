@@ -0,0 +1,61 @@
+import os
+import secrets
+import threading
+import time
+from datetime import datetime
+
+
+class NoteIdAllocator:
+    """Allocate unique, time-sortable note ids.
+
+    Ids look like ``20250101_120000_123004_9f2a1c``: the legacy
+    ``%Y%m%d_%H%M%S`` prefix, then milliseconds plus a per-millisecond
+    sequence number, then a random per-process node suffix. Ids from one
+    process are strictly increasing, the node keeps concurrent processes
+    apart, and legacy ids still sort before any id allocated in the same
+    second.
+    """
+
+    MAX_SEQUENCE = 999
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._sequence = 0
+        self._pid = None
+        self._node = ""
+
+    def _reseed(self):
+        # A forked child must not reuse its parent's node suffix
+        self._pid = os.getpid()
+        self._node = secrets.token_hex(3)
+        self._last_ms = 0
+        self._sequence = 0
+
+    def next_id(self) -> str:
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reseed()
+
+            now_ms = int(time.time() * 1000)
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            else:
+                # Same millisecond, or the clock went backwards: keep counting
+                self._sequence += 1
+                if self._sequence > self.MAX_SEQUENCE:
+                    self._last_ms += 1
+                    self._sequence = 0
+
+            seconds, millis = divmod(self._last_ms, 1000)
+            prefix = datetime.fromtimestamp(seconds).strftime("%Y%m%d_%H%M%S")
+            return f"{prefix}_{millis:03d}{self._sequence:03d}_{self._node}"
+
+
+note_id_allocator = NoteIdAllocator()
+
+
+def generate_note_id() -> str:
+    """Allocate a new note id"""
+    return note_id_allocator.next_id()
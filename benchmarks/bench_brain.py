@@ -0,0 +1,123 @@
+"""Benchmark BrainService operations over synthetic corpora.
+
+Each corpus size runs in a fresh process so peak RSS is per size:
+
+    python -m benchmarks.bench_brain --sizes 1000,10000,100000 --out benchmarks/results/brain.json
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from benchmarks.common import Corpus, Stopwatch, peak_rss_mb, summarize, write_results
+
+SEED_BATCH = 5000
+
+
+async def _measure(operation, args_list: List[tuple], concurrency: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    queue = list(reversed(args_list))
+
+    async def worker():
+        while queue:
+            args = queue.pop()
+            start = time.perf_counter()
+            await operation(*args)
+            latencies.append(time.perf_counter() - start)
+
+    with Stopwatch() as wall:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, wall.seconds)
+
+
+def run_size(size: int, ops: int, concurrency: int, seed: int, storage_backend: str) -> dict:
+    """Seed a corpus of ``size`` notes in a scratch directory and time each operation"""
+    data_dir = tempfile.mkdtemp(prefix=f"brain_bench_{size}_")
+    os.environ["DATA_DIR"] = data_dir
+    os.environ["STORAGE_BACKEND"] = storage_backend
+    from app.api.models import Note
+    from app.services.brain_service import BrainService
+    from app.utils.ids import generate_note_id
+
+    corpus = Corpus(seed)
+    brain = BrainService(data_dir=data_dir)
+    result = {"size": size, "storage_backend": storage_backend, "data_dir": data_dir}
+
+    # Bulk-load storage directly, then time the indexes rebuilding from it
+    ids = []
+    with Stopwatch() as seeding:
+        for start in range(0, size, SEED_BATCH):
+            batch = [Note(id=generate_note_id(), **corpus.note_fields()) for _ in range(min(SEED_BATCH, size - start))]
+            brain.storage.put_many(batch)
+            ids.extend(note.id for note in batch)
+    result["seed_seconds"] = seeding.seconds
+
+    # Claim the index files, starting from the current change log position rather than replaying the seeding
+    brain._sync()
+    result["index_build_seconds"] = {}
+    for name, index in (("search", brain.search_index), ("vector", brain.vector_index), ("tag", brain.tag_index),
+                        ("time", brain.time_index), ("minhash", brain.minhash_index)):
+        with Stopwatch() as build:
+            with index._lock:
+                index._ensure_loaded()
+        result["index_build_seconds"][name] = build.seconds
+
+    rng = random.Random(seed)
+    queries = [(corpus.query(),) for _ in range(ops)]
+
+    async def run_ops():
+        operations = {}
+        operations["save_note"] = await _measure(
+            brain.save_note, [tuple(corpus.note_fields().values()) for _ in range(ops)], concurrency
+        )
+        operations["get_note"] = await _measure(brain.get_note, [(rng.choice(ids),) for _ in range(ops)], concurrency)
+        operations["update_note"] = await _measure(
+            brain.update_note, [(rng.choice(ids), None, corpus.text(30, 120)) for _ in range(ops)], concurrency
+        )
+        for mode in ("keyword", "semantic", "hybrid"):
+            operations[f"search_{mode}"] = await _measure(
+                lambda q, m=mode: brain.search_notes(query=q, mode=m), queries, concurrency
+            )
+        operations["search_tags"] = await _measure(
+            lambda tag: brain.search_notes(tags=[tag]), [(rng.choice(corpus.tags[:10]),) for _ in range(ops)],
+            concurrency
+        )
+        week_ago = (datetime.now() - timedelta(days=7)).date().isoformat()
+        operations["search_recent_week"] = await _measure(
+            lambda: brain.search_notes(since=week_ago, limit=20),
+            [() for _ in range(ops)], concurrency
+        )
+        victims = rng.sample(ids, min(ops, len(ids)))
+        operations["delete_note"] = await _measure(brain.delete_note, [(note_id,) for note_id in victims], concurrency)
+        return operations
+
+    result["operations"] = asyncio.run(run_ops())
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000", help="Comma-separated corpus sizes, e.g. 1000,100000,1000000")
+    parser.add_argument("--ops", type=int, default=200, help="Operations timed per operation type")
+    parser.add_argument("--concurrency", type=int, default=1, help="Concurrent callers per operation type")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--storage", default="sqlite", choices=["sqlite", "json"])
+    parser.add_argument("--out", help="Write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for size in (int(s) for s in args.sizes.split(",")):
+        with context.Pool(1) as pool:
+            results.append(pool.apply(run_size, (size, args.ops, args.concurrency, args.seed, args.storage)))
+    write_results(args.out, "brain", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Measure cold start: time from launching a process until it serves its first request.
+
+Each run starts a fresh interpreter that imports ``app.main``, runs the
+app's startup, answers ``GET /`` and then handles one Telegram update end
+to end, including its LLM calls. Both LLM backends are called over HTTP
+against a fake OpenAI-compatible server (litellm is pointed at it through
+OPENAI_API_BASE), so the import and connection costs are real:
+
+    python -m benchmarks.bench_startup --runs 10 --backends litellm,openai --out benchmarks/results/startup.json
+
+Phases are in seconds from launch, except ``import``, ``startup``,
+``first_request`` and ``first_update``, which are their own durations.
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.common import Stopwatch, summarize, write_results
+from benchmarks.fakes import FakeLLM, FakeOpenAIServer, FakeTelegramServer, latency_distribution
+
+WEBHOOK_WAIT_SECONDS = 30
+
+
+async def _serve_first_requests(main, launched: float, phases: dict):
+    import httpx
+    from app.api import routes
+
+    handled = asyncio.get_running_loop().create_future()
+    handler = routes.update_dispatcher.handler
+
+    async def timed_handler(update):
+        try:
+            await handler(update)
+        finally:
+            if not handled.done():
+                handled.set_result(time.perf_counter())
+
+    routes.update_dispatcher.handler = timed_handler
+
+    with Stopwatch() as startup:
+        lifespan = main.app.router.lifespan_context(main.app)
+        await lifespan.__aenter__()
+    phases["startup"] = startup.seconds
+
+    async def webhook_registered():
+        # Registration runs in the background; it may finish before or after the first request
+        while not main.webhook_active:
+            await asyncio.sleep(0.005)
+        phases["webhook_registered"] = time.time() - launched
+
+    watcher = asyncio.create_task(webhook_registered())
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            with Stopwatch() as first_request:
+                (await client.get("/")).raise_for_status()
+            phases["first_request"] = first_request.seconds
+            phases["ready"] = time.time() - launched
+
+            update = {
+                "update_id": 1,
+                "message": {
+                    "message_id": 1, "date": int(time.time()),
+                    "chat": {"id": 1000, "type": "private"}, "text": "hello there, how are you doing today?",
+                },
+            }
+            start = time.perf_counter()
+            (await client.post("/webhook", json=update)).raise_for_status()
+            phases["first_update"] = await handled - start
+        await asyncio.wait_for(watcher, WEBHOOK_WAIT_SECONDS)
+    finally:
+        watcher.cancel()
+        await lifespan.__aexit__(None, None, None)
+
+
+def run_child():
+    """One cold start, reporting its phases as a JSON line on stdout"""
+    launched = float(os.environ["BENCH_LAUNCHED"])
+    phases = {"interpreter": time.time() - launched}
+    with Stopwatch() as imported:
+        import app.main as main
+    phases["import"] = imported.seconds
+    asyncio.run(_serve_first_requests(main, launched, phases))
+    print(json.dumps(phases))
+
+
+async def cold_start(env: dict) -> dict:
+    env = {**os.environ, **env, "DATA_DIR": tempfile.mkdtemp(prefix="startup_bench_"), "BENCH_LAUNCHED": repr(time.time())}
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "benchmarks.bench_startup", "--child", env=env,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode:
+        raise RuntimeError(f"Cold start failed:\n{stderr.decode()[-2000:]}")
+    # The app prints too; the report is the last line
+    return json.loads(stdout.decode().strip().splitlines()[-1])
+
+
+async def run(args) -> list:
+    llm = FakeLLM(latency_distribution(args.llm_latency, args.seed), seed=args.seed)
+    llm_server = FakeOpenAIServer(llm)
+    telegram = FakeTelegramServer(latency_distribution(args.telegram_latency, args.seed))
+    await llm_server.start()
+    await telegram.start()
+
+    env = {
+        "TELEGRAM_API_URL": telegram.url, "TELEGRAM_API_TOKEN": "bench", "TELEGRAM_MODE": "webhook",
+        "WEBHOOK_BASE_URL": "https://bench.invalid", "USE_NGROK": "false",
+        "OPENAI_API_BASE": llm_server.url, "OPENAI_API_KEY": "bench",
+    }
+    for override in args.env:
+        name, _, value = override.partition("=")
+        env[name] = value
+
+    results = []
+    for backend in args.backends.split(","):
+        if backend == "litellm" and importlib.util.find_spec("litellm") is None:
+            results.append({"backend": backend, "skipped": "litellm is not installed"})
+            continue
+        runs = [await cold_start({**env, "LLM_BACKEND": backend}) for _ in range(args.runs)]
+        results.append({
+            "backend": backend,
+            "runs": args.runs,
+            "phases": {phase: summarize([run[phase] for run in runs], 0) for phase in runs[0]},
+        })
+
+    await telegram.stop()
+    await llm_server.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts per backend")
+    parser.add_argument("--backends", default="litellm,openai", help="Comma-separated LLM_BACKEND values")
+    parser.add_argument("--llm-latency", default="0.05", help="Fake LLM latency, as in bench_webhook")
+    parser.add_argument("--telegram-latency", default="0.2",
+                        help="Fake Telegram API latency; setWebhook no longer delays readiness by it")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="Override a config setting")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Write the JSON report here as well as to stdout")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child()
+        return
+    results = asyncio.run(run(args))
+    write_results(args.out, "startup", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
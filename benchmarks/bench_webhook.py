@@ -0,0 +1,161 @@
+"""Load-test POST /webhook end to end against a fake LLM and a fake Telegram Bot API.
+
+``--concurrency`` virtual users each send an update and wait until the bot
+has finished handling it before sending the next, so latency covers
+queueing, classification, note operations and the Telegram replies:
+
+    python -m benchmarks.bench_webhook --requests 2000 --concurrency 50 \\
+        --llm-latency lognormal:0.4,0.5 --out benchmarks/results/webhook.json
+
+Settings from app/config.py can be overridden with ``--env NAME=VALUE``.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+
+from benchmarks.common import Corpus, Stopwatch, peak_rss_mb, summarize, write_results
+from benchmarks.fakes import FakeLLM, FakeTelegramServer, latency_distribution
+
+MESSAGE_MIX = (("query", 0.5), ("save", 0.3), ("small_talk", 0.2))
+
+
+def make_message(kind: str, corpus: Corpus, n: int) -> str:
+    # The counter keeps messages unique so the LLM cache does not hide the LLM's latency
+    if kind == "save":
+        return f"save note {n}: {corpus.text(10, 40)}"
+    if kind == "small_talk":
+        return f"hello there, how are you doing today #{n}"
+    return f"what did I write about {corpus.query()} #{n}"
+
+
+async def run(args) -> dict:
+    llm = FakeLLM(latency_distribution(args.llm_latency, args.seed), error_rate=args.llm_error_rate, seed=args.seed)
+    llm.install()
+    telegram = FakeTelegramServer(latency_distribution(args.telegram_latency, args.seed))
+    await telegram.start()
+
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="webhook_bench_")
+    os.environ["TELEGRAM_API_URL"] = telegram.url
+    os.environ.setdefault("TELEGRAM_API_TOKEN", "bench")
+    os.environ.setdefault("TELEGRAM_GLOBAL_RATE", str(args.telegram_rate))
+    for override in args.env:
+        name, _, value = override.partition("=")
+        os.environ[name] = value
+
+    import httpx
+    from fastapi import FastAPI
+    from app.api import routes
+    from app.services.telegram import telegram_client
+
+    corpus = Corpus(args.seed)
+    for _ in range(args.notes):
+        await routes.brain_service.save_note(**corpus.note_fields())
+
+    # Resolve each update's waiter once the dispatcher has finished handling it
+    waiters = {}
+    handler = routes.update_dispatcher.handler
+
+    async def timed_handler(update):
+        try:
+            await handler(update)
+        finally:
+            waiter = waiters.get(update.update_id)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(time.perf_counter())
+
+    routes.update_dispatcher.handler = timed_handler
+
+    app = FastAPI()
+    app.include_router(routes.router)
+    await telegram_client.start()
+    await routes.update_dispatcher.start()
+
+    rng = random.Random(args.seed)
+    kinds, weights = zip(*MESSAGE_MIX)
+    update_ids = itertools.count(1)
+    ack_latencies, e2e_latencies = [], []
+    by_kind = {kind: [] for kind in kinds}
+    statuses = Counter()
+
+    async def user(client: httpx.AsyncClient):
+        while True:
+            update_id = next(update_ids)
+            if update_id > args.requests:
+                return
+            kind = rng.choices(kinds, weights)[0]
+            # A fresh chat per update by default; Telegram's 1 msg/s per-chat limit would otherwise dominate
+            chat_id = 1000 + (update_id % args.chats if args.chats else update_id)
+            update = {
+                "update_id": update_id,
+                "message": {
+                    "message_id": update_id, "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "text": make_message(kind, corpus, update_id),
+                },
+            }
+            waiter = waiters[update_id] = asyncio.get_running_loop().create_future()
+            start = time.perf_counter()
+            response = await client.post("/webhook", json=update)
+            ack_latencies.append(time.perf_counter() - start)
+            status = response.json().get("status", str(response.status_code))
+            statuses[status] += 1
+            if status == "queued":
+                done = await waiter
+                e2e_latencies.append(done - start)
+                by_kind[kind].append(done - start)
+            del waiters[update_id]
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        with Stopwatch() as wall:
+            await asyncio.gather(*(user(client) for _ in range(args.concurrency)))
+        metrics_text = (await client.get("/metrics")).text
+
+    await routes.update_dispatcher.stop()
+    await telegram_client.stop()
+    await telegram.stop()
+
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "statuses": dict(statuses),
+        "webhook_ack": summarize(ack_latencies, wall.seconds),
+        "end_to_end": summarize(e2e_latencies, wall.seconds),
+        "end_to_end_by_kind": {kind: summarize(values, wall.seconds) for kind, values in by_kind.items()},
+        "llm_calls": sum(llm.calls.values()),
+        "telegram_calls": dict(telegram.calls),
+        "peak_rss_mb": peak_rss_mb(),
+        "metrics": metrics_text if args.include_metrics else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500, help="Total updates to send")
+    parser.add_argument("--concurrency", type=int, default=20, help="Virtual users sending updates")
+    parser.add_argument("--chats", type=int, default=None,
+                        help="Spread updates over this many chats, exercising per-chat ordering and rate limits "
+                             "(default: a new chat per update)")
+    parser.add_argument("--notes", type=int, default=1000, help="Notes saved before the run so searches have data")
+    parser.add_argument("--llm-latency", default="lognormal:0.3,0.5",
+                        help="Fake LLM latency: SECONDS, uniform:LO,HI, lognormal:MEDIAN,SIGMA or exp:MEAN")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Fraction of LLM calls that fail")
+    parser.add_argument("--telegram-latency", default="0.02", help="Fake Telegram API latency, same format")
+    parser.add_argument("--telegram-rate", type=float, default=1000,
+                        help="Global send rate limit; Telegram's real 30/s would dominate the measurement")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="Override a config setting")
+    parser.add_argument("--include-metrics", action="store_true", help="Embed the /metrics scrape in the report")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    write_results(args.out, "webhook", vars(args), [result])
+
+
+if __name__ == "__main__":
+    main()
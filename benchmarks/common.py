@@ -0,0 +1,120 @@
+"""Shared helpers for the benchmark scripts: corpora, timing statistics and result files"""
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+SYLLABLES = [
+    "ka", "lo", "mi", "ne", "ru", "ta", "vo", "shi", "en", "dar", "pol", "gri",
+    "an", "tor", "mel", "qui", "so", "bel", "fin", "zu", "ha", "ri", "pe", "wo",
+]
+
+
+def vocabulary(size: int = 5000, seed: int = 0) -> List[str]:
+    """Deterministic pseudo-words, most common first"""
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words, key=lambda w: (len(w), w))
+
+
+class Corpus:
+    """Generates synthetic notes with Zipf-distributed words and tags, reproducibly from a seed"""
+
+    def __init__(self, seed: int = 0, vocab_size: int = 5000, tag_count: int = 50):
+        self.rng = random.Random(seed)
+        self.words = vocabulary(vocab_size, seed)
+        self.word_weights = [1 / (rank + 1) for rank in range(len(self.words))]
+        self.tags = [f"tag{i}" for i in range(tag_count)]
+        self.tag_weights = [1 / (rank + 1) for rank in range(tag_count)]
+
+    def text(self, min_words: int, max_words: int) -> str:
+        count = self.rng.randint(min_words, max_words)
+        return " ".join(self.rng.choices(self.words, self.word_weights, k=count))
+
+    def note_fields(self) -> dict:
+        tag_count = self.rng.randint(0, 3)
+        return {
+            "title": self.text(3, 6).capitalize(),
+            "content": self.text(30, 120),
+            "tags": sorted(set(self.rng.choices(self.tags, self.tag_weights, k=tag_count))),
+        }
+
+    def query(self) -> str:
+        return self.text(1, 3)
+
+
+def summarize(latencies: List[float], wall_seconds: float) -> Dict[str, float]:
+    """Throughput and latency percentiles (milliseconds) for a list of per-operation seconds"""
+    if not latencies:
+        return {"count": 0}
+    ordered = sorted(latencies)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        "count": len(ordered),
+        "throughput_per_s": len(ordered) / wall_seconds if wall_seconds else 0.0,
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path: Optional[str], benchmark: str, args: dict, results) -> dict:
+    """Wrap results with run metadata and write them as JSON (to stdout if no path)"""
+    report = {
+        "benchmark": benchmark,
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": args,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if path:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    print(text)
+    return report
+
+
+class Stopwatch:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
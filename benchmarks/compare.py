@@ -0,0 +1,72 @@
+"""Compare two benchmark reports and flag regressions.
+
+    python -m benchmarks.compare baseline.json candidate.json --threshold 10
+
+Exits with status 1 if any p95 latency grew, or any throughput fell, by
+more than the threshold percentage.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Iterator, Tuple
+
+
+def _flatten(report: dict) -> Iterator[Tuple[str, Dict[str, float]]]:
+    """Yield (name, summary) for every latency summary in a report"""
+    for result in report["results"]:
+        if "size" in result:
+            prefix = f"size={result['size']}"
+        elif "backend" in result:
+            prefix = f"backend={result['backend']}"
+        else:
+            prefix = f"concurrency={result.get('concurrency')}"
+
+        def walk(node, path):
+            if isinstance(node, dict):
+                if "p95_ms" in node:
+                    yield f"{prefix} {path}", node
+                    return
+                for key, value in node.items():
+                    yield from walk(value, f"{path}.{key}" if path else key)
+
+        yield from walk(result, "")
+
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> int:
+    base = dict(_flatten(baseline))
+    regressions = 0
+    print(f"{'metric':<55} {'p95 base':>10} {'p95 new':>10} {'tput base':>10} {'tput new':>10}")
+    for name, new in _flatten(candidate):
+        old = base.get(name)
+        if old is None:
+            continue
+        flags = []
+        if old["p95_ms"] and (new["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 > threshold:
+            flags.append("p95")
+        old_tput, new_tput = old.get("throughput_per_s", 0), new.get("throughput_per_s", 0)
+        if old_tput and (old_tput - new_tput) / old_tput * 100 > threshold:
+            flags.append("throughput")
+        regressions += bool(flags)
+        marker = f"  REGRESSION ({', '.join(flags)})" if flags else ""
+        print(f"{name:<55} {old['p95_ms']:>10.2f} {new['p95_ms']:>10.2f} {old_tput:>10.1f} {new_tput:>10.1f}{marker}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed change in percent")
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.candidate, encoding='utf-8') as f:
+        candidate = json.load(f)
+    regressions = compare(baseline, candidate, args.threshold)
+    print(f"{regressions} regression(s) over {args.threshold}%")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""Offline stand-ins for the LLM and the Telegram Bot API, for benchmarks only"""
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+import types
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Optional
+
+
+def latency_distribution(spec: str, seed: int = 0) -> Callable[[], float]:
+    """Parse a latency spec into a sampler returning seconds.
+
+    Specs: ``0.2`` (fixed), ``uniform:0.1,0.5``, ``lognormal:MEDIAN,SIGMA``
+    and ``exp:MEAN``.
+    """
+    rng = random.Random(seed)
+    kind, _, params = spec.partition(":")
+    if not params:
+        value = float(kind)
+        return lambda: value
+    values = [float(v) for v in params.split(",")]
+    if kind == "uniform":
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == "lognormal":
+        mu = math.log(values[0])
+        return lambda: rng.lognormvariate(mu, values[1])
+    if kind == "exp":
+        return lambda: rng.expovariate(1 / values[0])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class FakeLLM:
+    """Replacement for ``litellm.acompletion`` with a configurable latency.
+
+    Structured calls (those passing ``response_format`` or whose system
+    prompt asks for JSON) get a valid classification; others get plain
+    text. Greetings are classified as small talk. With ``stream=True``, the
+    latency is spread over the streamed chunks, with the first arriving
+    after ``first_token_fraction`` of it.
+    """
+
+    def __init__(self, latency: Callable[[], float], error_rate: float = 0.0, seed: int = 0,
+                 first_token_fraction: float = 0.2):
+        self.latency = latency
+        self.first_token_fraction = first_token_fraction
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.calls = Counter()
+
+    def install(self):
+        """Register as the ``litellm`` module; call before importing the app"""
+        module = types.ModuleType("litellm")
+        module.acompletion = self.acompletion
+        sys.modules["litellm"] = module
+
+    @staticmethod
+    def _answer(user_message: str) -> dict:
+        text = user_message.lower()
+        if text.startswith(("hi", "hello", "hey", "thanks")):
+            return {"relevant": False, "reason": "small talk", "intent": None, "confirmation_needed": False}
+        if text.startswith("save"):
+            title, _, content = user_message.partition(":")
+            return {
+                "relevant": True, "reason": "save request", "intent": "save", "title": title[5:].strip() or "Note",
+                "content": content.strip(), "tags": [], "confirmation_needed": False,
+            }
+        return {
+            "relevant": True, "reason": "question about notes", "intent": "query",
+            "search_query": user_message, "confirmation_needed": False,
+        }
+
+    async def acompletion(self, model=None, messages=None, stream=False, **params):
+        self.calls[model] += 1
+        latency = self.latency()
+        if stream:
+            return self._stream(latency)
+        await asyncio.sleep(latency)
+        if self.error_rate and self.rng.random() < self.error_rate:
+            raise RuntimeError("Simulated LLM failure")
+        system = next((m["content"] for m in messages if m["role"] == "system"), "")
+        user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        if "response_format" in params or "JSON" in system:
+            content = json.dumps(self._answer(user.removeprefix("User message: ")))
+        else:
+            content = "Happy to help with your notes!"
+        prompt_tokens = sum(len(m["content"].split()) for m in messages)
+        return {
+            "choices": [{"message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content.split())},
+        }
+
+
+    async def _stream(self, latency: float):
+        words = "Happy to help! I can save, find, update and tag your notes whenever you like.".split()
+        await asyncio.sleep(latency * self.first_token_fraction)
+        if self.error_rate and self.rng.random() < self.error_rate:
+            raise RuntimeError("Simulated LLM failure")
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(latency * (1 - self.first_token_fraction) / (len(words) - 1))
+            last = i == len(words) - 1
+            yield {"choices": [{"delta": {"content": word if i == 0 else " " + word},
+                                "finish_reason": "stop" if last else None}]}
+
+
+class FakeHTTPServer:
+    """Minimal HTTP/1.1 server with keep-alive, JSON bodies and an optional latency per request"""
+
+    def __init__(self, latency: Optional[Callable[[], float]] = None, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def respond(self, path: str, payload: dict, writer: asyncio.StreamWriter):
+        raise NotImplementedError
+
+    @staticmethod
+    def write_json(writer: asyncio.StreamWriter, result: dict, status: str = "200 OK"):
+        data = json.dumps(result).encode()
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode()
+            + data
+        )
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, path, _ = request_line.decode().split(" ", 2)
+                length = 0
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b""):
+                        break
+                    name, _, value = header.decode().partition(":")
+                    if name.lower() == "content-length":
+                        length = int(value)
+                body = await reader.readexactly(length) if length else b""
+                if self.latency:
+                    await asyncio.sleep(self.latency())
+                await self.respond(path, json.loads(body or b"{}"), writer)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+
+class FakeTelegramServer(FakeHTTPServer):
+    """Fake Bot API answering every call with success.
+
+    Every call is recorded per chat, so a benchmark can see when the bot
+    replied. Updates added with ``push_update`` are served to getUpdates
+    with Telegram's offset and long-poll semantics, and files added with
+    ``add_file`` to getFile and the file download endpoint.
+    """
+
+    def __init__(self, latency: Optional[Callable[[], float]] = None, host: str = "127.0.0.1", port: int = 0):
+        super().__init__(latency, host, port)
+        self.calls = Counter()
+        self.messages: Dict[int, List[float]] = defaultdict(list)
+        self._message_id = 0
+        self.updates: List[dict] = []
+        self._new_updates = asyncio.Event()
+        self.files: Dict[str, bytes] = {}
+
+    def add_file(self, data: bytes) -> str:
+        """Make ``data`` downloadable and return its file_id"""
+        file_id = f"file{len(self.files) + 1}"
+        self.files[file_id] = data
+        return file_id
+
+    def push_update(self, update: dict):
+        self.updates.append(update)
+        self._new_updates.set()
+
+    async def _get_updates(self, payload: dict) -> dict:
+        self.calls["getUpdates"] += 1
+        offset = payload.get("offset")
+        if offset is not None:
+            # Like Telegram, an offset confirms every update before it
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+        if not self.updates and payload.get("timeout"):
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), payload["timeout"])
+            except asyncio.TimeoutError:
+                pass
+        return {"ok": True, "result": self.updates[:payload.get("limit", 100)]}
+
+    def _respond(self, method: str, payload: dict) -> dict:
+        self.calls[method] += 1
+        if method in ("sendMessage", "editMessageText"):
+            self.messages[payload.get("chat_id")].append(time.perf_counter())
+            self._message_id += 1
+            return {"ok": True, "result": {"message_id": self._message_id, "chat": {"id": payload.get("chat_id")}}}
+        return {"ok": True, "result": True}
+
+    def _write_file(self, file_id: str, writer: asyncio.StreamWriter):
+        self.calls["downloadFile"] += 1
+        data = self.files.get(file_id)
+        if data is None:
+            self.write_json(writer, {"ok": False, "error_code": 404, "description": "Not Found"}, "404 Not Found")
+            return
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/octet-stream\r\n"
+            + f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+        )
+
+    async def respond(self, path: str, payload: dict, writer: asyncio.StreamWriter):
+        if path.startswith("/file/"):
+            self._write_file(path.rsplit("/", 1)[-1], writer)
+            return
+        method = path.rsplit("/", 1)[-1]
+        if method == "getFile":
+            self.calls[method] += 1
+            file_id = payload.get("file_id")
+            if file_id not in self.files:
+                self.write_json(
+                    writer, {"ok": False, "error_code": 400, "description": "Bad Request: invalid file_id"}, "400 Bad Request"
+                )
+                return
+            result = {"file_id": file_id, "file_size": len(self.files[file_id]), "file_path": f"documents/{file_id}"}
+            self.write_json(writer, {"ok": True, "result": result})
+            return
+        if method == "getUpdates":
+            result = await self._get_updates(payload)
+        else:
+            result = self._respond(method, payload)
+        self.write_json(writer, result)
+
+
+class FakeOpenAIServer(FakeHTTPServer):
+    """Serves a ``FakeLLM`` as an OpenAI-compatible chat completions endpoint, streaming as server-sent events"""
+
+    def __init__(self, llm: FakeLLM, host: str = "127.0.0.1", port: int = 0):
+        super().__init__(None, host, port)
+        self.llm = llm
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def respond(self, path: str, payload: dict, writer: asyncio.StreamWriter):
+        streaming = False
+        try:
+            response = await self.llm.acompletion(**payload)
+            if not payload.get("stream"):
+                self.write_json(writer, response)
+                return
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+            streaming = True
+            async for chunk in response:
+                data = f"data: {json.dumps(chunk)}\n\n".encode()
+                writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                await writer.drain()
+            data = b"data: [DONE]\n\n"
+            writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n0\r\n\r\n")
+        except RuntimeError as e:
+            if streaming:
+                raise ConnectionResetError("Stream aborted") from e  # Like a provider dropping the connection
+            self.write_json(writer, {"error": {"message": str(e)}}, "500 Internal Server Error")
@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads its config and creates its singletons at import time, so point it at scratch state first
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="second_brain_tests_"))
+os.environ.setdefault("TELEGRAM_API_TOKEN", "test")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def brain(tmp_path, monkeypatch):
+    """A BrainService over an empty data directory, used by the AI service"""
+    from app.services import ai_service
+    from app.services.brain_service import BrainService
+
+    service = BrainService(data_dir=str(tmp_path))
+    monkeypatch.setattr(ai_service, "brain_service", service)
+    return service
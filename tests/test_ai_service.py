@@ -0,0 +1,50 @@
+import asyncio
+
+from app.api.models import MessageClassification
+from app.services.ai_service import get_ai_response
+
+HISTORY = [{"role": "user", "content": "hi"}]
+
+
+def test_content_only_update_keeps_tags(brain):
+    async def run():
+        note = await brain.save_note("Ideas", "first draft", ["work", "ideas"])
+        intent = MessageClassification.model_validate(
+            {"relevant": True, "intent": "update", "note_id": note.id, "content": "second draft", "tags": []}
+        ).model_dump()
+        await get_ai_response(intent, HISTORY)
+        return await brain.get_note(note.id)
+
+    updated = asyncio.run(run())
+    assert updated.content == "second draft"
+    assert updated.tags == ["work", "ideas"]
+
+
+def test_classification_without_tags_leaves_them_unset():
+    classification = MessageClassification.model_validate({"relevant": True, "intent": "update", "tags": None})
+    assert classification.tags is None
+
+
+def test_classification_keeps_known_search_modes_only():
+    parse = lambda mode: MessageClassification.model_validate(
+        {"relevant": True, "intent": "query", "search_mode": mode}
+    ).search_mode
+    assert parse("semantic") == "semantic"
+    assert parse("fuzzy") is None
+    assert parse(None) is None
+
+
+def test_query_uses_classified_search_mode(brain, monkeypatch):
+    modes = []
+    find_notes = brain.find_notes
+
+    async def recording_find_notes(*args, **kwargs):
+        modes.append(kwargs.get("mode"))
+        return await find_notes(*args, **kwargs)
+
+    monkeypatch.setattr(brain, "find_notes", recording_find_notes)
+    intent = MessageClassification.model_validate(
+        {"relevant": True, "intent": "query", "search_query": "garden", "search_mode": "keyword"}
+    ).model_dump()
+    asyncio.run(get_ai_response(intent, HISTORY))
+    assert modes == ["keyword"]
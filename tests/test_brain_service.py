@@ -0,0 +1,48 @@
+import asyncio
+
+from app.api.models import Note
+
+
+def test_query_pages_keep_rank_order(brain):
+    async def run():
+        # Older notes mention the query more often, so rank order differs from recency
+        await brain.save_notes([
+            Note(id=f"2024010100000000{i:04d}", title=f"Note {i}", content="garden " * (20 - i) + "other words")
+            for i in range(20)
+        ])
+        ranked, _ = await brain.find_notes("garden", mode="keyword")
+        pages, offset = [], 0
+        while True:
+            page = [note async for note in brain.iter_notes("garden", mode="keyword", limit=6, offset=offset)]
+            pages.extend(page)
+            if len(page) < 6:
+                return ranked, pages
+            offset += len(page)
+
+    ranked, pages = asyncio.run(run())
+    assert [note.id for note in pages] == [note.id for note in ranked]
+    assert pages[0].id == "20240101000000000000"
+
+
+
+def test_find_notes_counts_matches_beyond_the_limit(brain):
+    async def run():
+        await brain.save_notes([
+            Note(id=f"2024010{day}000000000000", title=f"Day {day}", content="entry", tags=["log"] if day % 2 else [],
+                 created_at=f"2024-01-0{day}T12:00:00", updated_at=f"2024-01-0{day}T12:00:00")
+            for day in range(1, 10)
+        ])
+        return [
+            await brain.find_notes(limit=3),
+            await brain.find_notes(tags=["log"], limit=2),
+            await brain.find_notes(since="2024-01-03", until="2024-01-06", limit=2),
+            await brain.find_notes(tags=["log"], since="2024-01-03", limit=10),
+        ]
+
+    results = [([note.title for note in notes], total) for notes, total in asyncio.run(run())]
+    assert results == [
+        (["Day 9", "Day 8", "Day 7"], 9),
+        (["Day 9", "Day 7"], 5),
+        (["Day 6", "Day 5"], 4),
+        (["Day 9", "Day 7", "Day 5", "Day 3"], 4),
+    ]
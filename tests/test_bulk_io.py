@@ -0,0 +1,69 @@
+import asyncio
+import gzip
+import json
+
+from app.services.bulk_io import (
+    export_jsonl_gz, export_watermark, import_notes, iter_export, iter_in_thread, iter_source
+)
+
+
+async def _records(items):
+    for item in items:
+        yield item
+
+
+async def _export(brain, since):
+    until = export_watermark(brain)
+    data = b"".join([chunk async for chunk in export_jsonl_gz(iter_export(brain, since, until))])
+    return [json.loads(line) for line in gzip.decompress(data).splitlines()], until
+
+
+def test_incremental_export_includes_old_imports_and_tombstones(brain):
+    async def run():
+        kept = await brain.save_note("Kept", "stays")
+        gone = await brain.save_note("Gone", "deleted later")
+        source = await brain.save_note("Source", "merged away")
+        _, watermark = await _export(brain, None)
+
+        old = {"id": "20200101000000000000", "title": "Old", "content": "imported",
+               "created_at": "2020-01-01T00:00:00", "updated_at": "2020-01-01T00:00:00"}
+        await import_notes(brain, _records([old]))
+        await brain.delete_note(gone.id)
+        await brain.merge_notes(source.id, kept.id)
+        return await _export(brain, watermark), gone, source, kept
+
+    (records, _), gone, source, kept = asyncio.run(run())
+    by_id = {record["id"]: record for record in records}
+    assert by_id["20200101000000000000"]["title"] == "Old"
+    assert by_id[gone.id] == {"id": gone.id, "deleted": True}
+    assert by_id[source.id] == {"id": source.id, "deleted": True}
+    assert "merged away" in by_id[kept.id]["content"]
+
+
+def test_import_applies_tombstones(brain):
+    async def run():
+        note = await brain.save_note("Gone", "deleted elsewhere")
+        result = await import_notes(brain, _records([{"id": note.id, "deleted": True}]))
+        return result, await brain.get_note(note.id)
+
+    result, note = asyncio.run(run())
+    assert result["deleted"] == 1 and result["failed"] == 0
+    assert note is None
+
+
+def test_unreadable_records_are_counted_not_fatal(brain, tmp_path):
+    source = tmp_path / "vault"
+    source.mkdir()
+    (source / "a.md").write_text("# Good\nbody")
+    (source / "b.md").write_bytes(b"# Bad\n\xff\xfe")
+    (source / "c.md").write_text("---\nmetadata: [a, b]\n---\nbody")
+    (source / "d.md").write_text("# Also good\nbody")
+    lines = tmp_path / "notes.jsonl"
+    lines.write_bytes(b'{"title": "Line", "content": "x"}\n\xff\n[1, 2]\n{"title": "Last", "content": "y"}\n')
+
+    async def run(path):
+        return await import_notes(brain, iter_in_thread(iter_source(str(path))))
+
+    for path in (source, lines):
+        result = asyncio.run(run(path))
+        assert (result["imported"], result["failed"]) == (2, 2), result["errors"]
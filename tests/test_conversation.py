@@ -0,0 +1,104 @@
+import asyncio
+import threading
+
+from app.services import conversation
+from app.services.conversation import ConversationSpill, ConversationState
+
+
+def _contents(state: ConversationState, chat_id: int) -> list:
+    return [message["content"] for message in state.get_conversation_history(chat_id, max_messages=100)]
+
+
+def test_history_is_a_ring_buffer_of_the_latest_messages():
+    state = ConversationState(history_size=3)
+    for i in range(5):
+        state.add_message(1, "user", f"message {i}")
+    assert _contents(state, 1) == ["message 2", "message 3", "message 4"]
+    # The byte count follows the buffer, not every message ever added
+    assert state.total_bytes == state._chat_size(1)
+
+
+def test_idle_and_over_budget_chats_are_spilled_and_reloaded(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(conversation.time, "monotonic", lambda: now[0])
+    spill = ConversationSpill(str(tmp_path / "conversations.db"))
+    state = ConversationState(history_size=10, max_chats=10, max_bytes=3000, idle_seconds=60, spill=spill)
+
+    state.add_message(1, "user", "an idle chat")
+    now[0] += 61
+    state.add_message(2, "user", "x" * 1000)
+    assert list(state.conversations) == [2]
+    assert state.counters["evicted"] == 1
+
+    # A third large chat pushes the least recently used one out of the byte budget
+    state.add_message(3, "user", "y" * 1000)
+    state.add_message(3, "user", "y" * 1000)
+    assert list(state.conversations) == [3]
+    assert state.total_bytes <= 3000
+    assert spill.count() == 2
+
+    assert _contents(state, 1) == ["an idle chat"]
+    assert state.counters["reloaded"] == 1
+    assert spill.count() == 1  # Chat 1 is back in memory; chat 3 left to make room for it
+
+
+def test_async_methods_keep_spill_io_off_the_event_loop(tmp_path):
+    state = ConversationState(spill=ConversationSpill(str(tmp_path / "conversations.db")))
+    threads = []
+    load = state.spill.load
+
+    def spy(*args, **kwargs):
+        threads.append(threading.current_thread() is threading.main_thread())
+        return load(*args, **kwargs)
+
+    state.spill.load = spy
+
+    async def run():
+        await state.add_message_async(1, "user", "hello")
+        return await state.get_conversation_history_async(1)
+
+    assert [message["content"] for message in asyncio.run(run())] == ["hello"]
+    assert threads and not any(threads)
+
+
+def test_history_keeps_the_newest_messages_that_fit_the_token_budget():
+    from app.utils.helpers import estimate_tokens, format_conversation_history
+
+    summary = {"role": "system", "content": "s" * 2000, "type": "summary"}
+    history = [summary] + [{"role": "user", "content": f"message {i} " + "x" * 80} for i in range(20)]
+
+    text = format_conversation_history(history, max_tokens=200, max_message_tokens=150)
+    lines = text.split("\n")
+    # The summary is kept but shortened, then the newest messages follow in order
+    assert lines[0].startswith("Summary of earlier conversation: ") and len(lines[0]) < 500
+    omitted = int(lines[1].split()[0].strip("("))
+    assert lines[2:] == [f"User: message {i} " + "x" * 80 for i in range(omitted, 20)]
+    assert estimate_tokens(text) <= 200 + len(lines)
+
+    # Without a budget every message is kept, each shortened to the per-message cap
+    unbudgeted = format_conversation_history(history[1:], max_message_tokens=10).split("\n")
+    assert len(unbudgeted) == 20 and all("chars elided" in line for line in unbudgeted)
+
+
+def test_messages_leaving_the_window_are_folded_into_a_rolling_summary():
+    batches = []
+
+    async def summarizer(previous, messages):
+        batches.append([m["content"] for m in messages])
+        return f"{previous or ''}<{','.join(m['content'] for m in messages)}>"
+
+    state = ConversationState(history_size=3, summarizer=summarizer, summary_batch=2)
+
+    async def run():
+        for i in range(7):
+            await state.add_message_async(1, "user", str(i))
+            await asyncio.sleep(0)
+        await asyncio.gather(*state._background)
+        return state.get_conversation_history(1)
+
+    history = asyncio.run(run())
+    assert batches == [["0", "1"], ["2", "3"]]
+    assert history[0] == {"role": "system", "content": "<0,1><2,3>", "type": "summary"}
+    assert [message["content"] for message in history[1:]] == ["4", "5", "6"]
+    assert state.counters["summaries"] == 2
+    assert 1 not in state.unsummarized
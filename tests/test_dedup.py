@@ -0,0 +1,82 @@
+import asyncio
+import random
+
+from app.api.models import Note
+from app.services.minhash_index import MinHashIndex
+
+WORDS = [f"word{i}" for i in range(2000)]
+
+
+def _texts(count: int, length: int = 80, seed: int = 0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(length)) for _ in range(count)]
+
+
+def _edited(text: str, changes: int, rng: random.Random) -> str:
+    words = text.split()
+    for position in rng.sample(range(len(words)), changes):
+        words[position] = rng.choice(WORDS)
+    return " ".join(words)
+
+
+def test_lsh_finds_near_duplicates_and_ignores_unrelated_notes(tmp_path):
+    originals = _texts(200)
+    notes = [Note(id=f"2024010100000000{i:04d}", title="", content=text) for i, text in enumerate(originals)]
+    index = MinHashIndex(str(tmp_path / "index"), lambda: notes)
+
+    # Two changed words out of 80 keep about 85% of the 3-word shingles
+    rng = random.Random(1)
+    found = sum(notes[i].id in dict(index.find(_edited(text, 2, rng))) for i, text in enumerate(originals))
+    assert found / len(originals) >= 0.95
+
+    assert all(index.find(text) == [] for text in _texts(50, seed=2))
+
+
+def test_index_changes_survive_a_reload(tmp_path):
+    texts = _texts(3)
+    index = MinHashIndex(str(tmp_path / "index"), lambda: [])
+    index.add_notes([Note(id=f"2024010100000000000{i}", title="", content=text) for i, text in enumerate(texts)])
+    index.add_note(Note(id="20240101000000000009", title="", content=texts[0]))
+    index.remove_note("20240101000000000001")
+
+    # The new entries are only in the journal, which a fresh instance replays
+    reloaded = MinHashIndex(str(tmp_path / "index"), lambda: [])
+    assert reloaded.similar("20240101000000000000") == [("20240101000000000009", 1.0)]
+    assert reloaded.find(texts[1]) == []
+
+
+def test_save_note_checked_reports_near_duplicates(brain):
+    text = _texts(1)[0]
+
+    async def run():
+        original = await brain.save_note("Plan", text)
+        _, unrelated = await brain.save_note_checked("Other", _texts(1, seed=3)[0])
+        copy, duplicates = await brain.save_note_checked("Plan again", text + " word1")
+        return original, copy, unrelated, duplicates
+
+    original, copy, unrelated, duplicates = asyncio.run(run())
+    assert unrelated == []
+    assert [(note.id, score >= 0.8) for note, score in duplicates] == [(original.id, True)]
+    assert copy.id != original.id
+
+
+def test_merging_notes_keeps_both_documents_and_removes_the_source(brain):
+    def document(blob: str) -> dict:
+        return {"document": {"blob": blob * 64, "file_name": f"{blob}.txt", "text": None}}
+
+    async def run():
+        target = await brain.save_note("Roses", "Prune in March.", ["garden"], {"source": "telegram", **document("a")})
+        source = await brain.save_note("Roses 2", "Feed in May.", ["roses"], document("b"))
+        merged = await brain.merge_notes(source.id, target.id)
+        found, _ = await brain.find_notes("feed", mode="keyword")
+        return source, target, merged, await brain.get_note(source.id), found
+
+    source, target, merged, gone, found = asyncio.run(run())
+    assert gone is None
+    assert merged.id == target.id
+    assert "Prune in March." in merged.content and "Feed in May." in merged.content
+    assert merged.tags == ["garden", "roses"]
+    assert merged.metadata["document"]["blob"] == "a" * 64
+    assert [doc["blob"] for doc in merged.metadata["merged_documents"]] == ["b" * 64]
+    assert merged.metadata["source"] == "telegram"
+    assert [note.id for note in found] == [target.id]
@@ -0,0 +1,88 @@
+import asyncio
+import os
+
+import pytest
+
+from app.api.models import Document, Note
+from app.services import documents
+from app.services.blob_store import BlobStore
+from app.services.documents import DocumentError, ingest_document, read_text
+
+
+class FakeFileClient:
+    """Serves getFile and the file download for one file, in small chunks"""
+
+    def __init__(self, data: bytes, chunk_size: int = 7):
+        self.data = data
+        self.chunk_size = chunk_size
+        self.downloads = 0
+
+    async def get_file(self, file_id: str) -> dict:
+        return {"file_id": file_id, "file_path": f"documents/{file_id}.txt"}
+
+    async def download_file(self, file_path: str):
+        self.downloads += 1
+        for start in range(0, len(self.data), self.chunk_size):
+            yield self.data[start:start + self.chunk_size]
+
+
+def _document(file_id: str = "file-1", size: int = None) -> Document:
+    return Document(file_id=file_id, file_unique_id=file_id, file_name="notes.txt", mime_type="text/plain",
+                    file_size=size)
+
+
+def test_ingested_document_is_streamed_into_the_blob_store(brain, tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"))
+    client = FakeFileClient(b"Garden plans\n\nPlant tomatoes in May. #garden")
+
+    note, created = asyncio.run(ingest_document(_document(), caption="#garden", client=client, store=store,
+                                                brain=brain))
+    assert created
+    assert note.tags == ["garden"]
+    blob = note.metadata["document"]["blob"]
+    assert store.read(blob) == client.data
+    assert store.links(blob) == [note.id]
+    assert read_text(note, store=store) == client.data.decode()
+
+    # The same file sent again is stored once and maps to the note it already made
+    again, created = asyncio.run(ingest_document(_document("file-2"), client=client, store=store, brain=brain))
+    assert not created
+    assert again.id == note.id
+    assert store.links(blob) == [note.id]
+    assert client.downloads == 2
+
+
+def test_oversized_document_is_rejected_and_its_temporary_file_removed(brain, tmp_path, monkeypatch):
+    monkeypatch.setattr(documents, "DOCUMENT_MAX_BYTES", 16)
+    store = BlobStore(str(tmp_path / "blobs"))
+    client = FakeFileClient(b"x" * 64)
+
+    # Telegram reported no size, so the limit is only noticed while downloading
+    with pytest.raises(DocumentError):
+        asyncio.run(ingest_document(_document(), client=client, store=store, brain=brain))
+    assert os.listdir(store.tmp_dir) == []
+    assert sorted(os.listdir(store.root)) == ["tmp"]
+
+    # A declared size over the limit is refused before downloading
+    with pytest.raises(DocumentError):
+        asyncio.run(ingest_document(_document(size=64), client=client, store=store, brain=brain))
+    assert client.downloads == 1
+
+
+def test_read_text_returns_each_chunk_by_its_offsets(tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"))
+    data = "".join(f"line {i} é\n" for i in range(200)).encode("utf-8")
+    digest = store.put_bytes(data).digest
+
+    text, preview = documents.extract_text(store, digest, "text", preview_chars=20, chunk_bytes=256)
+    assert preview.startswith("line 0") and preview.endswith("…")
+    assert len(text["chunks"]) > 1
+    # Chunks cover the text blob back to back, and each decodes on its own
+    end = 0
+    for offset, length in text["chunks"]:
+        assert offset == end
+        end += length
+    note = Note(id="20240101000000000001", title="Lines", content=preview,
+                metadata={"document": {"blob": digest, "file_name": "lines.txt", "text": text}})
+    chunks = [read_text(note, i, store=store) for i in range(len(text["chunks"]))]
+    assert "".join(chunks) == read_text(note, store=store) == data.decode("utf-8")
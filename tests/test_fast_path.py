@@ -0,0 +1,52 @@
+import asyncio
+import json
+
+from app.agent.fast_path import FastPathClassifier
+from app.services.ai_service import get_ai_response
+
+NOTE_ID = "20240101_120000"
+
+
+def test_update_rule_leaves_tags_unset(tmp_path):
+    classifier = FastPathClassifier(str(tmp_path / "examples.jsonl"))
+    result = classifier.classify(f"update note {NOTE_ID} to new text")
+    assert result["intent"] == "update"
+    assert "tags" not in result
+
+
+def test_tag_rule_adds_to_existing_tags(brain, tmp_path):
+    classifier = FastPathClassifier(str(tmp_path / "examples.jsonl"))
+
+    async def run():
+        note = await brain.save_note("Ideas", "text", ["work"])
+        intent = classifier.classify(f"tag note {note.id} with ideas, #later")
+        await get_ai_response(intent, [{"role": "user", "content": "tag"}])
+        return await brain.get_note(note.id)
+
+    assert asyncio.run(run()).tags == ["work", "ideas", "later"]
+
+
+def test_examples_log_keeps_only_recent_examples(tmp_path):
+    path = tmp_path / "examples.jsonl"
+    classifier = FastPathClassifier(str(path), max_examples=10)
+    for i in range(35):
+        classifier._append_example(f"message {i}", "none")
+
+    lines = [json.loads(line)["text"] for line in path.read_text().splitlines()]
+    assert len(lines) <= 20
+    assert lines[-1] == "message 34"
+    assert [text for text, _ in classifier._read_examples()] == [f"message {i}" for i in range(25, 35)]
+
+
+def test_classifications_are_counted_by_outcome(tmp_path):
+    from app.services.metrics import FAST_PATH_CLASSIFICATIONS
+
+    def count(outcome):
+        return FAST_PATH_CLASSIFICATIONS.labels(outcome).value
+
+    classifier = FastPathClassifier(str(tmp_path / "examples.jsonl"))
+    before = count("rules"), count("llm")
+    classifier.classify(f"update note {NOTE_ID} to new text")
+    classifier.classify("what did I write about gardening last spring?")
+    assert (count("rules"), count("llm")) == (before[0] + 1, before[1] + 1)
+    assert 'fast_path_classifications_total{outcome="rules"}' in FAST_PATH_CLASSIFICATIONS.render()
@@ -0,0 +1,41 @@
+import os
+
+from app.utils import ids
+from app.utils.ids import NoteIdAllocator
+
+
+def test_ids_are_unique_and_increasing_within_one_millisecond(monkeypatch):
+    now = [1704110400.0005]
+    monkeypatch.setattr(ids.time, "time", lambda: now[0])
+    allocator = NoteIdAllocator()
+
+    # More ids than the per-millisecond sequence holds, then a clock step backwards
+    allocated = [allocator.next_id() for _ in range(1500)]
+    now[0] -= 5
+    allocated += [allocator.next_id() for _ in range(10)]
+
+    assert len(set(allocated)) == len(allocated)
+    assert allocated == sorted(allocated)
+    assert allocated[0].endswith(f"_000000_{allocated[0][-6:]}")
+    assert allocated[1000][16:22] == "001000"  # Moved on to the next millisecond
+
+
+def test_forked_child_gets_its_own_node_suffix():
+    allocator = NoteIdAllocator()
+    parent_id = allocator.next_id()
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.write(write_fd, allocator.next_id().encode())
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    child_id = os.read(read_fd, 100).decode()
+    os.close(read_fd)
+    os.waitpid(pid, 0)
+
+    assert child_id and child_id != parent_id
+    assert child_id[-6:] != parent_id[-6:]
+    assert allocator.next_id()[-6:] == parent_id[-6:]
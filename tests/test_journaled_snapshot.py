@@ -0,0 +1,62 @@
+import json
+import os
+
+from app.services.journaled_snapshot import JournaledSnapshot
+
+
+class Store:
+    """A minimal index, a dict persisted through a JournaledSnapshot"""
+
+    def __init__(self, index_dir: str, compact_threshold: int = 1000):
+        self.items = {}
+        self.files = JournaledSnapshot(index_dir, "store.json", "store.journal",
+                                       lambda f: json.dump(self.items, f), compact_threshold=compact_threshold)
+
+    def load(self) -> bool:
+        return self.files.load(self._read, self._apply)
+
+    def _read(self, f) -> bool:
+        self.items.update(json.load(f))
+        return True
+
+    def _apply(self, entry: dict):
+        self.items.pop(entry["id"], None)
+        if entry["op"] == "add":
+            self.items[entry["id"]] = entry["value"]
+
+    def set(self, key: str, value: int):
+        self.items[key] = value
+        self.files.append({"op": "add", "id": key, "value": value})
+
+
+def test_journal_is_replayed_over_the_snapshot_and_compacted(tmp_path):
+    store = Store(str(tmp_path))
+    assert not store.load()
+    store.files.save()
+    store.set("a", 1)
+    store.set("b", 2)
+    # A crash in the middle of an append leaves a partial line, which is skipped
+    with open(store.files.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"op": "add", "id": "c"')
+
+    reloaded = Store(str(tmp_path), compact_threshold=4)
+    assert reloaded.load()
+    assert reloaded.items == {"a": 1, "b": 2}
+    assert reloaded.files.journal_entries == 2
+
+    # Entries appended after the partial line are read back too
+    reloaded.set("c", 3)
+    fresh = Store(str(tmp_path))
+    assert fresh.load() and fresh.items == {"a": 1, "b": 2, "c": 3}
+    reloaded.set("d", 4)
+    assert not os.path.exists(reloaded.files.journal_path)
+    with open(reloaded.files.snapshot_path, encoding="utf-8") as f:
+        assert json.load(f) == {"a": 1, "b": 2, "c": 3, "d": 4}
+
+
+def test_read_only_files_are_never_written(tmp_path):
+    store = Store(str(tmp_path))
+    store.files.read_only = True
+    store.files.save()
+    store.set("a", 1)
+    assert os.listdir(tmp_path) == []
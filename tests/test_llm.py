@@ -0,0 +1,116 @@
+import asyncio
+
+from app.services import llm
+from app.services import llm_cache as llm_cache_module
+from app.services.llm_cache import DiskCache, LLMCache
+
+
+def test_collapsed_caller_takes_over_when_the_first_is_cancelled():
+    cache = LLMCache(max_entries=10, ttls={"intent": 60})
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def run():
+        first = asyncio.create_task(cache.get_or_call("intent", "key", factory))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(cache.get_or_call("intent", "key", factory))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second, first.cancelled()
+
+    assert asyncio.run(run()) == ("answer", True)
+    assert len(calls) == 2
+
+
+def test_least_recently_used_and_expired_entries_are_dropped(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache_module.time, "time", lambda: now[0])
+    cache = LLMCache(max_entries=2, ttls={"intent": 60, "small_talk": 10, "summary": 0})
+
+    async def fill():
+        await cache.put("intent", "a", "A")
+        await cache.put("intent", "b", "B")
+        cache.get("intent", "a")  # Now b is the least recently used
+        await cache.put("intent", "c", "C")
+        await cache.put("small_talk", "d", "D")
+        await cache.put("summary", "e", "E")  # A TTL of 0 turns caching off
+
+    asyncio.run(fill())
+    assert list(cache.entries) == ["c", "d"]
+    assert cache.counters["evictions"] == 2
+    assert cache.get("summary", "e") is None and cache.counters["summary_bypass"] == 1
+
+    now[0] += 11
+    assert cache.get("small_talk", "d") is None
+    assert cache.get("intent", "c") == "C"
+
+
+def test_disk_tier_answers_after_a_restart(tmp_path):
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        return "answer"
+
+    async def run(cache):
+        return await cache.get_or_call("intent", "key", factory)
+
+    first = LLMCache(max_entries=10, ttls={"intent": 60}, disk=DiskCache(str(tmp_path / "cache.db")))
+    assert asyncio.run(run(first)) == "answer"
+    restarted = LLMCache(max_entries=10, ttls={"intent": 60}, disk=DiskCache(str(tmp_path / "cache.db")))
+    assert asyncio.run(run(restarted)) == "answer"
+    assert len(calls) == 1
+    assert restarted.counters["intent_disk_hits"] == 1
+    assert restarted.get("intent", "key") == "answer"  # Promoted to memory
+
+
+def test_concurrent_misses_share_one_call():
+    cache = LLMCache(max_entries=10, ttls={"intent": 60})
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return ""
+
+    async def run():
+        # An empty answer is not cached, but callers waiting on it still get it
+        return await asyncio.gather(*(cache.get_or_call("intent", "key", factory, cache_if=bool) for _ in range(5)))
+
+    assert asyncio.run(run()) == [""] * 5
+    assert len(calls) == 1
+    assert cache.counters["intent_collapsed"] == 4
+    assert "key" not in cache.entries
+
+
+def _stream_of(*chunks):
+    async def acompletion(model=None, messages=None, stream=False, **params):
+        async def generate():
+            for text, finish_reason in chunks:
+                yield {"choices": [{"delta": {"content": text}, "finish_reason": finish_reason}]}
+        return generate()
+    return acompletion
+
+
+def test_only_completed_streams_are_cached(monkeypatch):
+    monkeypatch.setattr(llm, "llm_cache", LLMCache(max_entries=10, ttls={"small_talk": 60}))
+
+    def streamed(acompletion, message: str) -> str:
+        monkeypatch.setattr(llm, "_completion", acompletion)
+
+        async def run():
+            return "".join([text async for text in llm.stream_completion("small_talk", [{"role": "user", "content": message}])])
+        return asyncio.run(run())
+
+    assert streamed(_stream_of(("Hel", None), ("lo", "length")), "cut off") == "Hello"
+    assert streamed(_stream_of(("", "stop")), "empty") == ""
+    assert streamed(_stream_of(("Hi", None), (" there", "stop")), "complete") == "Hi there"
+    assert len(llm.llm_cache.entries) == 1
+
+    # Replayed from the cache, so the stream is not opened again
+    assert streamed(_stream_of(("changed", "stop")), "complete") == "Hi there"
+    assert streamed(_stream_of(("retried", "stop")), "cut off") == "retried"
@@ -0,0 +1,133 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services import llm_scheduler as scheduler_module
+from app.services.llm_scheduler import LLMScheduler, current_chat
+
+
+class RateLimitError(Exception):
+    """Named like the provider SDKs' rate-limit errors"""
+
+
+class FakeCompletion:
+    """Stands in for ``acompletion``: each model answers after ``latency`` or fails with the next queued error"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.errors = {}  # model -> exceptions to raise on its next calls
+        self.calls = []  # (model, label) in call order
+        self.cancelled = []
+
+    def call(self, label: str = ""):
+        async def acompletion(model: str) -> str:
+            self.calls.append((model, label))
+            errors = self.errors.get(model)
+            if errors:
+                raise errors.pop(0)
+            try:
+                await asyncio.sleep(self.latency() if callable(self.latency) else self.latency)
+            except asyncio.CancelledError:
+                self.cancelled.append((model, label))
+                raise
+            return f"{model}:{label}"
+        return acompletion
+
+
+def _scheduler(**kwargs) -> LLMScheduler:
+    options = {"model": "primary", "max_concurrency": 4, "deadlines": {}, "max_retries": 3, "hedge": "off",
+               "fallback_model": None, **kwargs}
+    return LLMScheduler(**options)
+
+
+def test_waiting_chats_are_served_in_turn():
+    scheduler = _scheduler(max_concurrency=1)
+    llm = FakeCompletion(latency=0.005)
+    active = []
+
+    async def call_for(chat_id: str, label: str):
+        current_chat.set(chat_id)
+        acompletion = llm.call(label)
+
+        async def tracked(model: str) -> str:
+            active.append(scheduler.active)
+            return await acompletion(model)
+        return await scheduler.run("intent", tracked)
+
+    async def run():
+        # Chat a queues six calls before chat b queues two
+        tasks = [asyncio.create_task(call_for("a", f"a{i}")) for i in range(1, 7)]
+        tasks += [asyncio.create_task(call_for("b", f"b{i}")) for i in range(1, 3)]
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert [label for _, label in llm.calls] == ["a1", "a2", "b1", "a3", "b2", "a4", "a5", "a6"]
+    assert max(active) == 1
+    assert scheduler.active == 0
+
+
+def test_call_past_its_deadline_times_out():
+    scheduler = _scheduler(deadlines={"intent": 0.05})
+    llm = FakeCompletion(latency=1.0)
+
+    async def run():
+        start = time.monotonic()
+        with pytest.raises(asyncio.TimeoutError):
+            await scheduler.run("intent", llm.call())
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) < 0.5
+    assert scheduler.counters["intent_deadline_exceeded"] == 1
+    assert llm.cancelled == [("primary", "")]
+    assert scheduler.active == 0
+
+
+def test_rate_limit_backs_off_then_failures_move_to_the_fallback(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "RATE_LIMIT_BACKOFF", 0.05)
+    scheduler = _scheduler(fallback_model="fallback")
+    llm = FakeCompletion()
+    llm.errors["primary"] = [RateLimitError("slow down"), RuntimeError("overloaded")]
+
+    async def run():
+        start = time.monotonic()
+        result = await scheduler.run("intent", llm.call())
+        return result, time.monotonic() - start
+
+    result, elapsed = asyncio.run(run())
+    assert result == "fallback:"
+    assert [model for model, _ in llm.calls] == ["primary", "primary", "fallback"]
+    assert elapsed >= 0.05 * 0.5  # The backoff is jittered down to half
+
+    # Once the primary fails most calls, new calls start on the fallback
+    llm.calls.clear()
+    llm.errors["primary"] = [RuntimeError("overloaded")] * 30
+
+    async def many():
+        for _ in range(25):
+            await scheduler.run("intent", llm.call())
+
+    asyncio.run(many())
+    assert llm.calls[-1][0] == "fallback" and llm.calls[-2][0] == "fallback"
+    assert scheduler.counters["routed_to_fallback"] > 0
+
+
+def test_slow_call_is_hedged_after_the_p95_and_the_loser_cancelled():
+    scheduler = _scheduler(hedge="duplicate")
+    for _ in range(20):
+        scheduler._stats("primary", "intent").record(0.01)
+    latencies = iter([1.0, 0.0])
+    llm = FakeCompletion(latency=lambda: next(latencies))
+
+    async def run():
+        start = time.monotonic()
+        result = await scheduler.run("intent", llm.call("x"))
+        await asyncio.sleep(0)
+        return result, time.monotonic() - start
+
+    result, elapsed = asyncio.run(run())
+    assert result == "primary:x"
+    assert len(llm.calls) == 2
+    assert llm.cancelled == [("primary", "x")]  # The first attempt, still sleeping
+    assert 0.01 <= elapsed < 0.5
+    assert scheduler.active == 0
@@ -0,0 +1,61 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+
+from app.api import routes
+
+
+def _get(path: str, **params) -> httpx.Response:
+    app = FastAPI()
+    app.include_router(routes.router)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get(path, params=params)
+
+    return asyncio.run(run())
+
+
+def test_list_notes_rejects_unknown_search_mode():
+    response = _get("/notes", query="garden", mode="fuzzy")
+    assert response.status_code == 400
+    assert "Unknown search mode" in response.json()["detail"]
+
+
+def _document_note(brain, blob: str, text=None):
+    return asyncio.run(brain.save_note("Report", "Quarterly report, no text layer", metadata={
+        "document": {"blob": blob, "file_name": "report.pdf", "mime_type": "application/pdf", "text": text},
+    }))
+
+
+def test_document_without_extracted_text_streams_its_note_body(brain, monkeypatch):
+    monkeypatch.setattr(routes, "brain_service", brain)
+    note = _document_note(brain, "0" * 64)
+
+    response = _get(f"/notes/{note.id}/text")
+    assert response.status_code == 200
+    assert response.text == "Quarterly report, no text layer"
+
+
+def test_document_file_missing_from_the_blob_store_is_not_found(brain, monkeypatch):
+    monkeypatch.setattr(routes, "brain_service", brain)
+    note = _document_note(brain, "f" * 64)
+
+    response = _get(f"/notes/{note.id}/file")
+    assert response.status_code == 404
+    assert response.json()["detail"] == "File not found"
+
+
+def test_cache_counters_are_exported_as_metrics():
+    from app.services.llm_cache import LLMCache
+
+    cache = LLMCache(max_entries=1, ttls={"intent": 60})
+    cache.get("intent", "a")
+    asyncio.run(cache.put("intent", "a", "answer"))
+    asyncio.run(cache.put("intent", "b", "answer"))
+
+    metrics = _get("/metrics").text
+    assert 'llm_cache_events_total{call_type="intent",event="misses"}' in metrics
+    assert "llm_cache_evictions_total " in metrics
+    assert "# TYPE conversation_events_total counter" in metrics
@@ -0,0 +1,64 @@
+import os
+
+from app.api.models import Note
+from app.services.search_index import SearchIndex
+
+
+def _note(number: int, title: str, content: str) -> Note:
+    return Note(id=f"2024010100000000{number:04d}", title=title, content=content)
+
+
+def _ids(results) -> list:
+    return [note_id[-2:] for note_id, _ in results]
+
+
+def test_bm25_ranks_by_term_frequency_rarity_and_length(tmp_path):
+    notes = [
+        _note(1, "Garden", "tomatoes and basil"),
+        _note(2, "Shopping", "tomatoes tomatoes tomatoes"),
+        _note(3, "Long note", "tomatoes " + "filler " * 200),
+        _note(4, "Recipes", "basil pesto"),
+        _note(5, "Other", "nothing relevant here"),
+    ]
+    index = SearchIndex(str(tmp_path), lambda: notes)
+
+    assert _ids(index.search("tomatoes")) == ["02", "01", "03"]
+    # Title terms count double
+    assert _ids(index.search("garden")) == ["01"]
+    # A note matching both terms outranks those matching one; stopwords are ignored
+    assert _ids(index.search("the tomatoes and basil"))[0] == "01"
+    assert index.search("the and") == []
+    assert len(index.search("tomatoes", limit=2)) == 2
+
+
+def test_changes_survive_a_crash_through_the_journal(tmp_path):
+    index = SearchIndex(str(tmp_path), lambda: [_note(1, "Garden", "tomatoes")])
+    index.search("anything")  # Builds and saves the snapshot
+    index.add_note(_note(2, "Kitchen", "tomatoes soup"))
+    index.add_note(_note(1, "Garden", "roses"))
+    index.remove_note("20240101000000000002")
+    index.add_notes([_note(3, "Cellar", "potatoes")])
+    # The process dies mid-append, leaving a partial line after the complete entries
+    with open(index.files.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"op": "add", "id": "20240101000000000004", "ter')
+
+    # Nothing was rebuilt from notes: the loader would have found none
+    reopened = SearchIndex(str(tmp_path), lambda: [])
+    assert reopened.search("tomatoes") == []
+    assert _ids(reopened.search("roses")) == ["01"]
+    assert _ids(reopened.search("potatoes")) == ["03"]
+
+
+def test_journal_is_compacted_into_the_snapshot(tmp_path):
+    index = SearchIndex(str(tmp_path), lambda: [])
+    index.files.compact_threshold = 5
+    for number in range(1, 5):
+        index.add_note(_note(number, "Note", f"word{number}"))
+    assert os.path.exists(index.files.journal_path)
+
+    index.add_note(_note(5, "Note", "word5"))
+    assert not os.path.exists(index.files.journal_path)
+    assert index.files.journal_entries == 0
+
+    reopened = SearchIndex(str(tmp_path), lambda: [])
+    assert all(_ids(reopened.search(f"word{number}")) == [f"0{number}"] for number in range(1, 6))
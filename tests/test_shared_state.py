@@ -0,0 +1,93 @@
+import asyncio
+
+from app.api.models import TelegramUpdate
+from app.services.conversation import ConversationSpill, ConversationState
+from app.services.update_queue import SharedUpdateDeduplicator, UpdateDispatcher
+
+
+def test_shared_conversations_are_stored_from_threads(tmp_path):
+    db_path = str(tmp_path / "conversations.db")
+    first = ConversationState(spill=ConversationSpill(db_path), shared=True)
+    second = ConversationState(spill=ConversationSpill(db_path), shared=True)
+
+    async def run():
+        await asyncio.gather(*(first.add_message_async(chat, "user", f"hello {chat}") for chat in range(5)))
+        await second.add_message_async(3, "assistant", "hi")
+        return [await first.get_conversation_history_async(chat) for chat in range(5)]
+
+    histories = asyncio.run(run())
+    assert [[m["content"] for m in history] for history in histories] == [
+        ["hello 0"], ["hello 1"], ["hello 2"], ["hello 3", "hi"], ["hello 4"]
+    ]
+
+
+def test_dispatcher_deduplicates_through_shared_store(tmp_path):
+    handled = []
+
+    async def handler(update):
+        handled.append(update.update_id)
+
+    update = TelegramUpdate.model_validate({"update_id": 7})
+
+    async def run():
+        dispatcher = UpdateDispatcher(handler, deduplicator=SharedUpdateDeduplicator(str(tmp_path / "dedup.db")))
+        statuses = [await dispatcher.submit(update, 1), await dispatcher.submit(update, 1)]
+        await dispatcher.stop()
+        return statuses
+
+    assert asyncio.run(run()) == ["queued", "duplicate"]
+    assert handled == [7]
+
+
+
+def test_worker_taking_over_writes_the_index_files(tmp_path, monkeypatch):
+    from app.services import brain_service as module
+    from app.services.brain_service import BrainService
+    from app.services.search_index import SearchIndex
+
+    primary = {"claimed": False}
+
+    def is_primary_process(data_dir):
+        if primary["claimed"]:
+            return False
+        primary["claimed"] = True
+        return True
+
+    monkeypatch.setattr(module, "is_primary_process", is_primary_process)
+
+    async def run():
+        first = BrainService(data_dir=str(tmp_path))
+        await first.save_note("Before", "written by the first primary")
+        second = BrainService(data_dir=str(tmp_path))
+        await second.search_notes("primary")  # Opens the indexes read-only
+        await first.save_note("Between", "saved just before the first primary exits")
+
+        primary["claimed"] = False  # The first primary exits
+        reclaimed = await second.reclaim_indexes()
+        await second.save_note("After", "written by the new primary")
+        return reclaimed, second.read_only
+
+    assert asyncio.run(run()) == (True, False)
+    # The index files hold every note, including those saved after the takeover
+    on_disk = SearchIndex(str(tmp_path / "index"), lambda: [])
+    assert len(on_disk.search("primary")) == 3
+
+
+def test_failed_shutdown_step_does_not_skip_the_rest(caplog):
+    from app.main import shutdown_step
+
+    stopped = []
+
+    async def fail():
+        raise RuntimeError("deleteWebhook failed")
+
+    async def stop():
+        stopped.append(True)
+
+    async def run():
+        await shutdown_step("deleteWebhook", fail)
+        await shutdown_step("update dispatcher", stop)
+
+    asyncio.run(run())
+    assert stopped == [True]
+    assert "Error during shutdown (deleteWebhook)" in caplog.text
@@ -0,0 +1,57 @@
+import pytest
+
+from app.api.models import Note
+from app.services.storage import JSON_MIGRATED, JsonFileStorage, SQLiteStorage, create_storage
+
+
+def test_interrupted_json_migration_resumes(tmp_path):
+    legacy = JsonFileStorage(str(tmp_path / "notes"))
+    notes = [Note(id=f"2024010100000000000{i}", title=f"Note {i}", content="legacy") for i in range(5)]
+    legacy.put_many(notes)
+
+    # A first start that stopped after importing two notes, which have changed or gone since
+    partial = SQLiteStorage(str(tmp_path / "notes.db"))
+    partial.put_many(notes[:2])
+    partial.put(notes[0].model_copy(update={"content": "edited"}))
+    partial.delete(notes[1].id)
+    partial.close()
+
+    storage = create_storage("sqlite", str(tmp_path))
+    assert storage.get_meta(JSON_MIGRATED) is not None
+    assert storage.get(notes[0].id).content == "edited"
+    assert storage.get(notes[1].id) is None
+    assert [note.id for note in storage.get_many([note.id for note in notes[2:]])] == [note.id for note in notes[2:]]
+    storage.close()
+
+    # Once complete, the legacy directory is not read again
+    legacy.put(Note(id="20240101000000000009", title="Late", content="legacy"))
+    storage = create_storage("sqlite", str(tmp_path))
+    assert storage.get("20240101000000000009") is None
+    storage.close()
+
+
+def test_replace_many_is_atomic(tmp_path, monkeypatch):
+    storage = SQLiteStorage(str(tmp_path / "notes.db"))
+    source = Note(id="20240101000000000001", title="Source", content="old")
+    target = Note(id="20240101000000000002", title="Target", content="old")
+    storage.put_many([source, target])
+    seq = storage.last_change_seq()
+
+    def fail(note_ids):
+        raise OSError("disk full")
+
+    # A failure deleting the source also undoes the write to the target
+    with monkeypatch.context() as patch:
+        patch.setattr(storage, "_remove", fail)
+        with pytest.raises(OSError):
+            storage.replace_many(put=[target.model_copy(update={"content": "merged"})], delete=[source.id])
+    assert storage.get(target.id).content == "old"
+    assert storage.last_change_seq() == seq
+
+    storage.replace_many(put=[target.model_copy(update={"content": "merged"})], delete=[source.id])
+    assert storage.get(target.id).content == "merged"
+    assert storage.get(source.id) is None
+    assert [(change.note_id, change.deleted) for change in storage.changes_since(seq)] == [
+        (target.id, False), (source.id, True)
+    ]
+    storage.close()
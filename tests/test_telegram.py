@@ -0,0 +1,220 @@
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+from app.services.telegram import MAX_MESSAGE_LENGTH, TelegramClient
+
+
+class FakeBotAPI:
+    """Bot API methods answered in-process through an httpx MockTransport"""
+
+    def __init__(self, delay=lambda: 0.0):
+        self.delay = delay
+        self.calls = []  # (method, payload)
+        self.responses = {}  # method -> responses to give before the default one
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        method = request.url.path.rsplit("/", 1)[-1]
+        payload = json.loads(request.content or b"{}")
+        self.calls.append((method, payload))
+        await asyncio.sleep(self.delay())
+        queued = self.responses.get(method)
+        if queued:
+            return queued.pop(0)
+        return httpx.Response(200, json={"ok": True, "result": {"message_id": len(self.calls)}})
+
+    def sent(self, chat_id=None) -> list:
+        return [p["text"] for m, p in self.calls if m == "sendMessage" and chat_id in (None, p["chat_id"])]
+
+
+def _client(api: FakeBotAPI, **kwargs) -> TelegramClient:
+    options = {"global_rate": 1000, "chat_rate": 1000, "chat_burst": 1000, **kwargs}
+    return TelegramClient(base_url="http://telegram.test/bottest", transport=api.transport(), **options)
+
+
+def test_sends_share_one_pooled_client():
+    api = FakeBotAPI()
+    client = _client(api)
+
+    async def run():
+        await client.start()
+        pool = client._client
+        await client.send_message(1, "one")
+        await client.send_message(2, "two")
+        same = client._client is pool
+        await client.stop()
+        return same
+
+    assert asyncio.run(run())
+    assert api.sent() == ["one", "two"]
+
+
+def test_rate_limited_call_is_retried_after_retry_after():
+    api = FakeBotAPI()
+    api.responses["sendMessage"] = [
+        httpx.Response(429, json={"ok": False, "error_code": 429, "parameters": {"retry_after": 0.05}})
+    ]
+    client = _client(api)
+
+    async def run():
+        start = time.monotonic()
+        result = await client.send_message(1, "hello")
+        await client.stop()
+        return result, time.monotonic() - start
+
+    result, elapsed = asyncio.run(run())
+    assert result["ok"]
+    assert api.sent() == ["hello", "hello"]
+    assert elapsed >= 0.05
+
+
+def test_long_text_is_split_and_sent_in_order():
+    api = FakeBotAPI(delay=lambda: random.uniform(0, 0.005))
+    client = _client(api)
+    paragraphs = [f"Paragraph {i}: " + "word " * 300 for i in range(12)]
+    text = "\n".join(paragraphs)
+
+    async def run():
+        await client.send_message(1, text)
+        await client.stop()
+
+    asyncio.run(run())
+    sent = api.sent()
+    assert len(sent) > 1
+    assert all(len(chunk) <= MAX_MESSAGE_LENGTH for chunk in sent)
+    assert "".join(sent).replace("\n", "").replace(" ", "") == text.replace("\n", "").replace(" ", "")
+
+
+def test_messages_to_one_chat_keep_their_order():
+    rng = random.Random(0)
+    api = FakeBotAPI(delay=lambda: rng.uniform(0, 0.01))
+    client = _client(api)
+
+    async def run():
+        # Sent concurrently, with responses arriving out of order across chats
+        await asyncio.gather(*(client.send_message(i % 2, f"{i % 2}:{i}") for i in range(20)))
+        await client.stop()
+
+    asyncio.run(run())
+    assert api.sent(0) == [f"0:{i}" for i in range(0, 20, 2)]
+    assert api.sent(1) == [f"1:{i}" for i in range(1, 20, 2)]
+
+
+def test_chat_bucket_throttles_one_chat_but_not_others():
+    api = FakeBotAPI()
+    client = _client(api, chat_rate=20, chat_burst=1)
+
+    async def timed_send(chat_id: int, count: int) -> float:
+        start = time.monotonic()
+        await asyncio.gather(*(client.send_message(chat_id, f"{chat_id}:{i}") for i in range(count)))
+        return time.monotonic() - start
+
+    async def run():
+        busy, quiet = await asyncio.gather(timed_send(1, 5), timed_send(2, 1))
+        await client.stop()
+        return busy, quiet
+
+    busy, quiet = asyncio.run(run())
+    # After its burst, a chat gets one message per 1/chat_rate seconds
+    assert busy >= 4 / 20 * 0.9
+    assert quiet < 0.05
+
+
+def _update(update_id: int, chat_id: int = 1) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {"message_id": update_id, "chat": {"id": chat_id, "type": "private"}, "date": 0,
+                    "text": f"message {update_id}"},
+    }
+
+
+class FakeUpdates(FakeBotAPI):
+    """getUpdates over a growing list of updates, honouring the offset like Telegram does"""
+
+    def __init__(self):
+        super().__init__()
+        self.updates = []
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/getUpdates"):
+            payload = json.loads(request.content)
+            self.calls.append(("getUpdates", payload))
+            offset = payload.get("offset", 0)
+            # Confirming an offset forgets the updates before it
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+            batch = self.updates[:payload["limit"]]
+            if not batch:
+                await asyncio.sleep(0.01)  # Stands in for the long poll
+            return httpx.Response(200, json={"ok": True, "result": batch})
+        return await super().handle(request)
+
+
+def test_polling_offset_survives_a_restart(tmp_path):
+    from app.services.telegram import UpdatePoller
+
+    api = FakeUpdates()
+    api.updates = [_update(i) for i in range(100, 105)]
+    state_path = str(tmp_path / "offset.json")
+    received = []
+
+    async def submit(update):
+        received.append(update.update_id)
+
+    async def run():
+        client = _client(api)
+        poller = UpdatePoller(client, submit, state_path=state_path, timeout=0, limit=2)
+        assert [await poller.poll_once() for _ in range(3)] == [2, 2, 1]
+
+        # Telegram keeps the last batch until a poll confirms it; the restarted poller neither
+        # fetches it again nor skips the update that arrived meanwhile
+        api.updates.append(_update(105))
+        restarted = UpdatePoller(client, submit, state_path=state_path, timeout=0, limit=10)
+        restarted._load_offset()
+        assert restarted.offset == 105
+        await restarted.poll_once()
+        await client.stop()
+
+    asyncio.run(run())
+    assert received == [100, 101, 102, 103, 104, 105]
+
+
+def test_polled_updates_are_submitted_and_polling_stops_cleanly(tmp_path, monkeypatch):
+    from app.api import routes
+    from app.services.telegram import TelegramBotService
+
+    class Dispatcher:
+        submitted = []
+
+        async def submit(self, update, chat_id: int, wait: bool = False) -> str:
+            self.submitted.append((update.update_id, chat_id, wait))
+            return "queued"
+
+    monkeypatch.setattr(routes, "update_dispatcher", Dispatcher())
+    api = FakeUpdates()
+    api.updates = [_update(1, chat_id=7), _update(2, chat_id=8), _update(3, chat_id=7)]
+    client = _client(api)
+    service = TelegramBotService(client=client)
+
+    async def run():
+        # As the app does when it falls back to polling
+        await service.start_polling(lambda update: routes.submit_update(update, wait=True),
+                                    state_path=str(tmp_path / "offset.json"), timeout=0)
+        while len(Dispatcher.submitted) < 3:
+            await asyncio.sleep(0.01)
+        poll_task = service.poller._task
+        await service.stop_polling()
+        await client.stop()
+        return poll_task
+
+    poll_task = asyncio.run(run())
+    assert Dispatcher.submitted == [(1, 7, True), (2, 8, True), (3, 7, True)]
+    assert poll_task.cancelled()
+    assert not service.poller.running
+    with open(tmp_path / "offset.json", encoding="utf-8") as f:
+        assert json.load(f) == {"offset": 4}
@@ -0,0 +1,102 @@
+import asyncio
+import random
+
+from app.api.models import TelegramUpdate
+from app.services.update_queue import UpdateDeduplicator, UpdateDispatcher
+
+
+def _update(update_id: int, chat_id: int = 1) -> TelegramUpdate:
+    return TelegramUpdate.model_validate({
+        "update_id": update_id,
+        "message": {"message_id": update_id, "chat": {"id": chat_id, "type": "private"}, "date": 0, "text": "hi"},
+    })
+
+
+def _dispatcher(tmp_path, handler, **kwargs) -> UpdateDispatcher:
+    return UpdateDispatcher(handler, deduplicator=UpdateDeduplicator(str(tmp_path / "dedup.json")), **kwargs)
+
+
+def test_each_chat_is_processed_in_order_while_chats_run_in_parallel(tmp_path):
+    rng = random.Random(0)
+    handled = {}
+    running = [0, 0]  # Now, most at once
+
+    async def handler(update):
+        running[0] += 1
+        running[1] = max(running)
+        await asyncio.sleep(rng.uniform(0, 0.01))
+        handled.setdefault(update.message.chat.id, []).append(update.update_id)
+        running[0] -= 1
+
+    dispatcher = _dispatcher(tmp_path, handler, workers=4)
+
+    async def run():
+        for update_id in range(1, 41):
+            chat_id = update_id % 4
+            assert await dispatcher.submit(_update(update_id, chat_id), chat_id) == "queued"
+        await dispatcher.stop()
+
+    asyncio.run(run())
+    assert handled == {chat: list(range(chat or 4, 41, 4)) for chat in range(4)}
+    assert running[1] > 1
+
+
+def test_seen_and_old_update_ids_are_rejected_across_restarts(tmp_path):
+    path = str(tmp_path / "dedup.json")
+    dedup = UpdateDeduplicator(path, window=3)
+    assert all(dedup.check_and_add(update_id) for update_id in (1, 2, 3, 5, 6))
+    # 1 and 2 left the window, so everything up to 2 counts as seen
+    assert dedup.watermark == 2
+    assert not dedup.check_and_add(5)
+    assert not dedup.check_and_add(2)
+    dedup.flush()
+
+    reloaded = UpdateDeduplicator(path, window=3)
+    assert [reloaded.check_and_add(update_id) for update_id in (1, 3, 4, 6, 7)] == [False, False, True, False, True]
+
+
+def test_full_queue_sheds_updates_to_the_busy_handler(tmp_path):
+    busy = []
+
+    async def run():
+        gate = asyncio.Event()
+
+        async def handler(update):
+            await gate.wait()
+
+        async def busy_handler(update):
+            busy.append(update.update_id)
+
+        dispatcher = _dispatcher(tmp_path, handler, busy_handler=busy_handler, workers=1, max_pending=2)
+        statuses = [await dispatcher.submit(_update(update_id), 1) for update_id in (1, 2, 3)]
+        await asyncio.sleep(0)
+        gate.set()
+        await dispatcher.stop()
+        return statuses
+
+    assert asyncio.run(run()) == ["queued", "queued", "busy"]
+    assert busy == [3]
+
+
+def test_waiting_submit_blocks_until_there_is_room(tmp_path):
+    handled = []
+
+    async def run():
+        gate = asyncio.Event()
+
+        async def handler(update):
+            await gate.wait()
+            handled.append(update.update_id)
+
+        dispatcher = _dispatcher(tmp_path, handler, workers=1, max_pending=1)
+        assert await dispatcher.submit(_update(1), 1, wait=True) == "queued"
+        second = asyncio.create_task(dispatcher.submit(_update(2), 1, wait=True))
+        await asyncio.sleep(0.05)
+        blocked = not second.done()
+        gate.set()
+        status = await second
+        await dispatcher.stop()
+        return blocked, status
+
+    assert asyncio.run(run()) == (True, "queued")
+    assert handled == [1, 2]
@@ -0,0 +1,55 @@
+import asyncio
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from app.api import routes
+from app.api.models import Note
+from app.services.brain_service import BrainService
+from app.utils.ids import generate_note_id
+
+NOTES = 5000
+
+
+def test_webhook_latency_stays_flat_during_full_scan(tmp_path):
+    brain = BrainService(data_dir=str(tmp_path))
+    brain.storage.put_many(
+        Note(id=generate_note_id(), title=f"Note {i}", content=f"body of note {i} " * 20) for i in range(NOTES)
+    )
+    app = FastAPI()
+    app.include_router(routes.router)
+
+    async def ack(client: httpx.AsyncClient) -> float:
+        start = time.perf_counter()
+        # An update without a message is answered without LLM or Telegram calls,
+        # so its latency is the time the request waits for the event loop
+        response = await client.post("/webhook", json={"update_id": 1})
+        assert response.json() == {"status": "ok"}
+        return time.perf_counter() - start
+
+    async def full_scan() -> float:
+        start = time.perf_counter()
+        scanned = 0
+        async for _ in brain._scan_notes():
+            scanned += 1
+        assert scanned == NOTES
+        return time.perf_counter() - start
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            idle = [await ack(client) for _ in range(20)]
+            scan = asyncio.create_task(full_scan())
+            busy = []
+            while not scan.done():
+                busy.append(await ack(client))
+                await asyncio.sleep(0.005)
+            return idle, busy, await scan
+
+    idle, busy, scan_seconds = asyncio.run(run())
+    # The scan yields between chunks, so requests keep being answered while it runs...
+    assert len(busy) >= 5, f"only {len(busy)} webhooks answered during a {scan_seconds:.2f}s scan"
+    # ...and take about as long as on an idle loop, rather than waiting for the scan to finish
+    assert statistics.median(busy) < statistics.median(idle) + 0.05
+    assert max(busy) < min(0.25, scan_seconds / 2)